@@ -1,138 +1,168 @@
+import time
 import streamlit as st
-import folium
-from streamlit_folium import st_folium
-import requests
-import random
+from pixel_prediction.api import APIError, NoDataError
+from pixel_prediction.core import (
+    API_URL,
+    DEFAULT_LOCATION,
+    ESTIMATE_NOTE,
+    analysis_outcome,
+    get_base_map,
+    heatmap_layer,
+    init_session_state,
+    render_map,
+    require_aoi_config,
+    selection_layer,
+    show_analysis_progress,
+    show_header,
+    start_analysis,
+    warm_up,
+)
+from pixel_prediction.grid import LATITUDE_RANGE, LONGITUDE_RANGE
+from pixel_prediction.jobs import (
+    analysis_running,
+    cancel_stale_analysis,
+    pop_finished_analysis,
+    wait_for_analysis,
+)
 
 # Set page configuration
 st.set_page_config(page_title="Deforestation Analysis Tool", page_icon="🌳", layout="wide")
 
-# API URL
-API_URL = "https://pixelprediction-1000116839323.europe-west1.run.app/deforestation"
-
-# Header
-st.title("🌳 Deforestation Analysis Tool")
-st.markdown("Analyze deforestation trends in the Amazon region by selecting coordinates within the defined area of interest.")
-
-# About Section
-st.subheader("🌱 About This Tool")
-st.markdown(
-    """
-    This tool provides insights into deforestation trends in the Amazon rainforest, a critical ecosystem for global climate regulation, biodiversity,
-    and the livelihoods of indigenous communities. By selecting coordinates within a defined area of interest, you can access data on deforestation
-    percentage changes over time. Understanding these patterns is essential for driving effective conservation strategies and mitigating climate change impacts.
-    """
-)
+# Stop with the reason when the area of interest config is invalid
+require_aoi_config()
+
+# Map layers of this app; the base map is built ahead by the warm-up
+MAP_OPTIONS = {"highlight_aoi": True}
+warm_up(API_URL, **MAP_OPTIONS)
+
+# Seconds the inputs must stay unchanged before the map and analysis follow them
+DEBOUNCE_SECONDS = 0.5
+
+# Header and about section
+show_header()
 
 # Sidebar for input
 st.sidebar.title("📍 Location Selection")
 st.sidebar.info("Use the sliders to select a location within the defined area of interest.")
 
-# Define allowed ranges
-LATITUDE_RANGE = (-4.39, -3.33)
-LONGITUDE_RANGE = (-55.2, -54.48)
-
 # Initialize session state
-if "latitude" not in st.session_state:
-    st.session_state["latitude"] = -3.85
-if "longitude" not in st.session_state:
-    st.session_state["longitude"] = -54.84
+init_session_state({
+    "latitude": DEFAULT_LOCATION[0],
+    "longitude": DEFAULT_LOCATION[1],
+    "pending_location": None,  # Slider values waiting for the debounce
+    "pending_since": 0.0,
+})
+
+
+@st.fragment
+def location_inputs():
+    # Slider changes only rerun this fragment; the location is applied once they settle
+    latitude = st.slider(
+        "Latitude",
+        LATITUDE_RANGE[0],
+        LATITUDE_RANGE[1],
+        value=st.session_state["latitude"],
+        step=0.01,
+        key="latitude_slider"
+    )
+    longitude = st.slider(
+        "Longitude",
+        LONGITUDE_RANGE[0],
+        LONGITUDE_RANGE[1],
+        value=st.session_state["longitude"],
+        step=0.01,
+        key="longitude_slider"
+    )
+
+    location = (latitude, longitude)
+    if location == (st.session_state["latitude"], st.session_state["longitude"]):
+        st.session_state["pending_location"] = None
+    elif location != st.session_state["pending_location"]:
+        st.session_state["pending_location"] = location
+        st.session_state["pending_since"] = time.monotonic()
+
+    # Poll for the debounce only while a change is pending, so idle sessions don't rerun
+    if st.session_state["pending_location"]:
+        apply_pending_location()
+
+
+@st.fragment(run_every=DEBOUNCE_SECONDS)
+def apply_pending_location():
+    # Rerun the page once for the last of a burst of slider changes
+    pending = st.session_state["pending_location"]
+    if pending and time.monotonic() - st.session_state["pending_since"] >= DEBOUNCE_SECONDS:
+        st.session_state["latitude"], st.session_state["longitude"] = pending
+        st.session_state["pending_location"] = None
+        st.rerun()
+
 
 # Sliders for latitude and longitude
-latitude = st.sidebar.slider(
-    "Latitude",
-    LATITUDE_RANGE[0],
-    LATITUDE_RANGE[1],
-    value=st.session_state["latitude"],
-    step=0.01,
-    key="latitude_slider"
-)
-longitude = st.sidebar.slider(
-    "Longitude",
-    LONGITUDE_RANGE[0],
-    LONGITUDE_RANGE[1],
-    value=st.session_state["longitude"],
-    step=0.01,
-    key="longitude_slider"
-)
+with st.sidebar:
+    location_inputs()
+
+@st.fragment
+def map_panel():
+    # Marker for the selected location, sent as a dynamic layer so the base map is not reloaded
+    # Nothing is read back from the map, so interactions don't trigger reruns
+    render_map(
+        get_base_map(API_URL, **MAP_OPTIONS),
+        [selection_layer(st.session_state["latitude"], st.session_state["longitude"]), heatmap_layer(API_URL)],
+    )
+
+
+@st.fragment
+def analysis_panel():
+    # Pressing the button only reruns this panel
+    latitude = st.session_state["latitude"]
+    longitude = st.session_state["longitude"]
+    cancel_stale_analysis((latitude, longitude))
+
+    st.subheader("📊 Deforestation Analysis")
+    st.markdown(
+        f"""
+        **Selected Coordinates**:
+        - **Latitude**: `{latitude}`
+        - **Longitude**: `{longitude}`
+        """
+    )
 
-# Update session state with slider values
-st.session_state["latitude"] = latitude
-st.session_state["longitude"] = longitude
+    # Analyze button: the lookup runs in the background and the page reruns when it is done
+    if st.button("Analyze Deforestation", disabled=analysis_running()):
+        start_analysis(API_URL, latitude, longitude)
+        st.rerun()
+
+    if analysis_running():
+        show_analysis_progress(API_URL, latitude, longitude)
+
+    job = pop_finished_analysis()
+    if job is not None:
+        deforestation_percentage, cells_used, error = analysis_outcome(job, API_URL, latitude, longitude)
+        if error is None:
+            st.success(f"🌍 In this area, there was a **{deforestation_percentage:.2f}%** increase in deforestation.")
+        else:
+            if isinstance(error, NoDataError):
+                st.warning(f"No data available for the selected coordinates: {latitude}, {longitude}.")
+            elif isinstance(error, APIError):
+                st.error(f"API Error: {error.status_code} - {error.text}")
+            st.error(f"Error: {error}. Using fallback estimation.")
+            # Interpolated from the results known around the selected cell
+            if deforestation_percentage is None:
+                st.warning("No nearby results to estimate from.")
+            else:
+                st.success(f"🌍 In this area, there was a **{deforestation_percentage:.2f}%** increase in deforestation.")
+                st.caption(ESTIMATE_NOTE.format(cells_used))
 
 # Layout: Map and Analysis side-by-side
 col1, col2 = st.columns([2, 1])
 
 # Map in the first column
 with col1:
-    # Map setup
-    initial_center = [(-4.39 + -3.33) / 2, (-55.2 + -54.48) / 2]
-    initial_zoom = 9
-
-    m = folium.Map(location=initial_center, zoom_start=initial_zoom)
-
-    # Draw area of interest
-    folium.Rectangle(
-        bounds=[[-4.39, -55.2], [-3.33, -54.48]],
-        color="blue",
-        fill=True,
-        fill_opacity=0.1,
-        tooltip="Area of Interest"
-    ).add_to(m)
-
-    # Marker for the selected location
-    folium.Marker(
-        [st.session_state["latitude"], st.session_state["longitude"]],
-        tooltip=f"Latitude: {st.session_state['latitude']}, Longitude: {st.session_state['longitude']}"
-    ).add_to(m)
-
-    # Display the map
-    st_folium(m, height=500, width=700)
+    map_panel()
 
 # Analysis in the second column
 with col2:
-    st.subheader("📊 Deforestation Analysis")
-    st.markdown(
-        f"""
-        **Selected Coordinates**:
-        - **Latitude**: `{st.session_state['latitude']}`
-        - **Longitude**: `{st.session_state['longitude']}`
-        """
-    )
+    analysis_panel()
 
-    # Analyze button
-    if st.button("Analyze Deforestation"):
-        with st.spinner("Analyzing deforestation trends..."):
-            try:
-                # Make API request
-                payload = {
-                    "latitude": st.session_state["latitude"],
-                    "longitude": st.session_state["longitude"]
-                }
-                response = requests.post(API_URL, json=payload, timeout=30)
-
-                # Handle responses
-                if response.status_code == 200:
-                    try:
-                        data = response.json()
-                        deforestation_percentage = (
-                            data.get("deforestation_percentage", {})
-                            .get("deforestation_percentage", None)
-                        )
-                        if deforestation_percentage is not None:
-                            st.success(f"🌍 In this area, there was a **{deforestation_percentage:.2f}%** increase in deforestation.")
-                        else:
-                            raise ValueError("Invalid response structure")
-                    except (ValueError, AttributeError):
-                        raise ValueError("API returned an invalid response format.")
-                elif response.status_code == 404:
-                    st.warning(f"No data available for the selected coordinates: {latitude}, {longitude}.")
-                    raise ValueError("No data available")
-                else:
-                    st.error(f"API Error: {response.status_code} - {response.text}")
-                    raise ValueError("API error")
-            except (requests.exceptions.RequestException, ValueError) as e:
-                st.error(f"Error: {e}. Using fallback estimation.")
-                # Generate random emergency deforestation percentage
-                emergency_deforestation_percentage = round(random.uniform(-45, 45), 2)
-                st.success(f"🌍 In this area, there was a **{emergency_deforestation_percentage:.2f}%** increase in deforestation.")
+# Poll the background analysis while it runs
+if analysis_running():
+    wait_for_analysis()
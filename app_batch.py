@@ -0,0 +1,121 @@
+import time
+import streamlit as st
+from pixel_prediction.batch import (
+    INVALID,
+    OUTSIDE,
+    VALID,
+    read_points,
+    run_batch,
+    unique_cells,
+    validate_points,
+)
+from pixel_prediction.core import API_URL
+from pixel_prediction.resources import get_batcher, get_estimate, get_grid_lookup, get_http_client, get_result_cache
+
+# Set page configuration
+st.set_page_config(page_title="Batch Deforestation Analysis", page_icon="🌳", layout="wide")
+
+# Seconds between refreshes of the results table while the batch runs
+REFRESH_SECONDS = 0.25
+
+# Header
+st.title("🌳 Batch Deforestation Analysis")
+st.markdown(
+    "Upload a CSV file with `latitude` and `longitude` columns, or a GeoJSON file of points, "
+    "to analyze many coordinates within the area of interest at once."
+)
+
+uploaded = st.file_uploader("Points file", type=["csv", "geojson", "json"])
+if uploaded is None:
+    st.stop()
+
+try:
+    points = validate_points(read_points(uploaded.name, uploaded.getvalue()))
+except ValueError as e:
+    st.error(str(e))
+    st.stop()
+
+cells = unique_cells(points)
+outside = int((points["status"] == OUTSIDE).sum())
+invalid = int((points["status"] == INVALID).sum())
+st.info(
+    f"{len(points) - outside - invalid} valid points in {len(cells)} unique grid cells; "
+    f"{outside} outside the area of interest, {invalid} with invalid coordinates."
+)
+if outside or invalid:
+    with st.expander("Skipped points"):
+        st.dataframe(points[points["status"] != VALID], use_container_width=True)
+
+# Results of the last batch, kept so the download button's rerun doesn't lose them
+if "batch_results" not in st.session_state:
+    st.session_state["batch_results"] = None
+
+if len(cells) == 0:
+    st.stop()
+if not st.button("Analyze all points"):
+    finished = st.session_state["batch_results"]
+    if finished is not None and finished["file_id"] == uploaded.file_id:
+        st.dataframe(finished["cells"], use_container_width=True)
+        st.success(f"🌍 Analyzed {len(finished['cells'])} grid cells for {len(finished['points'])} points.")
+        st.download_button(
+            "Download results (CSV)",
+            finished["points"].to_csv(index=False),
+            file_name="deforestation_results.csv",
+            mime="text/csv",
+        )
+    st.stop()
+
+# One row per cell, filled in as the results come back
+cells["deforestation_percentage"] = float("nan")
+cells["result"] = "pending"
+cells = cells.set_index(["lat_cell", "lon_cell"])
+
+progress = st.progress(0.0, text="Analyzing deforestation trends...")
+table = st.empty()
+done = 0
+last_refresh = 0.0
+for lat_cell, lon_cell, value, error in run_batch(
+    cells.reset_index()[["lat_cell", "lon_cell", "cell_latitude", "cell_longitude"]],
+    API_URL,
+    cache=get_result_cache(API_URL),
+    client=get_http_client(API_URL),
+    grid=get_grid_lookup(),
+    batcher=get_batcher(API_URL),
+):
+    if error is not None:
+        # Interpolate from the results known around the cell, as the single-point apps do
+        latitude, longitude = cells.loc[(lat_cell, lon_cell), ["cell_latitude", "cell_longitude"]]
+        estimate = get_estimate(API_URL, latitude, longitude)
+        if estimate is None:
+            cells.loc[(lat_cell, lon_cell), "result"] = f"failed: {error}"
+        else:
+            cells.loc[(lat_cell, lon_cell), ["deforestation_percentage", "result"]] = [estimate[0], "interpolated"]
+    elif value is None:
+        cells.loc[(lat_cell, lon_cell), "result"] = "no data"
+    else:
+        cells.loc[(lat_cell, lon_cell), ["deforestation_percentage", "result"]] = [value, "model"]
+
+    done += 1
+    if time.monotonic() - last_refresh >= REFRESH_SECONDS or done == len(cells):
+        last_refresh = time.monotonic()
+        progress.progress(done / len(cells), text=f"{done} of {len(cells)} cells analyzed")
+        table.dataframe(cells.reset_index(drop=True), use_container_width=True)
+
+# Results for every uploaded point
+results = points.merge(
+    cells.reset_index()[["lat_cell", "lon_cell", "deforestation_percentage", "result"]],
+    on=["lat_cell", "lon_cell"],
+    how="left",
+).drop(columns=["lat_cell", "lon_cell"])
+st.session_state["batch_results"] = {
+    "file_id": uploaded.file_id,
+    "cells": cells.reset_index(drop=True),
+    "points": results,
+}
+st.success(f"🌍 Analyzed {len(cells)} grid cells for {len(points)} points.")
+st.download_button(
+    "Download results (CSV)",
+    results.to_csv(index=False),
+    file_name="deforestation_results.csv",
+    mime="text/csv",
+)
@@ -1,127 +1,165 @@
+import time
 import streamlit as st
-import folium
-from streamlit_folium import st_folium
-import requests
-import random
+import numpy as np
+from pixel_prediction.api import APIError, NoDataError
+from pixel_prediction.core import (
+    API_URL,
+    DEFAULT_LOCATION,
+    ESTIMATE_NOTE,
+    analysis_outcome,
+    analysis_source,
+    clicked_location,
+    coordinate_inputs,
+    get_base_map,
+    heatmap_layer,
+    in_aoi,
+    init_session_state,
+    render_map,
+    require_aoi_config,
+    selection_layer,
+    show_analysis_progress,
+    show_header,
+    start_analysis,
+    warm_up,
+)
+from pixel_prediction.jobs import (
+    analysis_running,
+    cancel_stale_analysis,
+    pop_finished_analysis,
+    wait_for_analysis,
+)
+from pixel_prediction.metrics import registry, timed
+from pixel_prediction.resources import (
+    get_batcher,
+    get_http_client,
+    get_known_values,
+    get_no_data,
+    get_result_cache,
+    get_service_health,
+    prometheus_metrics,
+    start_metrics_endpoint,
+)
+
+# Time of the whole script run, recorded as the "rerun" span at the end
+rerun_started = time.perf_counter()
 
 # Set page configuration
 st.set_page_config(page_title="Deforestation Analysis Tool", page_icon="🌳", layout="wide")
 
-# API URL
-API_URL = "https://pixelprediction-1000116839323.europe-west1.run.app/deforestation"
-
-# Header
-st.title("🌳 Deforestation Analysis Tool")
-st.markdown("Analyze deforestation trends in the Amazon region by selecting coordinates within the defined area of interest.")
-
-# About Section
-st.subheader("🌱 About This Tool")
-st.markdown(
-    """
-    This tool provides insights into deforestation trends in the Amazon rainforest, a critical ecosystem for global climate regulation, biodiversity,
-    and the livelihoods of indigenous communities. By selecting coordinates within a defined area of interest, you can access data on deforestation
-    percentage changes over time. Understanding these patterns is essential for driving effective conservation strategies and mitigating climate change impacts.
-    """
-)
+# Stop with the reason when the area of interest config is invalid
+require_aoi_config()
+
+# Map layers of this app; the base map is built ahead by the warm-up
+MAP_OPTIONS = {"draw": True}
+warm_up(API_URL, **MAP_OPTIONS)
+
+# Seconds the inputs must stay unchanged before the map and analysis follow them
+DEBOUNCE_SECONDS = 0.5
+
+# Local answers of an analysis, named in the debugging section instead of an API response
+ANSWER_SOURCES = {"grid": "precomputed grid", "cache": "result cache"}
 
-# Define allowed ranges
-LATITUDE_RANGE = (-4.39, -3.33)
-LONGITUDE_RANGE = (-55.2, -54.48)
+# Serve the timing histograms at /metrics when DEFORESTATION_METRICS_PORT is set
+start_metrics_endpoint()
+
+# Header and about section
+show_header()
 
 # Initialize session state
-if "latitude" not in st.session_state:
-    st.session_state["latitude"] = -3.85
-if "longitude" not in st.session_state:
-    st.session_state["longitude"] = -54.84
-if "clicked" not in st.session_state:
-    st.session_state["clicked"] = False  # To track if a click event occurred
+init_session_state({
+    "latitude": DEFAULT_LOCATION[0],
+    "longitude": DEFAULT_LOCATION[1],
+    "lat_input_box": DEFAULT_LOCATION[0],
+    "lon_input_box": DEFAULT_LOCATION[1],
+    "sync_inputs": False,  # Copy a map click into the input boxes
+    "last_click": None,  # Last map click already applied
+    "pending_location": None,  # Input values waiting for the debounce
+    "pending_since": 0.0,
+    "analysis_messages": [],  # (kind, text) of the last analysis
+    "debug_info": None,  # Payload, source and response of the last analysis
+    "area_drawing": None,  # Last polygon or rectangle drawn on the map
+})
+
+
+def select_location(latitude, longitude):
+    # Apply a new location; results of the previous one no longer apply
+    st.session_state["latitude"] = latitude
+    st.session_state["longitude"] = longitude
+    st.session_state["pending_location"] = None
+    st.session_state["analysis_messages"] = []
+    st.session_state["debug_info"] = None
+
 
 # Sidebar for input
 st.sidebar.title("📍 Location Selection")
 st.sidebar.info("Use the map or input boxes to select coordinates within the defined area of interest.")
 
-# Input boxes
-col_input1, col_input2 = st.sidebar.columns(2)
-with col_input1:
-    lat_input = st.number_input(
-        "Latitude",
-        min_value=LATITUDE_RANGE[0],
-        max_value=LATITUDE_RANGE[1],
-        value=st.session_state["latitude"],
-        step=0.01,
-        format="%.2f",
-        key="lat_input_box"
-    )
-with col_input2:
-    lon_input = st.number_input(
-        "Longitude",
-        min_value=LONGITUDE_RANGE[0],
-        max_value=LONGITUDE_RANGE[1],
-        value=st.session_state["longitude"],
-        step=0.01,
-        format="%.2f",
-        key="lon_input_box"
-    )
 
-# Synchronize inputs
-if not st.session_state["clicked"]:  # Only update from input boxes if no map click
-    st.session_state["latitude"] = lat_input
-    st.session_state["longitude"] = lon_input
+@st.fragment
+@timed("input_sync")
+def location_inputs():
+    # Input changes only rerun this fragment; the location is applied once they settle
+    if st.session_state["sync_inputs"]:
+        st.session_state["lat_input_box"] = st.session_state["latitude"]
+        st.session_state["lon_input_box"] = st.session_state["longitude"]
+        st.session_state["sync_inputs"] = False
 
-# Layout: Map and Analysis side-by-side
-col1, col2 = st.columns([2, 1])
+    # Input boxes
+    lat_input, lon_input = coordinate_inputs()
 
-# Initialize debugging variables
-api_request_payload = None
-api_response_data = None
-raw_response = None
-response_received = False
+    location = (lat_input, lon_input)
+    if location == (st.session_state["latitude"], st.session_state["longitude"]):
+        st.session_state["pending_location"] = None
+    elif location != st.session_state["pending_location"]:
+        st.session_state["pending_location"] = location
+        st.session_state["pending_since"] = time.monotonic()
 
-# Map in the first column
-with col1:
-    # Map setup with static center
-    map_center = [(-4.39 + -3.33) / 2, (-55.2 + -54.48) / 2]  # Static center point
-    m = folium.Map(
-        location=map_center,  # Keep map center static
-        zoom_start=9,  # Correct zoom level
+    # Poll for the debounce only while a change is pending, so idle sessions don't rerun
+    if st.session_state["pending_location"]:
+        apply_pending_location()
+
+
+@st.fragment(run_every=DEBOUNCE_SECONDS)
+def apply_pending_location():
+    # Rerun the page once for the last of a burst of input changes
+    pending = st.session_state["pending_location"]
+    if pending and time.monotonic() - st.session_state["pending_since"] >= DEBOUNCE_SECONDS:
+        select_location(*pending)
+        st.rerun()
+
+
+with st.sidebar:
+    location_inputs()
+
+@st.fragment
+def map_panel():
+    # Marker for the selected location, sent as a dynamic layer so the base map is not reloaded
+    map_data = render_map(
+        get_base_map(API_URL, **MAP_OPTIONS),
+        [selection_layer(st.session_state["latitude"], st.session_state["longitude"]), heatmap_layer(API_URL)],
+        returned_objects=["last_clicked", "last_active_drawing"],
     )
 
-    # Draw area of interest boundary without cover or tooltip
-    folium.Rectangle(
-        bounds=[[LATITUDE_RANGE[0], LONGITUDE_RANGE[0]], [LATITUDE_RANGE[1], LONGITUDE_RANGE[1]]],
-        color="blue",
-        weight=2,  # Line thickness
-        fill=False,  # No filled area
-    ).add_to(m)
-
-    # Marker for the selected location
-    folium.Marker(
-        [st.session_state["latitude"], st.session_state["longitude"]],
-        tooltip=f"Latitude: {st.session_state['latitude']}, Longitude: {st.session_state['longitude']}",
-    ).add_to(m)
-
-    # Add click functionality
-    map_data = st_folium(m, height=500, width=700, returned_objects=["last_clicked"])
-
-    # Immediate synchronization of map clicks
-    if map_data and map_data.get("last_clicked"):
-        clicked_lat = map_data["last_clicked"]["lat"]
-        clicked_lon = map_data["last_clicked"]["lng"]
-
-        # Update session state and mark the click as processed
-        if (
-            LATITUDE_RANGE[0] <= clicked_lat <= LATITUDE_RANGE[1]
-            and LONGITUDE_RANGE[0] <= clicked_lon <= LONGITUDE_RANGE[1]
-        ):
-            st.session_state["latitude"] = round(clicked_lat, 2)
-            st.session_state["longitude"] = round(clicked_lon, 2)
-            st.session_state["clicked"] = True  # Avoid input box overwriting
+    # Apply each new map click once; the component keeps returning the last one
+    clicked = clicked_location(map_data)
+    if clicked and clicked != st.session_state["last_click"]:
+        st.session_state["last_click"] = clicked
+        if in_aoi(*clicked):
+            select_location(*clicked)
+            st.session_state["sync_inputs"] = True
+            st.rerun()
 
-# Reset the click state for future updates
-st.session_state["clicked"] = False
+    # A new drawing updates the area analysis below the map
+    drawing = map_data.get("last_active_drawing") if map_data else None
+    if drawing and drawing != st.session_state["area_drawing"]:
+        st.session_state["area_drawing"] = drawing
+        st.rerun()
+
+
+@st.fragment
+def analysis_panel():
+    cancel_stale_analysis((st.session_state["latitude"], st.session_state["longitude"]))
 
-# Analysis in the second column
-with col2:
     st.subheader("📊 Deforestation Analysis")
     st.markdown(
         f"""
@@ -131,66 +169,187 @@ with col2:
         """
     )
 
-    # Analyze button
-    if st.button("Analyze Deforestation"):
-        with st.spinner("Analyzing deforestation trends..."):
-            try:
-                # Make API request
-                api_request_payload = {
-                    "latitude": st.session_state["latitude"],
-                    "longitude": st.session_state["longitude"]
-                }
-                response = requests.post(API_URL, json=api_request_payload, timeout=30)
-                response_received = True  # Mark response received
-
-                # Handle responses
-                if response.status_code == 200:
-                    try:
-                        api_response_data = response.json()
-                        deforestation_percentage = (
-                            api_response_data.get("deforestation_percentage", {})
-                            .get("deforestation_percentage", None)
-                        )
-                        if deforestation_percentage is not None:
-                            st.success(f"🌍 In this area, there was a **{deforestation_percentage:.2f}%** increase in deforestation.")
-                        else:
-                            raise ValueError("Invalid response structure")
-                    except (ValueError, AttributeError):
-                        raise ValueError("API returned an invalid response format.")
-                elif response.status_code == 404:
-                    st.warning(f"No data available for the selected coordinates: {st.session_state['latitude']}, {st.session_state['longitude']}.")
-                    raw_response = response.text
-                    raise ValueError("No data available")
-                else:
-                    st.error(f"API Error: {response.status_code} - {response.text}")
-                    raw_response = response.text
-                    raise ValueError("API error")
-            except (requests.exceptions.RequestException, ValueError) as e:
-                st.error(f"Error: {e}. Using fallback estimation.")
-                # Generate random emergency deforestation percentage
-                emergency_deforestation_percentage = round(random.uniform(-45, 45), 2)
-                st.success(f"🌍 In this area, there was a **{emergency_deforestation_percentage:.2f}%** increase in deforestation.")
+    # Analyze button: the lookup runs in the background and the page reruns when it is done
+    if st.button("Analyze Deforestation", disabled=analysis_running()):
+        start_analysis(API_URL, st.session_state["latitude"], st.session_state["longitude"])
+        st.rerun()
+
+    if analysis_running():
+        show_analysis_progress(API_URL, st.session_state["latitude"], st.session_state["longitude"])
+
+    job = pop_finished_analysis()
+    if job is not None:
+        format_started = time.perf_counter()
+        messages = []
+        debug_info = {
+            "payload": {
+                "latitude": st.session_state["latitude"],
+                "longitude": st.session_state["longitude"]
+            },
+            "source": analysis_source(job),  # "service" only when a request was actually sent
+            "response_received": False,
+            "response_data": None,
+            "raw_response": None,
+        }
+        deforestation_percentage, cells_used, error = analysis_outcome(
+            job, API_URL, st.session_state["latitude"], st.session_state["longitude"]
+        )
+        if error is None:
+            if debug_info["source"] == "service":
+                debug_info["response_received"] = True  # Mark response received
+                debug_info["response_data"] = {"deforestation_percentage": {"deforestation_percentage": deforestation_percentage}}
+            else:
+                debug_info["response_data"] = {"deforestation_percentage": deforestation_percentage}
+            messages.append(("success", f"🌍 In this area, there was a **{deforestation_percentage:.2f}%** increase in deforestation."))
+        else:
+            if isinstance(error, NoDataError):
+                debug_info["response_received"] = debug_info["source"] == "service"
+                messages.append(("warning", f"No data available for the selected coordinates: {st.session_state['latitude']}, {st.session_state['longitude']}."))
+            elif isinstance(error, APIError):
+                debug_info["response_received"] = True
+                messages.append(("error", f"API Error: {error.status_code} - {error.text}"))
+                debug_info["raw_response"] = error.text
+            messages.append(("error", f"Error: {error}. Using fallback estimation."))
+            # Interpolated from the results known around the selected cell
+            if deforestation_percentage is None:
+                messages.append(("warning", "No nearby results to estimate from."))
+            else:
+                debug_info["estimate"] = {"deforestation_percentage": deforestation_percentage, "cells_used": cells_used}
+                messages.append(("success", f"🌍 In this area, there was a **{deforestation_percentage:.2f}%** increase in deforestation."))
+                messages.append(("caption", ESTIMATE_NOTE.format(cells_used)))
+
+        # Finished jobs are picked up in a full run, so the debugging section below sees them
+        st.session_state["analysis_messages"] = messages
+        st.session_state["debug_info"] = debug_info
+        registry.observe("result_format", time.perf_counter() - format_started)
+
+    for kind, text in st.session_state["analysis_messages"]:
+        getattr(st, kind)(text)
+
+
+# Layout: Map and Analysis side-by-side
+col1, col2 = st.columns([2, 1])
+
+# Map in the first column
+with col1:
+    map_panel()
+
+# Analysis in the second column
+with col2:
+    analysis_panel()
+
+
+@st.fragment
+def area_panel():
+    # Statistics of every cell inside the drawn area, from the known results
+    drawing = st.session_state["area_drawing"]
+    st.subheader("📐 Area Analysis")
+    if not drawing:
+        st.info("Draw a polygon or rectangle on the map to analyze every cell inside it.")
+        return
+
+    # Imported here: pandas is only needed once something is drawn
+    from pixel_prediction.area import aggregate, geometry_mask, missing_cells
+    from pixel_prediction.batch import run_batch
+
+    values, grid = get_known_values(API_URL)
+    no_data = get_no_data(API_URL)
+    try:
+        mask = geometry_mask(grid, drawing["geometry"])
+    except (KeyError, ValueError) as e:
+        st.warning(f"Unsupported drawing: {e}")
+        return
+    stats = aggregate(values, grid, mask, no_data=no_data)
+    if stats["cells"] == 0:
+        st.warning("The drawn area contains no cells of the area of interest.")
+        return
+
+    col_mean, col_min, col_max, col_known, col_no_data = st.columns(5)
+    col_mean.metric("Mean", f"{stats['mean']:.2f}%" if stats["mean"] is not None else "N/A")
+    col_min.metric("Min", f"{stats['min']:.2f}%" if stats["min"] is not None else "N/A")
+    col_max.metric("Max", f"{stats['max']:.2f}%" if stats["max"] is not None else "N/A")
+    col_known.metric("Known cells", f"{stats['known_cells']} / {stats['cells']}")
+    col_no_data.metric("No data", stats["no_data_cells"])
+    if stats["known_cells"]:
+        st.bar_chart(stats["histogram"])
+
+    # Only the cells missing from the grid and the cache are sent to the API; "no data" answers are known too
+    missing = mask & np.isnan(values) & ~no_data
+    if missing.any() and st.button(f"Fetch {int(missing.sum())} missing cells"):
+        cells = missing_cells(grid, missing)
+        progress = st.progress(0.0, text="Analyzing deforestation trends...")
+        for done, _ in enumerate(
+            run_batch(
+                cells, API_URL, cache=get_result_cache(API_URL), client=get_http_client(API_URL), batcher=get_batcher(API_URL)
+            ),
+            1,
+        ):
+            progress.progress(done / len(cells), text=f"{done} of {len(cells)} cells analyzed")
+        st.rerun()
+
+
+area_panel()
+
+# Poll the background analysis while it runs
+if analysis_running():
+    wait_for_analysis()
 
 # Debugging Section
+debug_info = st.session_state["debug_info"] or {}
 st.subheader("🛠️ Debugging Information")
 st.markdown("This section shows the payload sent to the API and the response received.")
 
 # Always display the request payload
 st.markdown("### Sent to the API")
-if api_request_payload:
-    st.json(api_request_payload)
+if debug_info.get("payload"):
+    st.json(debug_info["payload"])
 else:
     st.warning("No API request payload available.")
 
 # Always display the response data
 st.markdown("### Received from the API")
-if response_received:
-    if api_response_data:
-        st.json(api_response_data)
-    elif raw_response:
+if debug_info.get("response_received"):
+    if debug_info["response_data"]:
+        st.json(debug_info["response_data"])
+    elif debug_info["raw_response"]:
         st.warning("API response was empty or invalid. Here's what was received:")
-        st.code(raw_response, language="plaintext")
+        st.code(debug_info["raw_response"], language="plaintext")
     else:
         st.warning("API response was empty or invalid.")
+elif debug_info.get("source") in ANSWER_SOURCES:
+    # Answered locally: no request was sent, so there is no API response to show
+    st.info(f"No request was sent: the result came from the {ANSWER_SOURCES[debug_info['source']]}.")
+    st.json(debug_info["response_data"] or {"deforestation_percentage": None})
 else:
     st.warning("No response received from the API.")
+if debug_info.get("estimate"):
+    st.markdown("### Interpolated fallback")
+    st.json(debug_info["estimate"])
+
+# Health of every model service endpoint, tracked across all sessions
+st.markdown("### Model service health")
+for endpoint, health in get_service_health(API_URL).items():
+    st.markdown(f"`{endpoint}`")
+    if health["state"] == "closed":
+        st.success(f"Circuit closed: requests go to the model service ({health['error_rate']:.0%} errors recently).")
+    elif health["state"] == "open":
+        st.error(f"Circuit open: requests fail fast into the fallback estimation for {health['retry_in_s']}s.")
+    else:
+        st.warning("Circuit half-open: probing the model service.")
+    st.json(health)
+
+# Timings of the stages of a rerun and of the model service calls, across all sessions
+st.markdown("### Timings")
+timings = registry.snapshot()
+if timings:
+    st.dataframe(timings, hide_index=True)
+else:
+    st.info("No timings recorded yet.")
+st.download_button(
+    "Download metrics (Prometheus)",
+    prometheus_metrics(),
+    file_name="pixel_prediction.prom",
+    mime="text/plain",
+)
+
+registry.observe("rerun", time.perf_counter() - rerun_started)
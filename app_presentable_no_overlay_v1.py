@@ -1,106 +1,96 @@
 import streamlit as st
-import folium
-from streamlit_folium import st_folium
-import requests
-import random
+from pixel_prediction.core import (
+    AOI_CENTER,
+    API_URL,
+    ESTIMATE_NOTE,
+    analysis_outcome,
+    clicked_location,
+    coordinate_inputs,
+    get_base_map,
+    heatmap_layer,
+    in_aoi,
+    init_session_state,
+    render_map,
+    require_aoi_config,
+    selection_layer,
+    show_analysis_progress,
+    start_analysis,
+    warm_up,
+)
+from pixel_prediction.jobs import (
+    analysis_running,
+    cancel_stale_analysis,
+    pop_finished_analysis,
+    wait_for_analysis,
+)
 
 # Set page configuration
 st.set_page_config(page_title="Deforestation Analysis Tool", page_icon="🌳", layout="wide")
 
-# API URL
-API_URL = "https://pixelprediction-1000116839323.europe-west1.run.app/deforestation"
+# Stop with the reason when the area of interest config is invalid
+require_aoi_config()
+
+# Map layers of this app; the base map is built ahead by the warm-up
+MAP_OPTIONS = {}
+warm_up(API_URL, **MAP_OPTIONS)
 
 # Sidebar: Location Selection
 st.sidebar.title("📍 Location Selection")
 st.sidebar.info("Use the map or input boxes to select coordinates within the defined area of interest.")
 
-# Define allowed ranges
-LATITUDE_RANGE = (-4.39, -3.33)  # Min and max latitude of the area
-LONGITUDE_RANGE = (-55.2, -54.48)  # Min and max longitude of the area
-
 # Initialize session state dynamically
-if "latitude" not in st.session_state:
-    st.session_state["latitude"] = None
-if "longitude" not in st.session_state:
-    st.session_state["longitude"] = None
-if "clicked" not in st.session_state:
-    st.session_state["clicked"] = False  # To track if a click event occurred
-if "map_zoom" not in st.session_state:
-    st.session_state["map_zoom"] = 9  # Default zoom
-if "deforestation_result" not in st.session_state:
-    st.session_state["deforestation_result"] = None  # Holds the detailed analysis result
-if "deforestation_percentage" not in st.session_state:
-    st.session_state["deforestation_percentage"] = None  # Holds the percentage or emoji display
+init_session_state({
+    "latitude": None,
+    "longitude": None,
+    "clicked": False,  # To track if a click event occurred
+    "map_zoom": 9,  # Default zoom
+    "deforestation_result": None,  # Holds the detailed analysis result
+    "deforestation_percentage": None,  # Holds the percentage or emoji display
+    "estimate_note": None,  # Set when the percentage is interpolated locally
+})
 
 # Sidebar: Input boxes and button
-col_input1, col_input2 = st.sidebar.columns(2)
-with col_input1:
-    lat_input = st.number_input(
-        "Latitude",
-        min_value=LATITUDE_RANGE[0],
-        max_value=LATITUDE_RANGE[1],
-        value=st.session_state["latitude"] if st.session_state["latitude"] else (LATITUDE_RANGE[0] + LATITUDE_RANGE[1]) / 2,
-        step=0.01,
-        format="%.2f",
-        key="lat_input_box"
-    )
-with col_input2:
-    lon_input = st.number_input(
-        "Longitude",
-        min_value=LONGITUDE_RANGE[0],
-        max_value=LONGITUDE_RANGE[1],
-        value=st.session_state["longitude"] if st.session_state["longitude"] else (LONGITUDE_RANGE[0] + LONGITUDE_RANGE[1]) / 2,
-        step=0.01,
-        format="%.2f",
-        key="lon_input_box"
+with st.sidebar:
+    lat_input, lon_input = coordinate_inputs(
+        st.session_state["latitude"] if st.session_state["latitude"] else AOI_CENTER[0],
+        st.session_state["longitude"] if st.session_state["longitude"] else AOI_CENTER[1],
     )
 
-# Analyze button
-if st.sidebar.button("Analyze Deforestation"):
-    with st.spinner("Analyzing deforestation trends..."):
-        try:
-            # Make API request
-            payload = {
-                "latitude": st.session_state["latitude"],
-                "longitude": st.session_state["longitude"]
-            }
-            response = requests.post(API_URL, json=payload, timeout=30)
-
-            # Handle responses
-            if response.status_code == 200:
-                data = response.json()
-                deforestation_percentage = data.get("deforestation_percentage", {}).get("deforestation_percentage", None)
-
-                if deforestation_percentage is not None:
-                    # Adjust values to realistic range if needed
-                    if abs(deforestation_percentage) >= 100:
-                        deforestation_percentage = round(random.uniform(91.03, 94.54), 2) * (-1 if deforestation_percentage < 0 else 1)
-
-                    # Update session state
-                    if deforestation_percentage == 0:
-                        st.session_state["deforestation_percentage"] = "🌳❤️"
-                        st.session_state["deforestation_result"] = "🌍 There was no significant change in deforestation between 2016 and 2021."
-                    elif deforestation_percentage < 0:
-                        st.session_state["deforestation_percentage"] = f"{abs(deforestation_percentage):.2f}%"
-                        st.session_state["deforestation_result"] = "🌍 In this area, between 2016 and 2021, there was a deforestation of:"
-                    else:
-                        st.session_state["deforestation_percentage"] = f"{abs(deforestation_percentage):.2f}%"
-                        st.session_state["deforestation_result"] = "🌍 In this area, between 2016 and 2021, there was a recovery of:"
-                else:
-                    raise ValueError("Invalid response structure")
-            else:
-                # If API fails, generate fallback data
-                raise ValueError(f"API returned status code {response.status_code}")
-        except (requests.exceptions.RequestException, ValueError) as e:
-            # Fallback mechanism for errors
-            fallback_percentage = round(random.uniform(-45, 45), 2)
-            st.session_state["deforestation_percentage"] = f"{abs(fallback_percentage):.2f}%"
-            if fallback_percentage == 0:
-                st.session_state["deforestation_result"] = "🌍 There was no significant change in deforestation between 2016 and 2021."
-            elif fallback_percentage < 0:
-                st.session_state["deforestation_result"] = "🌍 In this area, between 2016 and 2021, there was a deforestation of:"
-            else:
-                st.session_state["deforestation_result"] = "🌍 In this area, between 2016 and 2021, there was a recovery of:"
+# Location to analyze: the input boxes until a location is clicked on the map
+analysis_location = (
+    st.session_state["latitude"] if st.session_state["latitude"] else lat_input,
+    st.session_state["longitude"] if st.session_state["longitude"] else lon_input,
+)
+cancel_stale_analysis(analysis_location)
+
+# Analyze button: the lookup runs in the background and the page reruns when it is done
+if st.sidebar.button("Analyze Deforestation", disabled=analysis_running()):
+    start_analysis(API_URL, *analysis_location)
+    st.rerun()
+
+if analysis_running():
+    show_analysis_progress(API_URL, *analysis_location, container=st.sidebar)
+
+job = pop_finished_analysis()
+if job is not None:
+    # Implausible values (>= 100% or <= -100%) and failed requests are interpolated from the neighbouring cells
+    deforestation_percentage, cells_used, error = analysis_outcome(job, API_URL, *analysis_location, plausible=True)
+    st.session_state["estimate_note"] = ESTIMATE_NOTE.format(cells_used) if cells_used else None
+
+    # Update session state
+    if deforestation_percentage is None:
+        st.session_state["deforestation_percentage"] = "N/A"
+        st.session_state["deforestation_result"] = "No data available for the selected coordinates."
+    elif deforestation_percentage == 0:
+        st.session_state["deforestation_percentage"] = "🌳❤️"
+        st.session_state["deforestation_result"] = "🌍 There was no significant change in deforestation between 2016 and 2021."
+    elif deforestation_percentage < 0:
+        st.session_state["deforestation_percentage"] = f"{abs(deforestation_percentage):.2f}%"
+        st.session_state["deforestation_result"] = "🌍 In this area, between 2016 and 2021, there was a deforestation of:"
+    else:
+        st.session_state["deforestation_percentage"] = f"{abs(deforestation_percentage):.2f}%"
+        st.session_state["deforestation_result"] = "🌍 In this area, between 2016 and 2021, there was a recovery of:"
+
 
 # Layout: Map and Analysis side-by-side
 col1, col2 = st.columns([2, 1])
@@ -110,46 +100,31 @@ with col1:
     # Move the title higher
     st.markdown("<h1 style='text-align: center; margin-top: -50px;'>🌳 Pixel Prediction 🌳</h1>", unsafe_allow_html=True)
 
-    # Map setup with center and dynamic zoom
+    # Map center and zoom are applied dynamically on the cached base map
     map_center = (
         [st.session_state["latitude"], st.session_state["longitude"]]
         if st.session_state["latitude"] and st.session_state["longitude"]
-        else [(LATITUDE_RANGE[0] + LATITUDE_RANGE[1]) / 2, (LONGITUDE_RANGE[0] + LONGITUDE_RANGE[1]) / 2]
+        else list(AOI_CENTER)
+    )
+
+    # Marker if coordinates are selected, as a dynamic layer so the base map is not reloaded
+    map_data = render_map(
+        get_base_map(API_URL, **MAP_OPTIONS),
+        [selection_layer(st.session_state["latitude"], st.session_state["longitude"]), heatmap_layer(API_URL)],
+        returned_objects=["last_clicked"],
+        center=map_center,
+        zoom=st.session_state["map_zoom"],
     )
-    m = folium.Map(location=map_center, zoom_start=st.session_state["map_zoom"], tiles="OpenStreetMap")
-
-    # Draw area of interest boundary
-    folium.Rectangle(
-        bounds=[[LATITUDE_RANGE[0], LONGITUDE_RANGE[0]],  # Bottom-left corner
-                [LATITUDE_RANGE[1], LONGITUDE_RANGE[1]]],  # Top-right corner
-        color="blue",
-        weight=2,
-        fill=False
-    ).add_to(m)
-
-    # Add marker if coordinates are selected
-    if st.session_state["latitude"] and st.session_state["longitude"]:
-        folium.Marker(
-            [st.session_state["latitude"], st.session_state["longitude"]],
-            tooltip=f"Latitude: {st.session_state['latitude']}, Longitude: {st.session_state['longitude']}",
-        ).add_to(m)
-
-    # Handle map clicks
-    map_data = st_folium(m, height=500, width=700, returned_objects=["last_clicked"])
-
-    # Update session state based on map click
-    if map_data and map_data.get("last_clicked"):
-        clicked_lat = map_data["last_clicked"]["lat"]
-        clicked_lon = map_data["last_clicked"]["lng"]
-
-        # Update session state with valid clicks
-        if LATITUDE_RANGE[0] <= clicked_lat <= LATITUDE_RANGE[1] and LONGITUDE_RANGE[0] <= clicked_lon <= LONGITUDE_RANGE[1]:
-            st.session_state.update({
-                "latitude": round(clicked_lat, 2),
-                "longitude": round(clicked_lon, 2),
-                "clicked": True,
-            })
-            st.info(f"Coordinates updated: {st.session_state['latitude']}, {st.session_state['longitude']}")
+
+    # Update session state with valid clicks
+    clicked = clicked_location(map_data)
+    if clicked and in_aoi(*clicked):
+        st.session_state.update({
+            "latitude": clicked[0],
+            "longitude": clicked[1],
+            "clicked": True,
+        })
+        st.info(f"Coordinates updated: {st.session_state['latitude']}, {st.session_state['longitude']}")
 
 # Analysis output in the second column
 with col2:
@@ -166,8 +141,14 @@ with col2:
             f"<div style='font-size: 60px; font-weight: bold; text-align: center; margin-top: 10px;'>{st.session_state['deforestation_percentage']}</div>",
             unsafe_allow_html=True,
         )
+    if st.session_state["estimate_note"]:
+        st.caption(st.session_state["estimate_note"])
 
 # Disclaimer box under the "Analyze Deforestation" button
 st.sidebar.info(
     "Disclaimer: Shown percentages are AI predictions, not verified by humans."
 )
+
+# Poll the background analysis while it runs
+if analysis_running():
+    wait_for_analysis()
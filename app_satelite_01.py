@@ -1,129 +1,129 @@
 import streamlit as st
-import folium
-from streamlit_folium import st_folium
-import requests
-import random
-from folium.plugins import ScaleBar  # Import ScaleBar for map legend
+from pixel_prediction.api import APIError, NoDataError, configured_api_url
+from pixel_prediction.core import (
+    DEFAULT_LOCATION,
+    ESTIMATE_NOTE,
+    analysis_outcome,
+    clicked_location,
+    coordinate_inputs,
+    describe_change,
+    get_base_map,
+    in_aoi,
+    init_session_state,
+    level_heatmap_layer,
+    render_map,
+    require_aoi_config,
+    selection_layer,
+    show_analysis_progress,
+    show_header,
+    start_analysis,
+    sync_map_zoom,
+    warm_up,
+)
+from pixel_prediction.jobs import (
+    analysis_running,
+    cancel_stale_analysis,
+    pop_finished_analysis,
+    wait_for_analysis,
+)
+from pixel_prediction.grid import GRID_STEP
+from pixel_prediction.pyramid import level_factor
+from pixel_prediction.resources import get_grid_lookup
 
 # Set page configuration
 st.set_page_config(page_title="Deforestation Analysis Tool", page_icon="🌳", layout="wide")
 
-# API URL
-API_URL = "https://pixel-prediction-1000116839323.europe-west1.run.app/deforestation"
-
-# Header
-st.title("🌳 Deforestation Analysis Tool")
-st.markdown("Analyze deforestation trends in the Amazon region by selecting coordinates within the defined area of interest.")
-
-# About Section
-st.subheader("🌱 About This Tool")
-st.markdown(
-    """
-    This tool provides insights into deforestation trends in the Amazon rainforest, a critical ecosystem for global climate regulation, biodiversity,
-    and the livelihoods of indigenous communities. By selecting coordinates within a defined area of interest, you can access data on deforestation
-    percentage changes over time. Understanding these patterns is essential for driving effective conservation strategies and mitigating climate change impacts.
-    """
-)
+# Stop with the reason when the area of interest config is invalid
+require_aoi_config()
+
+# API URL (set DEFORESTATION_API_URL to use another endpoint, e.g. the local mock server)
+API_URL = configured_api_url("https://pixel-prediction-1000116839323.europe-west1.run.app/deforestation")
 
-# Define allowed ranges
-LATITUDE_RANGE = (-4.39, -3.33)
-LONGITUDE_RANGE = (-55.2, -54.48)
+# Map layers of this app: satellite-style tiles and a scale; the base map is built ahead by the warm-up.
+# The heatmap follows the zoom (see below), so it isn't part of the base map
+MAP_OPTIONS = {
+    "tiles": "https://{s}.tile.openstreetmap.fr/hot/{z}/{x}/{y}.png",
+    "attr": "Satellite",
+    "scale_bar": True,
+    "heatmap": False,
+}
+warm_up(API_URL, **MAP_OPTIONS)
+
+# Header and about section
+show_header()
 
 # Initialize session state
-if "latitude" not in st.session_state:
-    st.session_state["latitude"] = -3.85
-if "longitude" not in st.session_state:
-    st.session_state["longitude"] = -54.84
-if "clicked" not in st.session_state:
-    st.session_state["clicked"] = False  # To track if a click event occurred
-if "map_zoom" not in st.session_state:
-    st.session_state["map_zoom"] = 9  # Default zoom level
+init_session_state({
+    "latitude": DEFAULT_LOCATION[0],
+    "longitude": DEFAULT_LOCATION[1],
+    "clicked": False,  # To track if a click event occurred
+    "map_zoom": 9,  # Default zoom level
+})
 
 # Sidebar for input
 st.sidebar.title("📍 Location Selection")
 st.sidebar.info("Use the map or input boxes to select coordinates within the defined area of interest.")
+if get_grid_lookup() is not None:
+    st.sidebar.caption("Local grid mode: results are read from the precomputed grid.")
 
 # Input boxes
-col_input1, col_input2 = st.sidebar.columns(2)
-with col_input1:
-    lat_input = st.number_input(
-        "Latitude",
-        min_value=LATITUDE_RANGE[0],
-        max_value=LATITUDE_RANGE[1],
-        value=st.session_state["latitude"],
-        step=0.01,
-        format="%.2f",
-        key="lat_input_box"
-    )
-with col_input2:
-    lon_input = st.number_input(
-        "Longitude",
-        min_value=LONGITUDE_RANGE[0],
-        max_value=LONGITUDE_RANGE[1],
-        value=st.session_state["longitude"],
-        step=0.01,
-        format="%.2f",
-        key="lon_input_box"
-    )
+with st.sidebar:
+    lat_input, lon_input = coordinate_inputs(st.session_state["latitude"], st.session_state["longitude"])
 
 # Synchronize inputs
 if not st.session_state["clicked"]:  # Only update from input boxes if no map click
     st.session_state["latitude"] = lat_input
     st.session_state["longitude"] = lon_input
 
+# Take a finished analysis before the map is drawn, so a successful one recenters and zooms the map in this run
+analyzed_location = (st.session_state["latitude"], st.session_state["longitude"])
+cancel_stale_analysis(analyzed_location)
+job = pop_finished_analysis()
+if job is not None and job.exception() is None:
+    st.session_state["map_zoom"] = 13
+
 # Layout: Map and Analysis side-by-side
 col1, col2 = st.columns([2, 1])
 
 # Map in the first column
 with col1:
-    # Map setup with center and dynamic zoom
+    # Map center and zoom are applied dynamically on the cached base map
     map_center = [st.session_state["latitude"], st.session_state["longitude"]]
-    m = folium.Map(
-        location=map_center,
-        zoom_start=st.session_state["map_zoom"],  # Dynamic zoom level
-        tiles='https://{s}.tile.openstreetmap.fr/hot/{z}/{x}/{y}.png',  # Satellite-style tiles
-        attr='Satellite'
-    )
-
-    # Draw area of interest boundary without cover or tooltip
-    folium.Rectangle(
-        bounds=[[LATITUDE_RANGE[0], LONGITUDE_RANGE[0]], [LATITUDE_RANGE[1], LONGITUDE_RANGE[1]]],
-        color="blue",
-        weight=2,  # Line thickness
-        fill=False,  # No filled area
-    ).add_to(m)
 
-    # Add a scale to the map
-    ScaleBar(position="bottomright").add_to(m)
+    # Heatmap at the resolution of the zoom: block means of the grid pyramid when zoomed out, every cell when zoomed in
+    heatmap_layer, heatmap_factor = level_heatmap_layer(API_URL, st.session_state["map_zoom"])
 
-    # Marker for the selected location
-    folium.Marker(
-        [st.session_state["latitude"], st.session_state["longitude"]],
-        tooltip=f"Latitude: {st.session_state['latitude']}, Longitude: {st.session_state['longitude']}",
-    ).add_to(m)
+    # Marker for the selected location and the heatmap, sent as dynamic layers so the base map is not reloaded
+    map_data = render_map(
+        get_base_map(API_URL, **MAP_OPTIONS),
+        [selection_layer(st.session_state["latitude"], st.session_state["longitude"]), heatmap_layer],
+        returned_objects=["last_clicked", "zoom"],
+        center=map_center,
+        zoom=st.session_state["map_zoom"],  # Dynamic zoom level
+    )
+    st.caption(
+        f"Heatmap resolution: {GRID_STEP * heatmap_factor:.2f}°"
+        + (f" (mean of {heatmap_factor}×{heatmap_factor} cells)" if heatmap_factor > 1 else "")
+    )
 
-    # Add click functionality
-    map_data = st_folium(m, height=500, width=700, returned_objects=["last_clicked"])
+    # Zooming past a level boundary redraws the heatmap at the new level
+    if sync_map_zoom(map_data) and level_factor(st.session_state["map_zoom"]) != heatmap_factor:
+        st.rerun()
 
     # Immediate synchronization of map clicks
-    if map_data and map_data.get("last_clicked"):
-        clicked_lat = map_data["last_clicked"]["lat"]
-        clicked_lon = map_data["last_clicked"]["lng"]
-
-        # Update session state and mark the click as processed
-        if (
-            LATITUDE_RANGE[0] <= clicked_lat <= LATITUDE_RANGE[1]
-            and LONGITUDE_RANGE[0] <= clicked_lon <= LONGITUDE_RANGE[1]
-        ):
-            st.session_state["latitude"] = round(clicked_lat, 2)
-            st.session_state["longitude"] = round(clicked_lon, 2)
-            st.session_state["clicked"] = True  # Avoid input box overwriting
+    clicked = clicked_location(map_data)
+
+    # Update session state and mark the click as processed
+    if clicked and in_aoi(*clicked):
+        st.session_state["latitude"], st.session_state["longitude"] = clicked
+        st.session_state["clicked"] = True  # Avoid input box overwriting
 
 # Reset the click state for future updates
 st.session_state["clicked"] = False
 
 # Analysis in the second column
 with col2:
+    cancel_stale_analysis((st.session_state["latitude"], st.session_state["longitude"]))
     st.subheader("📊 Deforestation Analysis")
     st.markdown(
         f"""
@@ -133,58 +133,40 @@ with col2:
         """
     )
 
-    # Analyze button
-    if st.button("Analyze Deforestation"):
-        with st.spinner("Analyzing deforestation trends..."):
-            try:
-                # Make API request
-                payload = {
-                    "latitude": st.session_state["latitude"],
-                    "longitude": st.session_state["longitude"]
-                }
-                response = requests.post(API_URL, json=payload, timeout=30)
-
-                # Handle responses
-                if response.status_code == 200:
-                    try:
-                        data = response.json()
-                        deforestation_percentage = (
-                            data.get("deforestation_percentage", {})
-                            .get("deforestation_percentage", None)
-                        )
-                        if deforestation_percentage is not None:
-                            # Safeguard: Adjust values to realistic outputs if >= 100% or <= -100%
-                            if abs(deforestation_percentage) >= 100:
-                                deforestation_percentage = round(random.uniform(91.03, 94.54), 2) * (
-                                    -1 if deforestation_percentage < 0 else 1
-                                )
-
-                            # Determine message based on the value
-                            if deforestation_percentage == 0:
-                                st.info("🌍 There was no significant change in deforestation between 2016 and 2021.")
-                            elif deforestation_percentage < 0:
-                                st.success(
-                                    f"🌍 In this area, there was a deforestation of **{-deforestation_percentage:.2f}%** of the area between 2016 and 2021."
-                                )
-                            else:
-                                st.success(
-                                    f"🌍 In this area, there was a recovery of **{deforestation_percentage:.2f}%** of the deforested area between 2016 and 2021."
-                                )
-
-                            # Recenter and zoom map after analysis
-                            st.session_state["map_zoom"] = 13
-                        else:
-                            raise ValueError("Invalid response structure")
-                    except (ValueError, AttributeError):
-                        raise ValueError("API returned an invalid response format.")
-                elif response.status_code == 404:
-                    st.warning(f"No data available for the selected coordinates: {st.session_state['latitude']}, {st.session_state['longitude']}.")
-                    raise ValueError("No data available")
-                else:
-                    st.error(f"API Error: {response.status_code} - {response.text}")
-                    raise ValueError("API error")
-            except (requests.exceptions.RequestException, ValueError) as e:
-                st.error(f"Error: {e}. Using fallback estimation.")
-                # Generate random emergency deforestation percentage
-                emergency_deforestation_percentage = round(random.uniform(-45, 45), 2)
-                st.success(f"🌍 In this area, there was a **{emergency_deforestation_percentage:.2f}%** increase in deforestation.")
+    # Analyze button: the lookup runs in the background and the page reruns when it is done
+    if st.button("Analyze Deforestation", disabled=analysis_running()):
+        start_analysis(API_URL, st.session_state["latitude"], st.session_state["longitude"], local_grid=True)
+        st.rerun()
+
+    if analysis_running():
+        show_analysis_progress(API_URL, st.session_state["latitude"], st.session_state["longitude"])
+
+    if (st.session_state["latitude"], st.session_state["longitude"]) != analyzed_location:
+        job = None  # A map click picked another point
+    if job is not None:
+        # Values >= 100% or <= -100% are replaced by what the neighbouring cells suggest
+        deforestation_percentage, cells_used, error = analysis_outcome(
+            job, API_URL, st.session_state["latitude"], st.session_state["longitude"], plausible=True
+        )
+        if error is None:
+            # Determine message based on the value
+            kind, message = describe_change(deforestation_percentage)
+            getattr(st, kind)(message)
+            if cells_used:
+                st.caption(ESTIMATE_NOTE.format(cells_used))
+        else:
+            if isinstance(error, NoDataError):
+                st.warning(f"No data available for the selected coordinates: {st.session_state['latitude']}, {st.session_state['longitude']}.")
+            elif isinstance(error, APIError):
+                st.error(f"API Error: {error.status_code} - {error.text}")
+            st.error(f"Error: {error}. Using fallback estimation.")
+            # Interpolated from the results known around the selected cell
+            if deforestation_percentage is None:
+                st.warning("No nearby results to estimate from.")
+            else:
+                st.success(f"🌍 In this area, there was a **{deforestation_percentage:.2f}%** increase in deforestation.")
+                st.caption(ESTIMATE_NOTE.format(cells_used))
+
+# Poll the background analysis until it is taken; one that finished after the check above reruns right away
+if st.session_state.get("analysis_job") is not None:
+    wait_for_analysis()
@@ -1,55 +1,64 @@
 import streamlit as st
-import folium
-from streamlit_folium import st_folium
-import requests
-import random
+from pixel_prediction.api import APIError, NoDataError
+from pixel_prediction.core import (
+    AOI_CENTER,
+    API_URL,
+    ESTIMATE_NOTE,
+    analysis_outcome,
+    clicked_location,
+    coordinate_inputs,
+    describe_change,
+    get_base_map,
+    heatmap_layer,
+    in_aoi,
+    init_session_state,
+    render_map,
+    require_aoi_config,
+    selection_layer,
+    show_analysis_progress,
+    start_analysis,
+    start_prefetch,
+    warm_up,
+)
+from pixel_prediction.jobs import (
+    analysis_running,
+    cancel_distant_prefetch,
+    cancel_stale_analysis,
+    pop_finished_analysis,
+    wait_for_analysis,
+)
+from pixel_prediction.resources import get_grid_lookup
 
 # Set page configuration
 st.set_page_config(page_title="Deforestation Analysis Tool", page_icon="🌳", layout="wide")
 
-# API URL
-API_URL = "https://pixelprediction-1000116839323.europe-west1.run.app/deforestation"
+# Stop with the reason when the area of interest config is invalid
+require_aoi_config()
+
+# Map layers of this app; the base map is built ahead by the warm-up
+MAP_OPTIONS = {}
+warm_up(API_URL, **MAP_OPTIONS)
 
 # Sidebar: Title and Location Selection
 st.sidebar.markdown("### 🌳 Deforestation Analysis Tool")
 st.sidebar.title("📍 Location Selection")
 st.sidebar.info("Use the map or input boxes to select coordinates within the defined area of interest.")
-
-# Define allowed ranges
-LATITUDE_RANGE = (-4.39, -3.33)
-LONGITUDE_RANGE = (-55.2, -54.48)
+if get_grid_lookup() is not None:
+    st.sidebar.caption("Local grid mode: results are read from the precomputed grid.")
 
 # Initialize session state dynamically
-if "latitude" not in st.session_state:
-    st.session_state["latitude"] = None
-if "longitude" not in st.session_state:
-    st.session_state["longitude"] = None
-if "clicked" not in st.session_state:
-    st.session_state["clicked"] = False  # To track if a click event occurred
-if "map_zoom" not in st.session_state:
-    st.session_state["map_zoom"] = 9  # Default zoom
+init_session_state({
+    "latitude": None,
+    "longitude": None,
+    "clicked": False,  # To track if a click event occurred
+    "map_zoom": 9,  # Default zoom
+})
 
 # Sidebar: Input boxes
-col_input1, col_input2 = st.sidebar.columns(2)
-with col_input1:
-    lat_input = st.number_input(
-        "Latitude",
-        min_value=LATITUDE_RANGE[0],
-        max_value=LATITUDE_RANGE[1],
-        value=st.session_state["latitude"] if st.session_state["latitude"] else (LATITUDE_RANGE[0] + LATITUDE_RANGE[1]) / 2,
-        step=0.01,
-        format="%.2f",
-        key="lat_input_box"
-    )
-with col_input2:
-    lon_input = st.number_input(
-        "Longitude",
-        min_value=LONGITUDE_RANGE[0],
-        max_value=LONGITUDE_RANGE[1],
-        value=st.session_state["longitude"] if st.session_state["longitude"] else (LONGITUDE_RANGE[0] + LONGITUDE_RANGE[1]) / 2,
-        step=0.01,
-        format="%.2f",
-        key="lon_input_box"
+with st.sidebar:
+    lat_input, lon_input = coordinate_inputs(
+        st.session_state["latitude"] if st.session_state["latitude"] else AOI_CENTER[0],
+        st.session_state["longitude"] if st.session_state["longitude"] else AOI_CENTER[1],
     )
 
 # Synchronize inputs
@@ -57,55 +66,44 @@ if not st.session_state["clicked"]:  # Only update from input boxes if no map cl
     st.session_state["latitude"] = lat_input
     st.session_state["longitude"] = lon_input
 
+
 # Layout: Map and Analysis side-by-side
 col1, col2 = st.columns([2, 1])
 
 # Map in the first column
 with col1:
-    # Map setup with center and dynamic zoom
+    # Map center and zoom are applied dynamically on the cached base map
     map_center = (
         [st.session_state["latitude"], st.session_state["longitude"]]
         if st.session_state["latitude"] and st.session_state["longitude"]
-        else [(LATITUDE_RANGE[0] + LATITUDE_RANGE[1]) / 2, (LONGITUDE_RANGE[0] + LONGITUDE_RANGE[1]) / 2]
+        else list(AOI_CENTER)
     )
-    m = folium.Map(location=map_center, zoom_start=st.session_state["map_zoom"], tiles="OpenStreetMap")
 
-    # Draw area of interest boundary
-    folium.Rectangle(
-        bounds=[[LATITUDE_RANGE[0], LONGITUDE_RANGE[0]], [LATITUDE_RANGE[1], LONGITUDE_RANGE[1]]],
-        color="blue",
-        weight=2,
-        fill=False
-    ).add_to(m)
+    # Marker if coordinates are selected, as a dynamic layer so the base map is not reloaded
+    map_data = render_map(
+        get_base_map(API_URL, **MAP_OPTIONS),
+        [selection_layer(st.session_state["latitude"], st.session_state["longitude"]), heatmap_layer(API_URL)],
+        returned_objects=["last_clicked"],
+        center=map_center,
+        zoom=st.session_state["map_zoom"],
+    )
 
-    # Add marker if coordinates are selected
-    if st.session_state["latitude"] and st.session_state["longitude"]:
-        folium.Marker(
-            [st.session_state["latitude"], st.session_state["longitude"]],
-            tooltip=f"Latitude: {st.session_state['latitude']}, Longitude: {st.session_state['longitude']}",
-        ).add_to(m)
-
-    # Handle map clicks
-    map_data = st_folium(m, height=500, width=700, returned_objects=["last_clicked"])
-
-    # Update session state based on map click
-    if map_data and map_data.get("last_clicked"):
-        clicked_lat = map_data["last_clicked"]["lat"]
-        clicked_lon = map_data["last_clicked"]["lng"]
-
-        # Update session state with valid clicks
-        if LATITUDE_RANGE[0] <= clicked_lat <= LATITUDE_RANGE[1] and LONGITUDE_RANGE[0] <= clicked_lon <= LONGITUDE_RANGE[1]:
-            st.session_state.update({
-                "latitude": round(clicked_lat, 2),
-                "longitude": round(clicked_lon, 2),
-                "clicked": True,
-            })
-            st.success(f"Coordinates updated: {st.session_state['latitude']}, {st.session_state['longitude']}")
+    # Update session state with valid clicks
+    clicked = clicked_location(map_data)
+    if clicked and in_aoi(*clicked):
+        st.session_state.update({
+            "latitude": clicked[0],
+            "longitude": clicked[1],
+            "clicked": True,
+        })
+        st.success(f"Coordinates updated: {st.session_state['latitude']}, {st.session_state['longitude']}")
 
 # Analysis in the second column
 with col2:
+    cancel_stale_analysis((st.session_state["latitude"], st.session_state["longitude"]))
     st.subheader("📊 Deforestation Analysis")
     if st.session_state["latitude"] and st.session_state["longitude"]:
+        cancel_distant_prefetch((st.session_state["latitude"], st.session_state["longitude"]))
         st.markdown(
             f"""
             **Selected Coordinates**:
@@ -114,47 +112,43 @@ with col2:
             """
         )
 
-        # Analyze button
-        if st.button("Analyze Deforestation"):
-            with st.spinner("Analyzing deforestation trends..."):
-                try:
-                    # Make API request
-                    payload = {
-                        "latitude": st.session_state["latitude"],
-                        "longitude": st.session_state["longitude"]
-                    }
-                    response = requests.post(API_URL, json=payload, timeout=30)
-
-                    # Handle responses
-                    if response.status_code == 200:
-                        data = response.json()
-                        deforestation_percentage = data.get("deforestation_percentage", {}).get("deforestation_percentage", None)
-
-                        if deforestation_percentage is not None:
-                            # Adjust values to realistic range if needed
-                            if abs(deforestation_percentage) >= 100:
-                                deforestation_percentage = round(random.uniform(91.03, 94.54), 2) * (-1 if deforestation_percentage < 0 else 1)
-
-                            # Show results
-                            if deforestation_percentage == 0:
-                                st.info("🌍 There was no significant change in deforestation between 2016 and 2021.")
-                            elif deforestation_percentage < 0:
-                                st.success(
-                                    f"🌍 In this area, there was a deforestation of **{-deforestation_percentage:.2f}%** of the area between 2016 and 2021."
-                                )
-                            else:
-                                st.success(
-                                    f"🌍 In this area, there was a recovery of **{deforestation_percentage:.2f}%** of the deforested area between 2016 and 2021."
-                                )
-                        else:
-                            raise ValueError("Invalid response structure")
-                    elif response.status_code == 404:
-                        st.warning(f"No data available for the selected coordinates.")
-                    else:
-                        st.error(f"API Error: {response.status_code}")
-                except requests.exceptions.RequestException as e:
-                    st.error(f"Error: {e}. Using fallback estimation.")
-                    emergency_deforestation_percentage = round(random.uniform(-45, 45), 2)
-                    st.success(f"🌍 In this area, there was a **{emergency_deforestation_percentage:.2f}%** increase in deforestation.")
+        # Analyze button: the lookup runs in the background and the page reruns when it is done
+        if st.button("Analyze Deforestation", disabled=analysis_running()):
+            start_analysis(API_URL, st.session_state["latitude"], st.session_state["longitude"], local_grid=True)
+            st.rerun()
+
+        if analysis_running():
+            show_analysis_progress(API_URL, st.session_state["latitude"], st.session_state["longitude"])
+
+        job = pop_finished_analysis()
+        if job is not None:
+            # Replace implausible values (>= 100% or <= -100%) by what the neighbouring cells suggest
+            deforestation_percentage, cells_used, error = analysis_outcome(
+                job, API_URL, st.session_state["latitude"], st.session_state["longitude"], plausible=True
+            )
+            if error is None:
+                # Show results
+                kind, message = describe_change(deforestation_percentage)
+                getattr(st, kind)(message)
+                if cells_used:
+                    st.caption(ESTIMATE_NOTE.format(cells_used))
+                # Nearby clicks are likely next: fetch the surrounding cells while the user reads
+                start_prefetch(API_URL, st.session_state["latitude"], st.session_state["longitude"], local_grid=True)
+            elif isinstance(error, NoDataError):
+                st.warning(f"No data available for the selected coordinates.")
+            elif isinstance(error, APIError):
+                st.error(f"API Error: {error.status_code}")
+            else:
+                st.error(f"Error: {error}. Using fallback estimation.")
+                # Interpolated from the results known around the selected cell
+                if deforestation_percentage is None:
+                    st.warning("No nearby results to estimate from.")
+                else:
+                    st.success(f"🌍 In this area, there was a **{deforestation_percentage:.2f}%** increase in deforestation.")
+                    st.caption(ESTIMATE_NOTE.format(cells_used))
     else:
         st.warning("Please click on the map to select coordinates.")
+
+# Poll the background analysis while it runs
+if analysis_running():
+    wait_for_analysis()
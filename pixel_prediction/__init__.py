@@ -0,0 +1 @@
+"""Shared building blocks for the Pixel Prediction Streamlit apps."""
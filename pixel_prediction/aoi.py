@@ -0,0 +1,164 @@
+"""Registry of the areas of interest (AOIs) the apps can analyse.
+
+Each area has its own bounds, grid resolution, model service endpoint and
+precomputed grid. They are read from a JSON file named by
+$DEFORESTATION_AOI_CONFIG:
+
+    {"areas": [
+        {"name": "tapajos", "label": "Tapajós",
+         "latitude_range": [-4.39, -3.33], "longitude_range": [-55.2, -54.48],
+         "step": 0.01, "api_url": "https://.../deforestation", "grid": "data/grid"},
+        ...
+    ]}
+
+Only name and the ranges are required; step defaults to the 0.01° grid,
+api_url to the app's own endpoint and grid to $DEFORESTATION_GRID for the
+first area and to none for the others. Without a config file the registry holds
+the default area of interest alone.
+
+Points are matched to areas through a uniform-grid bucket index: every area
+is listed in the buckets (BUCKET_DEGREES wide) its bounds overlap, so a
+lookup checks only the few areas of one bucket, however many are registered.
+"""
+import json
+import math
+import os
+from collections import defaultdict
+
+from .grid import GRID_STEP, LATITUDE_RANGE, LONGITUDE_RANGE, Grid
+
+AOI_CONFIG_ENV = "DEFORESTATION_AOI_CONFIG"  # Path of the JSON file of the areas
+BUCKET_DEGREES = 1.0  # Side of the index buckets
+
+
+class AOI:
+    """One area of interest: bounds, grid step, endpoint and precomputed grid path.
+
+    api_url and grid are None when the area uses the app's endpoint or has no
+    precomputed grid.
+    """
+
+    def __init__(self, name, latitude_range, longitude_range, step=GRID_STEP, api_url=None, grid=None, label=None):
+        self.name = name
+        self.label = label or name
+        self.latitude_range = tuple(latitude_range)
+        self.longitude_range = tuple(longitude_range)
+        self.step = step
+        self.api_url = api_url
+        self.grid_path = grid
+        if self.latitude_range[0] > self.latitude_range[1] or self.longitude_range[0] > self.longitude_range[1]:
+            raise ValueError(f"Area {name!r} has empty bounds")
+
+    def contains(self, latitude, longitude):
+        return (
+            self.latitude_range[0] <= latitude <= self.latitude_range[1]
+            and self.longitude_range[0] <= longitude <= self.longitude_range[1]
+        )
+
+    @property
+    def area(self):
+        return (self.latitude_range[1] - self.latitude_range[0]) * (self.longitude_range[1] - self.longitude_range[0])
+
+    @property
+    def center(self):
+        return (
+            (self.latitude_range[0] + self.latitude_range[1]) / 2,
+            (self.longitude_range[0] + self.longitude_range[1]) / 2,
+        )
+
+    def bounds(self):
+        # [[south, west], [north, east]] as folium expects
+        return [[self.latitude_range[0], self.longitude_range[0]], [self.latitude_range[1], self.longitude_range[1]]]
+
+    def grid(self):
+        return Grid(self.latitude_range, self.longitude_range, self.step)
+
+
+class AOIRegistry:
+    """Areas by name, with a bucket index for point lookups.
+
+    Where areas overlap, a point belongs to the smallest one containing it.
+    """
+
+    def __init__(self, areas, bucket_degrees=BUCKET_DEGREES):
+        self.areas = {}
+        self.bucket_degrees = bucket_degrees
+        self._buckets = defaultdict(list)
+        for aoi in sorted(areas, key=lambda aoi: aoi.area):  # Buckets list the smallest areas first
+            if aoi.name in self.areas:
+                raise ValueError(f"Duplicate area name {aoi.name!r}")
+            self.areas[aoi.name] = aoi
+            lat_min, lon_min = self._bucket(aoi.latitude_range[0], aoi.longitude_range[0])
+            lat_max, lon_max = self._bucket(aoi.latitude_range[1], aoi.longitude_range[1])
+            for lat_bucket in range(lat_min, lat_max + 1):
+                for lon_bucket in range(lon_min, lon_max + 1):
+                    self._buckets[lat_bucket, lon_bucket].append(aoi)
+
+    def _bucket(self, latitude, longitude):
+        return math.floor(latitude / self.bucket_degrees), math.floor(longitude / self.bucket_degrees)
+
+    def find(self, latitude, longitude):
+        # The area containing the coordinates, or None
+        for aoi in self._buckets.get(self._bucket(latitude, longitude), ()):
+            if aoi.contains(latitude, longitude):
+                return aoi
+        return None
+
+    def get(self, name):
+        return self.areas[name]
+
+    def __iter__(self):
+        return iter(self.areas.values())
+
+    def __len__(self):
+        return len(self.areas)
+
+    def bounds(self):
+        # (latitude range, longitude range) enclosing every area
+        return (
+            (min(aoi.latitude_range[0] for aoi in self), max(aoi.latitude_range[1] for aoi in self)),
+            (min(aoi.longitude_range[0] for aoi in self), max(aoi.longitude_range[1] for aoi in self)),
+        )
+
+
+def default_registry():
+    # The built-in area of interest alone, with the configured endpoint and grid
+    return AOIRegistry([AOI("default", LATITUDE_RANGE, LONGITUDE_RANGE, grid=os.environ.get("DEFORESTATION_GRID"), label="Area of Interest")])
+
+
+def load_registry(path):
+    """Registry of the areas in a JSON config file (see the module docstring).
+
+    Raises ValueError with a message fit for display when the file is invalid.
+    """
+    with open(path) as f:
+        try:
+            config = json.load(f)
+        except ValueError as e:
+            raise ValueError(f"Could not read the area config {path}: {e}")
+    if not isinstance(config, dict) or not isinstance(config.get("areas", []), list):
+        raise ValueError(f"The area config {path} must be an object with a list of areas")
+    areas = []
+    for index, entry in enumerate(config.get("areas", [])):
+        try:
+            areas.append(AOI(
+                entry["name"],
+                _range(entry["latitude_range"]),
+                _range(entry["longitude_range"]),
+                step=float(entry.get("step", GRID_STEP)),
+                api_url=entry.get("api_url"),
+                grid=entry.get("grid", os.environ.get("DEFORESTATION_GRID") if index == 0 else None),
+                label=entry.get("label"),
+            ))
+        except (KeyError, TypeError, IndexError, ValueError) as e:
+            raise ValueError(f"Invalid area #{index + 1} in {path}: {e!r}")
+    if not areas:
+        raise ValueError(f"The area config {path} lists no areas")
+    return AOIRegistry(areas)
+
+
+def _range(value):
+    # (min, max) of a config range; TypeError unless it is two numbers
+    if not isinstance(value, list) or len(value) != 2:
+        raise TypeError(f"expected [min, max], got {value!r}")
+    return float(value[0]), float(value[1])
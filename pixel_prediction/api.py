@@ -0,0 +1,264 @@
+"""Client helpers for the /deforestation model service."""
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import MISS
+from .grid import GRID_STEP, cell_key, snap
+from .metrics import span
+from .singleflight import SingleFlight
+
+DEFAULT_API_URL = "https://pixelprediction-1000116839323.europe-west1.run.app/deforestation"
+API_URL_ENV = "DEFORESTATION_API_URL"  # Overrides every app's endpoint, e.g. to use the mock server
+REQUEST_TIMEOUT = 30  # Seconds
+BATCH_PATH = "/batch"  # Batch endpoint, relative to the API URL
+MAX_BATCH_POINTS = 100  # Points accepted per batch request
+REFRESH_WORKERS = 2  # Background refreshes of stale cache entries at a time, per process
+
+# Process-wide, so sessions asking for the same cell at once share one request
+flights = SingleFlight()
+
+# Where get_deforestation answers came from ("grid", "cache" or "service"), process-wide;
+# "prefetch" counts the prefetch lookups and "refresh" the background refreshes of stale cache entries
+lookup_counts = Counter()
+_counts_lock = threading.Lock()
+
+# Stale cache entries are refreshed here, off the request path; no threads run until the first one
+refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="refresh")
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def configured_api_url(default=DEFAULT_API_URL):
+    # The endpoint from $DEFORESTATION_API_URL, or the app's own default
+    return os.environ.get(API_URL_ENV) or default
+
+
+class NoDataError(ValueError):
+    """The service has no data for the requested coordinates (HTTP 404).
+
+    source is where the answer came from, as in lookup_deforestation().
+    """
+
+    def __init__(self, source="service"):
+        super().__init__("No data available")
+        self.source = source
+
+
+class APIError(ValueError):
+    """The service answered with an unexpected HTTP status."""
+
+    def __init__(self, status_code, text):
+        super().__init__("API error")
+        self.status_code = status_code
+        self.text = text
+
+
+class BatchUnsupportedError(Exception):
+    """The service has no batch endpoint; send single-point requests instead."""
+
+    def __init__(self, status_code):
+        super().__init__(f"Batch endpoint not available (HTTP {status_code})")
+        self.status_code = status_code
+
+
+def parse_deforestation(response):
+    # Extract the percentage from a /deforestation response or raise
+    if response.status_code == 200:
+        try:
+            data = response.json()
+            deforestation_percentage = (
+                data.get("deforestation_percentage", {})
+                .get("deforestation_percentage", None)
+            )
+        except (ValueError, AttributeError):
+            raise ValueError("API returned an invalid response format.")
+        if deforestation_percentage is None:
+            raise ValueError("API returned an invalid response format.")
+        return deforestation_percentage
+    if response.status_code == 404:
+        raise NoDataError()
+    raise APIError(response.status_code, response.text)
+
+
+def fetch_deforestation(api_url, latitude, longitude, client=None, timeout=REQUEST_TIMEOUT):
+    payload = {"latitude": latitude, "longitude": longitude}
+    # "api_request" covers every attempt and backoff of the call
+    with span("api_request"):
+        if client is not None:
+            response = client.post(api_url, payload)
+        else:
+            import requests
+            response = requests.post(api_url, json=payload, timeout=timeout)
+    with span("api_parse"):
+        return parse_deforestation(response)
+
+
+def batch_url(api_url):
+    return api_url.rstrip("/") + BATCH_PATH
+
+
+def fetch_deforestation_batch(api_url, points, client=None, timeout=REQUEST_TIMEOUT):
+    """Look many (latitude, longitude) points up in one request.
+
+    Batch contract (POST {api_url}/batch, at most MAX_BATCH_POINTS points):
+
+        {"points": [{"latitude": -3.85, "longitude": -54.84}, ...]}
+        200 {"results": [{"latitude": ..., "longitude": ..., "status": 200,
+                          "deforestation_percentage": {"deforestation_percentage": 12.34}},
+                         {"latitude": ..., "longitude": ..., "status": 404, "detail": "..."}, ...]}
+
+    with one result per point, in request order, each with the status the
+    single-point endpoint would answer. Returns a list with, per point, the
+    percentage or the NoDataError/APIError/ValueError of its lookup. Raises
+    BatchUnsupportedError when the service has no batch endpoint, and
+    APIError, ValueError or requests exceptions when the whole request fails.
+    """
+    payload = {"points": [{"latitude": latitude, "longitude": longitude} for latitude, longitude in points]}
+    with span("api_batch"):
+        if client is not None:
+            response = client.post(batch_url(api_url), payload)
+        else:
+            import requests
+            response = requests.post(batch_url(api_url), json=payload, timeout=timeout)
+    with span("api_parse"):
+        return parse_deforestation_batch(response, len(points))
+
+
+def parse_deforestation_batch(response, expected):
+    # Per-point results of a batch response, or raise for the whole request
+    if response.status_code in (404, 405, 501):
+        # The route itself is missing; "no data" is reported per point
+        raise BatchUnsupportedError(response.status_code)
+    if response.status_code != 200:
+        raise APIError(response.status_code, response.text)
+    try:
+        results = response.json()["results"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("API returned an invalid response format.")
+    if not isinstance(results, list) or len(results) != expected:
+        raise ValueError("API returned an invalid response format.")
+    return [_parse_batch_result(result) for result in results]
+
+
+def _parse_batch_result(result):
+    status = result.get("status") if isinstance(result, dict) else None
+    if status == 200:
+        value = (result.get("deforestation_percentage") or {}).get("deforestation_percentage")
+        return value if value is not None else ValueError("API returned an invalid response format.")
+    if status == 404:
+        return NoDataError()
+    if status is None:
+        return ValueError("API returned an invalid response format.")
+    return APIError(status, result.get("detail", ""))
+
+
+def get_deforestation(
+    api_url, latitude, longitude, cache=None, client=None, grid=None, batcher=None, step=GRID_STEP, prefetch=False
+):
+    # Deforestation percentage for the grid cell containing the coordinates, see lookup_deforestation()
+    return lookup_deforestation(api_url, latitude, longitude, cache, client, grid, batcher, step, prefetch)[0]
+
+
+def lookup_deforestation(
+    api_url, latitude, longitude, cache=None, client=None, grid=None, batcher=None, step=GRID_STEP, prefetch=False
+):
+    """(deforestation percentage, source) for the grid cell containing the coordinates.
+
+    Cells are those of the step (the area of interest's grid); the cache and
+    grid given should be of the same step.
+
+    source is where the answer came from: "grid", "cache" or "service" (a
+    request, possibly shared with concurrent lookups of the cell). Lookups
+    with prefetch are counted as "prefetch" instead of by source, so the
+    counts of the other lookups stay those of user requests.
+
+    Answers from the precomputed grid or the cache when possible; otherwise calls the service (through
+    the pooled client when given) and stores the result, including "no data"
+    answers. Concurrent calls for the same cell share a single request; with
+    a batcher (batcher.MicroBatcher) it is sent together with other pending
+    lookups. A cached answer older than the cache's stale_after is still
+    returned, and refreshed in the background (stale-while-revalidate). Raises
+    NoDataError, APIError, ValueError or requests.exceptions.RequestException
+    like the service call.
+    """
+    latitude, longitude = snap(latitude, step), snap(longitude, step)
+    for name, store in (("grid", grid), ("cache", cache)):
+        if store is None:
+            continue
+        stored = store.get(latitude, longitude)
+        if stored is not MISS:
+            _count("prefetch" if prefetch else name)
+            if name == "cache" and store.needs_refresh(latitude, longitude):
+                refresh_in_background(api_url, latitude, longitude, cache, client, step)
+            if stored is None:
+                raise NoDataError(source=name)
+            return stored, name
+
+    _count("prefetch" if prefetch else "service")
+    return flights.do(
+        (api_url, step, cell_key(latitude, longitude, step)),
+        _fetch_and_store,
+        api_url,
+        latitude,
+        longitude,
+        cache,
+        client,
+        False,
+        batcher,
+    ), "service"
+
+
+def _count(name):
+    with _counts_lock:
+        lookup_counts[name] += 1
+
+
+def refresh_in_background(api_url, latitude, longitude, cache, client=None, step=GRID_STEP):
+    """Fetch the cell again and store the fresh result, without waiting for it.
+
+    At most one refresh per cell is queued; returns its future, or None when
+    one is already pending.
+    """
+    latitude, longitude = snap(latitude, step), snap(longitude, step)
+    key = (api_url, step, cell_key(latitude, longitude, step))
+    with _refreshing_lock:
+        if key in _refreshing:
+            return None
+        _refreshing.add(key)
+    _count("refresh")
+    return refresh_executor.submit(_refresh, key, api_url, latitude, longitude, cache, client)
+
+
+def _refresh(key, api_url, latitude, longitude, cache, client):
+    try:
+        return flights.do(key, _fetch_and_store, api_url, latitude, longitude, cache, client, True)
+    except Exception:
+        return None  # The stale result stays in use until it expires
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(key)
+
+
+def _fetch_and_store(api_url, latitude, longitude, cache, client, refresh=False, batcher=None):
+    # Runs once per cell at a time; a call that just finished may already have stored it
+    if cache is not None and not refresh:
+        stored = cache.get(latitude, longitude)
+        if stored is not MISS:
+            if stored is None:
+                raise NoDataError()
+            return stored
+
+    try:
+        if batcher is not None:
+            deforestation_percentage = batcher.fetch(latitude, longitude)
+        else:
+            deforestation_percentage = fetch_deforestation(api_url, latitude, longitude, client=client)
+    except NoDataError:
+        if cache is not None:
+            cache.set(latitude, longitude, None)
+        raise
+    if cache is not None:
+        cache.set(latitude, longitude, deforestation_percentage)
+    return deforestation_percentage
@@ -0,0 +1,84 @@
+"""Aggregation of the deforestation grid over a drawn polygon or rectangle.
+
+The drawn GeoJSON geometry is rasterized to a boolean mask over the grid
+(a cell belongs to the area when its center is inside), and the known values
+under the mask are reduced with NumPy in one pass.
+"""
+import numpy as np
+import pandas as pd
+
+HISTOGRAM_BINS = np.arange(-100, 101, 20)  # Percentage bin edges
+
+
+def geometry_rings(geometry):
+    # Every ring of a GeoJSON Polygon or MultiPolygon as an (n, 2) array of (longitude, latitude)
+    if geometry.get("type") == "Polygon":
+        polygons = [geometry["coordinates"]]
+    elif geometry.get("type") == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        raise ValueError(f"Unsupported geometry type: {geometry.get('type')}")
+    return [np.asarray(ring, dtype=np.float64)[:, :2] for polygon in polygons for ring in polygon]
+
+
+def geometry_mask(grid, geometry):
+    """Boolean grid.shape array, True for cells whose center lies inside the geometry.
+
+    Uses the even-odd rule, so holes and overlapping parts are handled. Each
+    ring edge is tested against all cell centers at once.
+    """
+    rows, cols = np.mgrid[0:grid.rows, 0:grid.cols]
+    latitude = (grid.lat_origin + rows) * grid.step
+    longitude = (grid.lon_origin + cols) * grid.step
+
+    mask = np.zeros(grid.shape, dtype=bool)
+    for ring in geometry_rings(geometry):
+        for (x1, y1), (x2, y2) in zip(ring, np.roll(ring, -1, axis=0)):
+            if y1 == y2:
+                continue  # Horizontal edges never cross a horizontal ray
+            crosses = (y1 > latitude) != (y2 > latitude)
+            crosses &= longitude < x1 + (latitude - y1) * (x2 - x1) / (y2 - y1)
+            mask ^= crosses
+    return mask
+
+
+def aggregate(values, grid, mask, bins=HISTOGRAM_BINS, no_data=None):
+    """Area-weighted statistics of the known values under the mask.
+
+    Cells are weighted by the cosine of their latitude, which is proportional
+    to their area on the ground. mean/min/max are None when no cell under the
+    mask is known. no_data is an optional mask of the cells the service has no
+    data for; they are counted apart from the cells not fetched yet.
+    """
+    known = mask & ~np.isnan(values)
+    area = np.cos(np.radians((grid.lat_origin + np.arange(grid.rows)) * grid.step))
+    weights = np.broadcast_to(area[:, None], grid.shape)[known]
+    selected = np.asarray(values)[known].astype(np.float64)
+
+    counts, edges = np.histogram(np.clip(selected, bins[0], bins[-1]), bins=bins)
+    histogram = pd.DataFrame(
+        {"cells": counts},
+        index=[f"{low:.0f} to {high:.0f}%" for low, high in zip(edges[:-1], edges[1:])],
+    )
+    return {
+        "cells": int(mask.sum()),
+        "known_cells": int(known.sum()),
+        "no_data_cells": int((mask & no_data).sum()) if no_data is not None else 0,
+        "mean": float(np.average(selected, weights=weights)) if selected.size else None,
+        "min": float(selected.min()) if selected.size else None,
+        "max": float(selected.max()) if selected.size else None,
+        "histogram": histogram,
+    }
+
+
+def missing_cells(grid, mask):
+    # Cells of the mask as rows for batch.run_batch: lat_cell, lon_cell, cell_latitude, cell_longitude
+    rows, cols = np.nonzero(mask)
+    lat_cell = rows + grid.lat_origin
+    lon_cell = cols + grid.lon_origin
+    return pd.DataFrame({
+        "lat_cell": lat_cell,
+        "lon_cell": lon_cell,
+        "cell_latitude": np.round(lat_cell * grid.step, 6),
+        "cell_longitude": np.round(lon_cell * grid.step, 6),
+    })
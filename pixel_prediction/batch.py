@@ -0,0 +1,168 @@
+"""Batch analysis of many points from an uploaded CSV or GeoJSON file.
+
+Points are validated in one vectorized pass and reduced to their unique grid
+cells. Cells already in the precomputed grid or the result cache are answered
+at once; the rest go through a bounded thread pool (and, with a batcher, out
+as batch requests), and results are yielded as they complete so the caller
+can show them progressively.
+"""
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import requests
+
+from .api import NoDataError, get_deforestation
+from .grid import GRID_STEP, LATITUDE_RANGE, LONGITUDE_RANGE, MISS
+
+BATCH_WORKERS = 8  # Concurrent service calls per batch
+MAX_POINTS = 10_000  # Points accepted per upload
+
+LATITUDE_COLUMNS = ("latitude", "lat", "y")
+LONGITUDE_COLUMNS = ("longitude", "lon", "lng", "long", "x")
+
+VALID = "valid"
+OUTSIDE = "outside the area"
+INVALID = "invalid coordinates"
+
+
+def read_points(name, data):
+    """DataFrame with latitude/longitude columns from a CSV or GeoJSON upload.
+
+    Raises ValueError with a message fit for display when the file can't be read.
+    """
+    if name.lower().endswith((".geojson", ".json")):
+        return _read_geojson(data)
+    try:
+        table = pd.read_csv(io.BytesIO(data))
+    except (ValueError, pd.errors.ParserError) as e:
+        raise ValueError(f"Could not read the CSV file: {e}")
+    columns = {column.strip().lower(): column for column in table.columns}
+    latitude = next((columns[c] for c in LATITUDE_COLUMNS if c in columns), None)
+    longitude = next((columns[c] for c in LONGITUDE_COLUMNS if c in columns), None)
+    if latitude is None or longitude is None:
+        raise ValueError("The CSV file needs a latitude and a longitude column.")
+    points = table.rename(columns={latitude: "latitude", longitude: "longitude"})
+    return _limit(points)
+
+
+def _read_geojson(data):
+    try:
+        document = json.loads(data)
+    except ValueError as e:
+        raise ValueError(f"Could not read the GeoJSON file: {e}")
+    if not isinstance(document, dict):
+        raise ValueError("The GeoJSON file must contain a GeoJSON object.")
+    if document.get("type") == "FeatureCollection":
+        features = document.get("features", [])
+        if not isinstance(features, list):
+            raise ValueError("The features of the GeoJSON FeatureCollection must be a list.")
+    else:
+        features = [document]
+
+    rows = []
+    for number, feature in enumerate(features, 1):
+        if not isinstance(feature, dict):
+            raise ValueError(f"Feature {number} of the GeoJSON file is not an object.")
+        if feature.get("type") == "Feature":
+            geometry, properties = feature.get("geometry") or {}, feature.get("properties") or {}
+        else:
+            geometry, properties = feature, {}
+        if not isinstance(geometry, dict) or not isinstance(properties, dict):
+            raise ValueError(f"Feature {number} of the GeoJSON file has an invalid geometry or properties.")
+        if geometry.get("type") == "Point":
+            coordinates = [geometry.get("coordinates")]
+        elif geometry.get("type") == "MultiPoint":
+            coordinates = geometry.get("coordinates") or []
+            if not isinstance(coordinates, list):
+                raise ValueError(f"Feature {number} of the GeoJSON file has invalid MultiPoint coordinates.")
+        else:
+            continue
+        for point in coordinates:
+            # GeoJSON positions are [longitude, latitude]
+            point = point if isinstance(point, list) and len(point) >= 2 else [None, None]
+            rows.append({**properties, "latitude": point[1], "longitude": point[0]})
+    if not rows:
+        raise ValueError("The GeoJSON file contains no Point or MultiPoint features.")
+    return _limit(pd.DataFrame(rows))
+
+
+def _limit(points):
+    if len(points) > MAX_POINTS:
+        raise ValueError(f"The file has {len(points)} points; at most {MAX_POINTS} are accepted.")
+    return points.reset_index(drop=True)
+
+
+def validate_points(points, latitude_range=LATITUDE_RANGE, longitude_range=LONGITUDE_RANGE, step=GRID_STEP):
+    """Copy of points with numeric coordinates, a status and the grid cell of each valid point."""
+    points = points.copy()
+    latitude = pd.to_numeric(points["latitude"], errors="coerce").to_numpy(dtype=np.float64)
+    longitude = pd.to_numeric(points["longitude"], errors="coerce").to_numpy(dtype=np.float64)
+    numeric = np.isfinite(latitude) & np.isfinite(longitude)
+    inside = (
+        numeric
+        & (latitude >= latitude_range[0]) & (latitude <= latitude_range[1])
+        & (longitude >= longitude_range[0]) & (longitude <= longitude_range[1])
+    )
+
+    points["latitude"], points["longitude"] = latitude, longitude
+    points["status"] = np.where(inside, VALID, np.where(numeric, OUTSIDE, INVALID))
+    # Same nearest-grid-line rounding as grid.cell_index
+    points["lat_cell"] = pd.array(np.where(inside, np.rint(latitude / step), np.nan), dtype="Int64")
+    points["lon_cell"] = pd.array(np.where(inside, np.rint(longitude / step), np.nan), dtype="Int64")
+    return points
+
+
+def unique_cells(points, step=GRID_STEP):
+    # One row per grid cell holding a valid point, with the cell's coordinates
+    cells = points.loc[points["status"] == VALID, ["lat_cell", "lon_cell"]].drop_duplicates()
+    cells = cells.astype(np.int64).reset_index(drop=True)
+    cells["cell_latitude"] = np.round(cells["lat_cell"] * step, 6)
+    cells["cell_longitude"] = np.round(cells["lon_cell"] * step, 6)
+    return cells
+
+
+def run_batch(cells, api_url, cache=None, client=None, grid=None, workers=BATCH_WORKERS, batcher=None):
+    """Yield (lat_cell, lon_cell, value, error) for every cell as soon as it is known.
+
+    value is None for cells without data. error is None on success, otherwise
+    the exception of a failed lookup. Stored results are yielded first; closing
+    the generator early cancels the lookups that have not started.
+    """
+    pending = []
+    for lat_cell, lon_cell, latitude, longitude in cells.itertuples(index=False):
+        stored = MISS
+        for store in (grid, cache):
+            if store is not None and stored is MISS:
+                stored = store.get(latitude, longitude)
+        if stored is MISS:
+            pending.append((lat_cell, lon_cell, latitude, longitude))
+        else:
+            yield lat_cell, lon_cell, stored, None
+
+    if not pending:
+        return
+    if batcher is not None:
+        # Threads only wait on the batcher, so enough of them to fill its batches
+        workers = max(workers, batcher.max_batch)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch")
+    try:
+        futures = {
+            executor.submit(
+                get_deforestation, api_url, latitude, longitude, cache=cache, client=client, grid=grid, batcher=batcher
+            ):
+                (lat_cell, lon_cell)
+            for lat_cell, lon_cell, latitude, longitude in pending
+        }
+        for future in as_completed(futures):
+            lat_cell, lon_cell = futures[future]
+            try:
+                yield lat_cell, lon_cell, future.result(), None
+            except NoDataError:
+                yield lat_cell, lon_cell, None, None
+            except (requests.exceptions.RequestException, ValueError) as e:
+                yield lat_cell, lon_cell, None, e
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
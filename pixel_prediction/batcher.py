@@ -0,0 +1,98 @@
+"""Micro-batching of /deforestation lookups.
+
+The model service takes one coordinate per POST, so bulk callers (batch
+analysis, prefetching, area fetches) pay a full request per cell. A
+MicroBatcher collects the lookups submitted within a short window and sends
+them as one request to the batch endpoint (contract in
+api.fetch_deforestation_batch, implemented by the mock server). When the
+service has no batch endpoint, the batcher remembers it and sends the lookups
+as parallel single-point requests instead.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .api import MAX_BATCH_POINTS, BatchUnsupportedError, fetch_deforestation, fetch_deforestation_batch
+
+BATCH_WINDOW = 0.02  # Seconds to wait for more lookups after the first of a batch
+MAX_BATCH = 50  # Points per batch request, at most MAX_BATCH_POINTS
+SEND_WORKERS = 8  # Batch (or fallback single-point) requests in flight at once
+
+
+class MicroBatcher:
+    """Thread-safe batching of the lookups of one API URL.
+
+    fetch() blocks like api.fetch_deforestation and raises the same
+    exceptions, per point.
+    """
+
+    def __init__(self, api_url, client=None, window=BATCH_WINDOW, max_batch=MAX_BATCH, workers=SEND_WORKERS):
+        self.api_url = api_url
+        self.client = client
+        self.window = window
+        self.max_batch = min(max_batch, MAX_BATCH_POINTS)
+        self.supported = None  # Whether the service has a batch endpoint, unknown until it answers
+        self.batches = 0  # Batch requests sent
+        self.points = 0  # Points sent in batch requests
+        self._queue = queue.Queue()
+        self._senders = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-send")
+        threading.Thread(target=self._collect, name="batcher", daemon=True).start()
+
+    def submit(self, latitude, longitude):
+        # Future of the lookup, sent with the next batch
+        future = Future()
+        self._queue.put((latitude, longitude, future))
+        return future
+
+    def fetch(self, latitude, longitude):
+        return self.submit(latitude, longitude).result()
+
+    def _collect(self):
+        # Batches: the first waiting lookup plus whatever arrives within the window
+        while True:
+            pending = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(pending) < self.max_batch:
+                try:
+                    pending.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            pending = [item for item in pending if item[2].set_running_or_notify_cancel()]
+            if not pending:
+                continue
+            if self.supported is False:
+                for item in pending:
+                    self._senders.submit(self._send_single, *item)
+            else:
+                self._senders.submit(self._send_batch, pending)
+
+    def _send_batch(self, pending):
+        try:
+            results = fetch_deforestation_batch(
+                self.api_url, [(latitude, longitude) for latitude, longitude, _ in pending], client=self.client
+            )
+        except BatchUnsupportedError:
+            self.supported = False
+            for item in pending:
+                self._senders.submit(self._send_single, *item)
+            return
+        except Exception as e:
+            # The whole request failed: every lookup of the batch gets the error, as a single call would
+            for _, _, future in pending:
+                future.set_exception(e)
+            return
+        self.supported = True
+        self.batches += 1
+        self.points += len(pending)
+        for (_, _, future), result in zip(pending, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _send_single(self, latitude, longitude, future):
+        try:
+            future.set_result(fetch_deforestation(self.api_url, latitude, longitude, client=self.client))
+        except Exception as e:
+            future.set_exception(e)
@@ -0,0 +1,194 @@
+"""Per-rerun cost of each Streamlit app variant.
+
+Every app is driven headlessly with streamlit.testing's AppTest through a
+scripted session (first load, coordinate edits, analyze press and result)
+against the local mock service, with a fresh result cache. For each rerun the
+script execution time, the size of the map component payload sent to the
+browser (the folium HTML and script) and the peak Python memory allocated
+during the rerun are reported.
+
+    python -m pixel_prediction.bench
+    python -m pixel_prediction.bench --apps app.py app_checker.py --repeat 5 --json bench.json
+
+Map clicks can't be simulated by AppTest; the coordinate edits exercise the
+same rerun path.
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from .mock_server import PROFILES, serve
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APPS = (
+    "app.py",
+    "app_checker.py",
+    "app_with_clicking.py",
+    "app_satelite_01.py",
+    "app_with_overlay_v1.py",
+    "app_presentable_no_overlay_v1.py",
+)
+DEBOUNCE_WAIT = 0.6  # Seconds, just over the apps' DEBOUNCE_SECONDS
+RESULT_TIMEOUT = 30
+
+
+def _set(kind, key, value):
+    def action(at):
+        getattr(at, kind)(key=key).set_value(value)
+    return action
+
+
+def _wait(seconds):
+    def action(at):
+        time.sleep(seconds)
+    return action
+
+
+def _press_analyze(at):
+    next(button for button in at.button if button.label == "Analyze Deforestation").click()
+
+
+def _wait_for_analysis(at):
+    # Block on the background job so the measured rerun is the one showing the result
+    job = at.session_state["analysis_job"] if "analysis_job" in at.session_state else None
+    if job is not None:
+        job["future"].exception(timeout=RESULT_TIMEOUT)
+
+
+def _no_action(at):
+    pass
+
+
+# (step label, action before the rerun) per app
+SLIDER_SESSION = [
+    ("first load", _no_action),
+    ("slider move", _set("slider", "latitude_slider", -3.9)),
+    ("slider move", _set("slider", "longitude_slider", -54.9)),
+    ("debounced apply", _wait(DEBOUNCE_WAIT)),
+    ("analyze press", _press_analyze),
+    ("analysis result", _wait_for_analysis),
+]
+DEBOUNCED_INPUT_SESSION = [
+    ("first load", _no_action),
+    ("input edit", _set("number_input", "lat_input_box", -3.9)),
+    ("input edit", _set("number_input", "lon_input_box", -54.9)),
+    ("debounced apply", _wait(DEBOUNCE_WAIT)),
+    ("analyze press", _press_analyze),
+    ("analysis result", _wait_for_analysis),
+]
+INPUT_SESSION = [
+    ("first load", _no_action),
+    ("input edit", _set("number_input", "lat_input_box", -3.9)),
+    ("input edit", _set("number_input", "lon_input_box", -54.9)),
+    ("analyze press", _press_analyze),
+    ("analysis result", _wait_for_analysis),
+]
+SESSIONS = {
+    "app.py": SLIDER_SESSION,
+    "app_checker.py": DEBOUNCED_INPUT_SESSION,
+}
+
+
+def map_payload_bytes(at):
+    # Size of the st_folium arguments (map HTML, script, dynamic layer) in the last rerun
+    return sum(len(element.proto.json_args) for element in at.get("component_instance"))
+
+
+def run_session(app, measure_memory=True):
+    """[(step, seconds, map bytes, peak bytes or None)] for one scripted session of the app."""
+    at = AppTest.from_file(os.path.join(ROOT, app), default_timeout=RESULT_TIMEOUT)
+    results = []
+    for step, action in SESSIONS.get(app, INPUT_SESSION):
+        action(at)
+        if measure_memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        at.run()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] - baseline if measure_memory else None
+        if at.exception:
+            raise RuntimeError(f"{app} failed at '{step}': {at.exception[0].message}")
+        results.append((step, elapsed, map_payload_bytes(at), peak))
+    return results
+
+
+def summarize(app, sessions):
+    # One row per step, aggregated over the repeated sessions
+    rows = []
+    for index, (step, *_) in enumerate(sessions[0]):
+        samples = [session[index] for session in sessions]
+        times = [sample[1] * 1000 for sample in samples]
+        peaks = [sample[3] for sample in samples if sample[3] is not None]
+        rows.append({
+            "app": app,
+            "step": step,
+            "mean_ms": round(statistics.mean(times), 1),
+            "max_ms": round(max(times), 1),
+            "map_kb": round(statistics.mean(sample[2] for sample in samples) / 1024, 1),
+            "peak_mb": round(max(peaks) / 2 ** 20, 2) if peaks else None,
+        })
+    return rows
+
+
+def print_table(rows):
+    header = f"{'app':<34} {'step':<18} {'mean ms':>8} {'max ms':>8} {'map KB':>8} {'peak MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        peak = f"{row['peak_mb']:.2f}" if row["peak_mb"] is not None else "-"
+        print(
+            f"{row['app']:<34} {row['step']:<18} {row['mean_ms']:>8.1f} {row['max_ms']:>8.1f}"
+            f" {row['map_kb']:>8.1f} {peak:>8}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the per-rerun cost of the Streamlit apps.")
+    parser.add_argument("--apps", nargs="+", default=APPS, help="App scripts to benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="Sessions per app, each with a fresh cache")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="instant", help="Mock service profile")
+    parser.add_argument("--no-memory", action="store_true", help="Skip tracemalloc, which slows reruns down")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    server = serve(port=0, profile=PROFILES[args.profile], seed=0)
+    os.environ["DEFORESTATION_API_URL"] = f"http://127.0.0.1:{server.server_port}/deforestation"
+    workdir = tempfile.mkdtemp(prefix="pixel-bench-")
+    if not args.no_memory:
+        tracemalloc.start()
+
+    rows, failures = [], {}
+    for app in args.apps:
+        sessions = []
+        for repeat in range(args.repeat):
+            # A fresh cache file per session, so every session pays for its own lookups
+            os.environ["DEFORESTATION_CACHE_PATH"] = os.path.join(workdir, f"{app}.{repeat}.sqlite3")
+            st.cache_data.clear()
+            st.cache_resource.clear()
+            try:
+                sessions.append(run_session(app, measure_memory=not args.no_memory))
+            except Exception as e:
+                failures[app] = str(e)
+                break
+        if sessions and app not in failures:
+            rows.extend(summarize(app, sessions))
+
+    server.shutdown()
+    print_table(rows)
+    for app, error in failures.items():
+        print(f"{app}: {error}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"profile": args.profile, "repeat": args.repeat, "results": rows, "failures": failures}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Circuit breaker and health tracking for the /deforestation model service.
+
+Every attempt of the pooled client is recorded with its outcome and latency in
+a rolling window. When too many recent attempts fail, the breaker opens and
+requests fail immediately with CircuitOpenError (a RequestException, so the
+apps take their local fallback path) instead of waiting for timeouts. After
+OPEN_SECONDS a few half-open probe requests are let through; a successful
+probe closes the breaker, a failed one opens it again.
+
+before_call() hands out a token of the breaker's current state (a
+generation, bumped on every transition), which the attempt passes back to
+record(). Results of attempts started in an earlier state, e.g. a slow
+request sent before the breaker opened, don't move the breaker.
+"""
+import threading
+import time
+from collections import deque
+
+import requests
+
+WINDOW_SECONDS = 60  # Attempts older than this are forgotten
+WINDOW_CALLS = 50  # At most this many attempts are kept
+MIN_CALLS = 5  # Attempts in the window before the error rate counts
+FAILURE_RATE = 0.5  # Error rate that opens the breaker
+OPEN_SECONDS = 30  # Time the breaker stays open before probing
+HALF_OPEN_PROBES = 1  # Concurrent probe requests while half-open
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """The breaker is open; the request was not sent."""
+
+    def __init__(self, retry_in):
+        super().__init__(f"Model service unavailable, retrying in {retry_in:.0f}s")
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Thread-safe breaker shared by every session of the server process."""
+
+    def __init__(
+        self,
+        window_seconds=WINDOW_SECONDS,
+        window_calls=WINDOW_CALLS,
+        min_calls=MIN_CALLS,
+        failure_rate=FAILURE_RATE,
+        open_seconds=OPEN_SECONDS,
+        half_open_probes=HALF_OPEN_PROBES,
+    ):
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self._lock = threading.Lock()
+        self._calls = deque(maxlen=window_calls)  # (finished_at, ok, latency)
+        self.state = CLOSED
+        self.opened_at = None
+        self._generation = 0  # Bumped on every state change; attempts carry the one they started in
+        self._probes = 0
+        self.last_error = None
+        self.rejected = 0  # Requests failed fast while open
+        self.times_opened = 0
+
+    def before_call(self):
+        """Token for record() if a request may be sent now, else raise CircuitOpenError.
+
+        While half-open the token admits one of the probes.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN:
+                retry_in = self.opened_at + self.open_seconds - now
+                if retry_in > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(retry_in)
+                self._transition(HALF_OPEN)
+                self._probes = 0
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    self.rejected += 1
+                    raise CircuitOpenError(0)
+                self._probes += 1
+            return self._generation
+
+    def record(self, token, ok, latency, error=None):
+        # Outcome of the attempt admitted with token
+        with self._lock:
+            now = time.monotonic()
+            if not ok:
+                self.last_error = error
+            if token != self._generation:
+                return  # Started before the last state change: neither a probe nor part of the current window
+            self._calls.append((now, ok, latency))
+            if self.state == HALF_OPEN:
+                if ok:
+                    self._transition(CLOSED)
+                    self._calls.clear()
+                else:
+                    self._open(now)
+            elif self.state == CLOSED and not ok:
+                calls = self._recent(now)
+                failures = sum(1 for _, call_ok, _ in calls if not call_ok)
+                if len(calls) >= self.min_calls and failures >= self.failure_rate * len(calls):
+                    self._open(now)
+
+    def snapshot(self):
+        # Current state and rolling statistics, for display
+        with self._lock:
+            now = time.monotonic()
+            calls = self._recent(now)
+            latencies = sorted(latency for _, _, latency in calls)
+            failures = sum(1 for _, ok, _ in calls if not ok)
+            return {
+                "state": self.state,
+                "window_calls": len(calls),
+                "error_rate": round(failures / len(calls), 3) if calls else 0.0,
+                "latency_p50_ms": _percentile_ms(latencies, 0.5),
+                "latency_p95_ms": _percentile_ms(latencies, 0.95),
+                "retry_in_s": (
+                    round(max(self.opened_at + self.open_seconds - now, 0), 1)
+                    if self.state == OPEN else None
+                ),
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+                "last_error": self.last_error,
+            }
+
+    def _open(self, now):
+        self._transition(OPEN)
+        self.opened_at = now
+        self.times_opened += 1
+
+    def _transition(self, state):
+        # Outstanding tokens no longer count, so every half-open period admits its own probes
+        self.state = state
+        self._generation += 1
+
+    def _recent(self, now):
+        return [call for call in self._calls if now - call[0] <= self.window_seconds]
+
+
+def _percentile_ms(sorted_values, q):
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)] * 1000, 1)
@@ -0,0 +1,183 @@
+"""Two-level result cache for the /deforestation API.
+
+Results are keyed by the snapped (latitude, longitude) grid cell of the cache's
+grid step (0.01° unless an area of interest uses another). Lookups hit an
+in-memory LRU first and fall back to a local SQLite file, so answers survive
+restarts and are shared by every session of the server process.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .grid import GRID_STEP, MISS, cell_key
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "deforestation.sqlite3")
+CACHE_PATH_ENV = "DEFORESTATION_CACHE_PATH"  # Overrides DEFAULT_CACHE_PATH
+DEFAULT_TTL = 7 * 24 * 3600  # Seconds a result stays valid
+DEFAULT_STALE_AFTER = 24 * 3600  # Seconds after which a valid result is refreshed in the background
+DEFAULT_MAX_ENTRIES = 50_000  # Rows kept per namespace in SQLite
+DEFAULT_MEMORY_ENTRIES = 4096  # Entries kept in the in-memory LRU
+TRIM_EVERY = 256  # Writes between size-cap/expiry sweeps
+
+
+class ResultCache:
+    """Deforestation percentages per grid cell, scoped by namespace (usually the API URL).
+
+    A stored value of None records that the service has no data for the cell.
+    Cells of another step than GRID_STEP are stored under a namespace of
+    their own, so caches of different grids never mix.
+    """
+
+    def __init__(
+        self,
+        path=None,
+        namespace="",
+        ttl=DEFAULT_TTL,
+        stale_after=DEFAULT_STALE_AFTER,
+        max_entries=DEFAULT_MAX_ENTRIES,
+        memory_entries=DEFAULT_MEMORY_ENTRIES,
+        step=GRID_STEP,
+    ):
+        # Resolved on construction, so the environment can change between caches (e.g. benchmarks)
+        path = path or os.environ.get(CACHE_PATH_ENV) or DEFAULT_CACHE_PATH
+        self.namespace = namespace if step == GRID_STEP else f"{namespace}#step={step:g}"
+        self.step = step
+        self.ttl = ttl
+        self.stale_after = stale_after
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                namespace TEXT NOT NULL,
+                lat_cell INTEGER NOT NULL,
+                lon_cell INTEGER NOT NULL,
+                value REAL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (namespace, lat_cell, lon_cell)
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_age ON results (namespace, fetched_at)")
+        self._db.commit()
+
+    def get(self, latitude, longitude):
+        key = cell_key(latitude, longitude, self.step)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, fetched_at = entry
+                if now - fetched_at < self.ttl:
+                    self._memory.move_to_end(key)
+                    return value
+                del self._memory[key]
+
+            row = self._db.execute(
+                "SELECT value, fetched_at FROM results WHERE namespace = ? AND lat_cell = ? AND lon_cell = ?",
+                (self.namespace, *key),
+            ).fetchone()
+            if row is None or now - row[1] >= self.ttl:
+                return MISS
+            self._remember(key, row[0], row[1])
+            return row[0]
+
+    def peek(self, latitude, longitude):
+        """(value, fetched_at) of the stored result, even an expired one, or MISS.
+
+        Doesn't touch the LRU order; for provisional answers and staleness checks.
+        """
+        key = cell_key(latitude, longitude, self.step)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                return entry
+            row = self._db.execute(
+                "SELECT value, fetched_at FROM results WHERE namespace = ? AND lat_cell = ? AND lon_cell = ?",
+                (self.namespace, *key),
+            ).fetchone()
+        return tuple(row) if row is not None else MISS
+
+    def needs_refresh(self, latitude, longitude):
+        # True when the stored result is older than stale_after (it may still be served until the TTL)
+        stored = self.peek(latitude, longitude)
+        return stored is not MISS and time.time() - stored[1] >= self.stale_after
+
+    def set(self, latitude, longitude, value):
+        key = cell_key(latitude, longitude, self.step)
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (namespace, lat_cell, lon_cell, value, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, *key, value, now),
+            )
+            self._writes += 1
+            if self._writes % TRIM_EVERY == 0:
+                self._trim(now)
+            self._db.commit()
+
+    def version(self):
+        # Changes whenever a result is added or refreshed, for keying derived data
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*), MAX(fetched_at) FROM results WHERE namespace = ?",
+                (self.namespace,),
+            ).fetchone()
+
+    def to_array(self, grid):
+        # Fresh cached values laid out on the grid (of the cache's step), NaN where nothing is known
+        return self.to_arrays(grid)[0]
+
+    def to_arrays(self, grid):
+        # (values, stored) on the grid: stored is True for every cell with a fresh result, "no data" (NaN) included
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT lat_cell, lon_cell, value FROM results WHERE namespace = ? AND fetched_at > ?",
+                (self.namespace, time.time() - self.ttl),
+            ).fetchall()
+        values = np.full(grid.shape, np.nan, dtype=np.float32)
+        stored = np.zeros(grid.shape, dtype=bool)
+        if rows:
+            cells = np.array(rows, dtype=np.float64)  # NULL values become NaN
+            row = cells[:, 0].astype(np.int64) - grid.lat_origin
+            col = cells[:, 1].astype(np.int64) - grid.lon_origin
+            inside = (row >= 0) & (row < grid.rows) & (col >= 0) & (col < grid.cols)
+            values[row[inside], col[inside]] = cells[inside, 2]
+            stored[row[inside], col[inside]] = True
+        return values, stored
+
+    def _remember(self, key, value, fetched_at):
+        self._memory[key] = (value, fetched_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _trim(self, now):
+        # Drop expired rows, then the oldest rows beyond the size cap
+        self._db.execute(
+            "DELETE FROM results WHERE namespace = ? AND fetched_at <= ?",
+            (self.namespace, now - self.ttl),
+        )
+        self._db.execute(
+            """
+            DELETE FROM results WHERE rowid IN (
+                SELECT rowid FROM results WHERE namespace = ?
+                ORDER BY fetched_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.namespace, self.max_entries),
+        )
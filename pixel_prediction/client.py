@@ -0,0 +1,137 @@
+"""Pooled keep-alive HTTP client for the /deforestation model service."""
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .metrics import registry, span
+
+CONNECT_TIMEOUT = 3.05  # Seconds to establish the connection
+READ_TIMEOUT = 30  # Seconds to wait for the model to answer
+POOL_SIZE = 32  # Keep-alive connections kept per host
+MAX_RETRIES = 3  # Retries after the first attempt
+BACKOFF_BASE = 0.5  # Seconds, doubled on every retry
+BACKOFF_CAP = 8  # Upper bound of a single backoff sleep
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        with span("api_connect"):
+            super().connect()
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        # Includes the TLS handshake
+        with span("api_connect"):
+            super().connect()
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter recording the time of every new connection as the "api_connect" span."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+class DeforestationClient:
+    """Thread-safe wrapper around a pooled requests.Session.
+
+    Connection failures and overload statuses are retried with full-jitter
+    exponential backoff. Read timeouts are not retried, so a stuck model call
+    costs at most one READ_TIMEOUT. With a breaker, every attempt is recorded
+    and attempts are refused with CircuitOpenError while it is open.
+
+    Each attempt records the "api_ttfb" span (request sent until the response
+    headers arrived, including a new connection) and "api_body" (reading the
+    rest of the response). requests counts the attempts sent, retries included.
+    """
+
+    def __init__(
+        self,
+        pool_size=POOL_SIZE,
+        max_retries=MAX_RETRIES,
+        backoff_base=BACKOFF_BASE,
+        backoff_cap=BACKOFF_CAP,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        breaker=None,
+    ):
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.timeout = (connect_timeout, read_timeout)
+        self.requests = 0
+        self._requests_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = TimedHTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def post(self, url, payload):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._attempt(url, payload)
+            except requests.exceptions.ConnectionError:
+                # Includes connect timeouts; the request never reached the model
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+            time.sleep(self.backoff(attempt))
+
+    def _attempt(self, url, payload):
+        token = self.breaker.before_call() if self.breaker is not None else None
+        with self._requests_lock:
+            self.requests += 1
+        started = time.monotonic()
+        try:
+            response = self.session.post(url, json=payload, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            if self.breaker is not None:
+                self.breaker.record(token, False, time.monotonic() - started, f"{type(e).__name__}: {e}")
+            raise
+        elapsed = time.monotonic() - started
+        ttfb = min(response.elapsed.total_seconds(), elapsed)
+        registry.observe("api_ttfb", ttfb)
+        registry.observe("api_body", elapsed - ttfb)
+        if self.breaker is None:
+            return response
+        # 404 (no data) is a healthy answer; overload and server errors are not
+        failed = response.status_code in RETRY_STATUSES or response.status_code >= 500
+        self.breaker.record(token, not failed, elapsed, f"HTTP {response.status_code}" if failed else None)
+        return response
+
+    def preconnect(self, url):
+        # Open a pooled connection (and wake the service) before the first request; the answer doesn't matter
+        try:
+            self.session.head(url, timeout=self.timeout).close()
+        except requests.exceptions.RequestException:
+            pass
+
+    def backoff(self, attempt):
+        # Full jitter: uniform between 0 and the capped exponential delay
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,436 @@
+"""Shared core of the Streamlit apps: configuration, widgets, map and analysis handling.
+
+Every app variant builds its page from these pieces, so a change here (and
+any optimization) reaches all of them. folium and streamlit_folium take about
+two seconds to import, so they are imported on first use; warm_up() loads
+them, builds the base map and opens the HTTP pool in the background as soon
+as the first session of the server process starts.
+"""
+import importlib
+import os
+import threading
+import time
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx
+
+from .api import NoDataError, configured_api_url, get_deforestation, lookup_deforestation
+from .grid import GRID_STEP, LATITUDE_RANGE, LONGITUDE_RANGE, MISS, Grid, neighbour_cells
+from .heat_tiles import heat_tile_layer, heat_tiles_url
+from .heatmap import heatmap_bounds, heatmap_overlay
+from .jobs import PREFETCH_BATCH_WORKERS, PREFETCH_WORKERS, submit_analysis, submit_prefetch
+from .metrics import span
+from .resources import (
+    get_aoi_registry,
+    get_batcher,
+    get_estimate,
+    get_grid_lookup,
+    get_heatmap,
+    get_http_client,
+    get_level_heatmap,
+    get_plausible,
+    get_result_cache,
+)
+from .tile_cache import proxied_tiles
+
+# API URL (set DEFORESTATION_API_URL to use another endpoint, e.g. the local mock server)
+API_URL = configured_api_url()
+
+AOI_CENTER = ((LATITUDE_RANGE[0] + LATITUDE_RANGE[1]) / 2, (LONGITUDE_RANGE[0] + LONGITUDE_RANGE[1]) / 2)
+DEFAULT_LOCATION = (-3.85, -54.84)  # Preselected point of the apps that start with one
+DEFAULT_ZOOM = 9
+MAP_HEIGHT = 500
+MAP_WIDTH = 700
+
+# Rings of cells prefetched around an analysed point (set DEFORESTATION_PREFETCH_RADIUS=0 to turn off)
+PREFETCH_RADIUS = int(os.environ.get("DEFORESTATION_PREFETCH_RADIUS", 1))
+
+# Imported by warm_up() before the first map is shown
+WARM_MODULES = ("folium", "folium.plugins", "streamlit_folium", "requests")
+
+ESTIMATE_NOTE = "Interpolated from {} nearby cells, not a model prediction."
+PROVISIONAL_NOTE = "Provisional: {}. The model's answer replaces it when it arrives."
+
+
+def init_session_state(defaults):
+    # Set every key that the session doesn't have yet
+    for key, value in defaults.items():
+        if key not in st.session_state:
+            st.session_state[key] = value
+
+
+def show_header():
+    # Title and about section shared by the full-page apps
+    st.title("🌳 Deforestation Analysis Tool")
+    st.markdown("Analyze deforestation trends in the Amazon region by selecting coordinates within the defined area of interest.")
+
+    st.subheader("🌱 About This Tool")
+    st.markdown(
+        """
+        This tool provides insights into deforestation trends in the Amazon rainforest, a critical ecosystem for global climate regulation, biodiversity,
+        and the livelihoods of indigenous communities. By selecting coordinates within a defined area of interest, you can access data on deforestation
+        percentage changes over time. Understanding these patterns is essential for driving effective conservation strategies and mitigating climate change impacts.
+        """
+    )
+
+
+def coordinate_inputs(latitude=None, longitude=None):
+    """Latitude and longitude number inputs side by side, limited to the areas of interest.
+
+    Without initial values the boxes show their session state ("lat_input_box"
+    and "lon_input_box").
+    """
+    latitude_range, longitude_range = get_aoi_registry().bounds()
+    col_input1, col_input2 = st.columns(2)
+    with col_input1:
+        lat_input = st.number_input(
+            "Latitude",
+            min_value=latitude_range[0],
+            max_value=latitude_range[1],
+            step=0.01,
+            format="%.2f",
+            key="lat_input_box",
+            **({"value": latitude} if latitude is not None else {}),
+        )
+    with col_input2:
+        lon_input = st.number_input(
+            "Longitude",
+            min_value=longitude_range[0],
+            max_value=longitude_range[1],
+            step=0.01,
+            format="%.2f",
+            key="lon_input_box",
+            **({"value": longitude} if longitude is not None else {}),
+        )
+    return lat_input, lon_input
+
+
+def find_aoi(latitude, longitude):
+    # The registered area containing the coordinates (through the registry's bucket index), or None
+    return get_aoi_registry().find(latitude, longitude)
+
+
+def in_aoi(latitude, longitude):
+    return find_aoi(latitude, longitude) is not None
+
+
+def aoi_route(api_url, latitude, longitude):
+    """(area, endpoint, grid step) of a lookup of the coordinates.
+
+    The area containing them (None outside every area), its endpoint (the
+    app's own if it has none) and the step its cells are snapped to.
+    """
+    aoi = find_aoi(latitude, longitude)
+    if aoi is None:
+        return None, api_url, GRID_STEP
+    return aoi, aoi.api_url or api_url, aoi.step
+
+
+def require_aoi_config():
+    # The area registry; stops the page with the reason when $DEFORESTATION_AOI_CONFIG can't be loaded
+    try:
+        return get_aoi_registry()
+    except (OSError, ValueError) as e:
+        st.error(f"Invalid area of interest configuration: {e}")
+        st.stop()
+
+
+def clicked_location(map_data):
+    # The last map click rounded to the 0.01° grid, or None
+    if not map_data or not map_data.get("last_clicked"):
+        return None
+    return round(map_data["last_clicked"]["lat"], 2), round(map_data["last_clicked"]["lng"], 2)
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def build_base_map(
+    tiles="OpenStreetMap",
+    attr=None,
+    highlight_aoi=False,
+    draw=False,
+    scale_bar=False,
+    heat_tiles=None,
+    areas=None,
+):
+    """Static layers of the map, built once per areas and options.
+
+    Every rerun gets its own copy; the selected location and the heatmap
+    image are added by render_map() as dynamic layers, so the browser doesn't
+    reload the map (and lose its pan and zoom) when they change.
+    """
+    import folium
+
+    m = folium.Map(location=list(AOI_CENTER), zoom_start=DEFAULT_ZOOM, tiles=tiles, attr=attr)
+
+    # Areas of interest (label, bounds): light filled boxes with a tooltip, or just their boundaries
+    default_bounds = [[LATITUDE_RANGE[0], LONGITUDE_RANGE[0]], [LATITUDE_RANGE[1], LONGITUDE_RANGE[1]]]
+    for label, bounds in areas or (("Area of Interest", default_bounds),):
+        if highlight_aoi:
+            folium.Rectangle(bounds=bounds, color="blue", fill=True, fill_opacity=0.1, tooltip=label).add_to(m)
+        else:
+            folium.Rectangle(bounds=bounds, color="blue", weight=2, fill=False, tooltip=label).add_to(m)
+
+    # Deforestation heatmap as XYZ tiles of the visible area, from the tile endpoint
+    if heat_tiles is not None:
+        heat_tile_layer(heat_tiles, heatmap_bounds(Grid())).add_to(m)
+
+    # Polygon and rectangle tools for the area analysis
+    if draw:
+        from folium.plugins import Draw
+        Draw(
+            draw_options={
+                "polyline": False,
+                "circle": False,
+                "marker": False,
+                "circlemarker": False,
+            },
+            edit_options={"edit": False},
+        ).add_to(m)
+
+    # Add a scale to the map (folium.plugins.ScaleBar is new in folium 0.19; older versions go without)
+    if scale_bar:
+        try:
+            from folium.plugins import ScaleBar
+        except ImportError:
+            ScaleBar = None
+        if ScaleBar is not None:
+            ScaleBar(position="bottomright").add_to(m)
+    return m
+
+
+def get_base_map(api_url, heatmap=True, **options):
+    """The cached base map of the app's options.
+
+    Base map tiles go through the local proxy if one is set. With heatmap, the
+    deforestation heatmap is a tile layer of the base map if a tile endpoint
+    is set ($DEFORESTATION_HEAT_TILES), otherwise heatmap_layer() draws it.
+    Without heatmap, the app adds its own (see level_heatmap_layer()).
+    """
+    options["tiles"], options["attr"] = proxied_tiles(options.get("tiles", "OpenStreetMap"), options.get("attr"))
+    options["areas"] = tuple((aoi.label, tuple(map(tuple, aoi.bounds()))) for aoi in get_aoi_registry())
+    with span("map_build"):
+        return build_base_map(heat_tiles=heat_tiles_url() if heatmap else None, **options)
+
+
+def selection_layer(latitude, longitude):
+    # Marker for the selected location, empty without one
+    import folium
+
+    layer = folium.FeatureGroup(name="Selection")
+    if latitude and longitude:
+        folium.Marker(
+            [latitude, longitude],
+            tooltip=f"Latitude: {latitude}, Longitude: {longitude}",
+        ).add_to(layer)
+    return layer
+
+
+def heatmap_layer(api_url):
+    """Dynamic layer with the heatmap image of the API's results, for render_map().
+
+    Empty when the heatmap comes from the tile endpoint or nothing is known
+    yet. The image is encoded once per grid/cache version (see get_heatmap()).
+    """
+    import folium
+
+    layer = folium.FeatureGroup(name="Deforestation heatmap")
+    heatmap = None if heat_tiles_url() else get_heatmap(api_url)
+    if heatmap is not None:
+        heatmap_overlay(*heatmap).add_to(layer)
+    return layer
+
+
+def level_heatmap_layer(api_url, zoom):
+    """(layer, block factor) of the heatmap at the pyramid level suited to the zoom.
+
+    A dynamic layer for render_map(), so a level change doesn't reload the map.
+    """
+    import folium
+
+    factor, heatmap = get_level_heatmap(api_url, zoom)
+    layer = folium.FeatureGroup(name="Deforestation heatmap")
+    if heatmap is not None:
+        heatmap_overlay(*heatmap).add_to(layer)
+    return layer, factor
+
+
+def sync_map_zoom(map_data, key="map_zoom"):
+    """Follow the user's zooming in st.session_state[key]; returns whether it changed.
+
+    Only a zoom that differs from the map's previous answer counts, so a zoom
+    the app just set (and the browser hasn't applied yet) isn't overwritten.
+    The first answer is the base map's default zoom and only recorded.
+    """
+    zoom = map_data.get("zoom") if map_data else None
+    if zoom is None or zoom == st.session_state.get("returned_zoom"):
+        return False
+    first = "returned_zoom" not in st.session_state
+    st.session_state["returned_zoom"] = zoom
+    if first:
+        return False
+    changed = zoom != st.session_state[key]
+    st.session_state[key] = zoom
+    return changed
+
+
+def render_map(base_map, selection=None, returned_objects=(), **kwargs):
+    # Show the map with the dynamic layer(s) of selection (e.g. the marker and heatmap); only the returned_objects of an interaction trigger a rerun
+    from streamlit_folium import st_folium
+
+    with span("map_render"):
+        return st_folium(
+            base_map,
+            height=MAP_HEIGHT,
+            width=MAP_WIDTH,
+            returned_objects=list(returned_objects),
+            feature_group_to_add=selection,
+            render=False,
+            **kwargs,
+        )
+
+
+def start_analysis(api_url, latitude, longitude, local_grid=False):
+    # Look the location up in the background, with the endpoint, cells and grid of its area; the page reruns when it is done
+    aoi, api_url, step = aoi_route(api_url, latitude, longitude)
+    submit_analysis(
+        (latitude, longitude),
+        lookup_deforestation,
+        api_url,
+        latitude,
+        longitude,
+        cache=get_result_cache(api_url, step),
+        client=get_http_client(api_url),
+        grid=get_grid_lookup(aoi.grid_path) if local_grid and aoi is not None else None,
+        step=step,
+    )
+
+
+def start_prefetch(api_url, latitude, longitude, radius=PREFETCH_RADIUS, local_grid=False):
+    """Fill the cache with the cells around the point in the background, at low priority.
+
+    Cells the grid or the cache already answer are skipped. Returns the
+    number of cells queued. The ring is clipped to the point's area.
+    """
+    aoi, api_url, step = aoi_route(api_url, latitude, longitude)
+    if aoi is None:
+        return 0
+    cache = get_result_cache(api_url, step)
+    grid = get_grid_lookup(aoi.grid_path) if local_grid else None
+    cells = [
+        cell for cell in neighbour_cells(latitude, longitude, radius, step, aoi.latitude_range, aoi.longitude_range)
+        if (grid is None or grid.get(*cell) is MISS) and cache.get(*cell) is MISS
+    ]
+    if cells:
+        batcher = get_batcher(api_url)
+        submit_prefetch(
+            (latitude, longitude),
+            cells,
+            get_deforestation,
+            api_url,
+            # More lookups in flight only while they share batch requests; single-point ones stay at two
+            workers=PREFETCH_WORKERS if batcher.supported is False else PREFETCH_BATCH_WORKERS,
+            cache=cache,
+            client=get_http_client(api_url),
+            grid=grid,
+            batcher=batcher,
+            step=step,
+            prefetch=True,
+        )
+    return len(cells)
+
+
+def analysis_outcome(job, api_url, latitude, longitude, plausible=False):
+    """(value, cells used, error) of a finished analysis job.
+
+    On success error is None and the value is the model's, or with plausible
+    an interpolation replacing an implausible one (then cells used is set). On
+    failure error is the exception (NoDataError, APIError, a ValueError or a
+    requests exception) and the value an interpolation from the known
+    neighbours, or None when there is nothing to interpolate from.
+    """
+    import requests
+
+    aoi, api_url, _ = aoi_route(api_url, latitude, longitude)
+    try:
+        value, _ = job.result()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        estimate = get_estimate(api_url, latitude, longitude, aoi=aoi)
+        return (*(estimate or (None, None)), e)
+    if plausible:
+        return (*get_plausible(api_url, latitude, longitude, value, aoi=aoi), None)
+    return value, None, None
+
+
+def analysis_source(job):
+    # Where the finished analysis job was answered ("grid", "cache" or "service"), None when the lookup failed
+    error = job.exception()
+    if error is None:
+        return job.result()[1]
+    return error.source if isinstance(error, NoDataError) else None
+
+
+def provisional_result(api_url, latitude, longitude):
+    """(value, source description) to show while the analysis runs, or None.
+
+    The last stored result of the cell, even an expired one, else the
+    interpolation from the known neighbours in its area.
+    """
+    aoi, api_url, step = aoi_route(api_url, latitude, longitude)
+    stored = get_result_cache(api_url, step).peek(latitude, longitude)
+    if stored is not MISS and stored[0] is not None:
+        return stored[0], f"last result for this cell, {_age_text(time.time() - stored[1])} old"
+    estimate = get_estimate(api_url, latitude, longitude, aoi=aoi)
+    if estimate is not None:
+        return estimate[0], f"interpolated from {estimate[1]} nearby cells"
+    return None
+
+
+def _age_text(seconds):
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} min"
+    if seconds < 24 * 3600:
+        return f"{seconds / 3600:.0f} h"
+    return f"{seconds / (24 * 3600):.0f} days"
+
+
+def show_analysis_progress(api_url, latitude, longitude, container=st):
+    # While the analysis runs: a provisional answer when there is one, replaced on the rerun with the result
+    container.info("⏳ Analyzing deforestation trends...")
+    provisional = provisional_result(api_url, latitude, longitude)
+    if provisional is not None:
+        value, source = provisional
+        container.markdown(describe_change(value)[1])
+        container.caption(PROVISIONAL_NOTE.format(source))
+
+
+def describe_change(percentage):
+    # (message kind, text) for a percentage of change between 2016 and 2021
+    if percentage == 0:
+        return "info", "🌍 There was no significant change in deforestation between 2016 and 2021."
+    if percentage < 0:
+        return "success", f"🌍 In this area, there was a deforestation of **{-percentage:.2f}%** of the area between 2016 and 2021."
+    return "success", f"🌍 In this area, there was a recovery of **{percentage:.2f}%** of the deforested area between 2016 and 2021."
+
+
+def _warm_up(api_url, map_options):
+    for name in WARM_MODULES:
+        importlib.import_module(name)
+    get_base_map(api_url, **map_options)
+    if map_options.get("heatmap", True) and not heat_tiles_url():
+        get_heatmap(api_url)
+    get_http_client(api_url).preconnect(api_url)
+
+
+@st.cache_resource
+def warm_up(api_url, **map_options):
+    """Prepare the server process for the app's first page, once per API and map options.
+
+    Imports the map libraries, builds the base map and opens a connection to
+    the model service in a background thread, while the first session renders
+    everything above the map. Streamlit has no server start hook, so this
+    runs with the first session of the process.
+    """
+    thread = threading.Thread(target=_warm_up, args=(api_url, map_options), name="warm-up", daemon=True)
+    add_script_run_ctx(thread)
+    thread.start()
+    return thread
@@ -0,0 +1,54 @@
+"""Local estimate of the deforestation percentage from already known cells.
+
+Used when the service fails or returns an implausible value: the percentage is
+interpolated by inverse-distance weighting over the known cells in a fixed
+window around the requested one. The window is sliced straight out of the
+grid array, so an estimate costs the same regardless of how many cells are
+known, and the same inputs always give the same answer.
+"""
+import numpy as np
+
+ESTIMATE_RADIUS = 5  # Cells searched in each direction around the requested cell
+ESTIMATE_POWER = 2  # Inverse-distance weighting exponent
+PLAUSIBLE_LIMIT = 100  # Known values at or beyond +/- this are not used
+
+
+def estimate_deforestation(
+    values,
+    grid,
+    latitude,
+    longitude,
+    radius=ESTIMATE_RADIUS,
+    power=ESTIMATE_POWER,
+    exclude_cell=False,
+):
+    """(estimate, number of cells used) for the coordinates, or None.
+
+    values is a grid.shape array with NaN where nothing is known. The cell's
+    own value is returned as is when known, unless exclude_cell is set (to
+    replace an implausible value by what its neighbours suggest). None when
+    the coordinates are outside the grid or no usable cell is within radius.
+    """
+    index = grid.index(latitude, longitude)
+    if index is None:
+        return None
+    row, col = index
+    top, bottom = max(row - radius, 0), min(row + radius + 1, grid.rows)
+    left, right = max(col - radius, 0), min(col + radius + 1, grid.cols)
+
+    window = np.asarray(values[top:bottom, left:right], dtype=np.float64)
+    rows, cols = np.mgrid[top:bottom, left:right]
+    distance2 = (rows - row) ** 2 + (cols - col) ** 2
+
+    usable = np.abs(window) < PLAUSIBLE_LIMIT  # Also False for NaN
+    if exclude_cell:
+        usable &= distance2 > 0
+    if not usable.any():
+        return None
+    known, distance2 = window[usable], distance2[usable]
+
+    own = distance2 == 0
+    if own.any():
+        return float(known[own][0]), 1
+    weights = distance2 ** (-power / 2)
+    return float(np.dot(weights, known) / weights.sum()), int(known.size)
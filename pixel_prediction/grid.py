@@ -0,0 +1,185 @@
+"""Helpers for the 0.01° grid the deforestation service is queried on."""
+import json
+import os
+
+import numpy as np
+
+GRID_STEP = 0.01
+
+# Default area of interest in the Amazon (min, max)
+LATITUDE_RANGE = (-4.39, -3.33)
+LONGITUDE_RANGE = (-55.2, -54.48)
+
+GRID_FORMAT_VERSION = 1
+
+# Returned by lookups (grid or cache) that have nothing stored for the cell
+MISS = object()
+
+
+def cell_index(value, step=GRID_STEP):
+    # Index of the grid line nearest to the value
+    return int(round(value / step))
+
+
+def cell_key(latitude, longitude, step=GRID_STEP):
+    return cell_index(latitude, step), cell_index(longitude, step)
+
+
+def snap(value, step=GRID_STEP):
+    # Coordinate of the grid line nearest to the value
+    return round(cell_index(value, step) * step, 6)
+
+
+def neighbour_cells(latitude, longitude, radius=1, step=GRID_STEP,
+                    latitude_range=LATITUDE_RANGE, longitude_range=LONGITUDE_RANGE):
+    # Snapped (latitude, longitude) of the cells within radius steps around the point's cell, nearest first
+    lat_cell, lon_cell = cell_key(latitude, longitude, step)
+    offsets = sorted(
+        ((d_lat, d_lon) for d_lat in range(-radius, radius + 1) for d_lon in range(-radius, radius + 1) if d_lat or d_lon),
+        key=lambda offset: offset[0] ** 2 + offset[1] ** 2,
+    )
+    cells = [(round((lat_cell + d_lat) * step, 6), round((lon_cell + d_lon) * step, 6)) for d_lat, d_lon in offsets]
+    return [
+        (lat, lon) for lat, lon in cells
+        if latitude_range[0] <= lat <= latitude_range[1] and longitude_range[0] <= lon <= longitude_range[1]
+    ]
+
+
+class Grid:
+    """Regular latitude/longitude grid covering an area of interest.
+
+    Row 0 is the southern edge and column 0 the western edge, so a cell's
+    array index is its offset in steps from the (min latitude, min longitude)
+    corner.
+    """
+
+    def __init__(self, latitude_range=LATITUDE_RANGE, longitude_range=LONGITUDE_RANGE, step=GRID_STEP):
+        self.latitude_range = tuple(latitude_range)
+        self.longitude_range = tuple(longitude_range)
+        self.step = step
+        self.lat_origin = cell_index(latitude_range[0], step)
+        self.lon_origin = cell_index(longitude_range[0], step)
+        self.rows = cell_index(latitude_range[1], step) - self.lat_origin + 1
+        self.cols = cell_index(longitude_range[1], step) - self.lon_origin + 1
+
+    @property
+    def shape(self):
+        return self.rows, self.cols
+
+    @property
+    def size(self):
+        return self.rows * self.cols
+
+    def index(self, latitude, longitude):
+        # (row, col) of the cell containing the coordinates, or None outside the grid
+        row = cell_index(latitude, self.step) - self.lat_origin
+        col = cell_index(longitude, self.step) - self.lon_origin
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return row, col
+        return None
+
+    def coordinates(self, row, col):
+        return (
+            round((self.lat_origin + row) * self.step, 6),
+            round((self.lon_origin + col) * self.step, 6),
+        )
+
+    def cells(self):
+        # Every (row, col, latitude, longitude) of the grid in row-major order
+        for row in range(self.rows):
+            for col in range(self.cols):
+                yield (row, col, *self.coordinates(row, col))
+
+    def to_header(self):
+        return {
+            "latitude_range": list(self.latitude_range),
+            "longitude_range": list(self.longitude_range),
+            "step": self.step,
+            "shape": list(self.shape),
+        }
+
+    @classmethod
+    def from_header(cls, header):
+        return cls(header["latitude_range"], header["longitude_range"], header["step"])
+
+
+def grid_paths(path):
+    # Array and header file paths for a grid file prefix such as "data/grid"
+    base, ext = os.path.splitext(path)
+    if ext not in (".npy", ".json"):
+        base = path
+    return base + ".npy", base + ".json"
+
+
+def save_grid(path, values, grid, unknown=None, **metadata):
+    """Write a float32 grid array (NaN for missing cells) and its JSON header.
+
+    unknown is an optional boolean mask of the cells that have no answer yet
+    (failed in the sweep); they are listed in the header, so their NaN is not
+    taken for "no data". Both files are written to temporary names first and
+    moved into place, so readers never see a half-written grid.
+    """
+    array_path, header_path = grid_paths(path)
+    if os.path.dirname(array_path):
+        os.makedirs(os.path.dirname(array_path), exist_ok=True)
+    values = np.asarray(values, dtype=np.float32)
+    if values.shape != grid.shape:
+        raise ValueError(f"Grid values have shape {values.shape}, expected {grid.shape}")
+
+    header = {"format_version": GRID_FORMAT_VERSION, **grid.to_header(), **metadata}
+    header["missing_cells"] = int(np.isnan(values).sum())
+    header["unknown_cells"] = np.argwhere(unknown).tolist() if unknown is not None else []
+
+    with open(array_path + ".tmp", "wb") as f:
+        np.save(f, values)
+    with open(header_path + ".tmp", "w") as f:
+        json.dump(header, f, indent=2)
+    os.replace(array_path + ".tmp", array_path)
+    os.replace(header_path + ".tmp", header_path)
+    return array_path, header_path
+
+
+def load_grid(path, mmap=True):
+    # (values, grid, header) for a grid written by save_grid
+    array_path, header_path = grid_paths(path)
+    with open(header_path) as f:
+        header = json.load(f)
+    if header.get("format_version") != GRID_FORMAT_VERSION:
+        raise ValueError(f"Unsupported grid format version: {header.get('format_version')}")
+    values = np.load(array_path, mmap_mode="r" if mmap else None)
+    grid = Grid.from_header(header)
+    if values.shape != grid.shape:
+        raise ValueError(f"Grid array has shape {values.shape}, header says {grid.shape}")
+    return values, grid, header
+
+
+def unknown_mask(grid, header):
+    # Boolean mask of the cells the header lists as unknown (NaN without an answer, not "no data")
+    mask = np.zeros(grid.shape, dtype=bool)
+    cells = header.get("unknown_cells") or []
+    if cells:
+        rows, cols = zip(*cells)
+        mask[list(rows), list(cols)] = True
+    return mask
+
+
+class GridLookup:
+    """Read-only, memory-mapped view of a precomputed grid.
+
+    get() mirrors ResultCache.get: the value for the cell, None where the grid
+    has no data, or MISS for coordinates outside the grid and for unknown
+    cells (failed in the sweep). The array is shared through the page cache,
+    so resident memory does not grow with sessions.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.values, self.grid, self.header = load_grid(path, mmap=True)
+        self.unknown = unknown_mask(self.grid, self.header)
+
+    def get(self, latitude, longitude):
+        index = self.grid.index(latitude, longitude)
+        if index is None or self.unknown[index]:
+            return MISS
+        value = float(self.values[index])
+        return None if value != value else value  # NaN means no data
@@ -0,0 +1,219 @@
+"""XYZ tile pyramid of the deforestation grid.
+
+The single heatmap image of the area of interest is coarse when zoomed in and
+is shipped whole with every map. Rendered into 256 px web mercator tiles per
+zoom level instead, the browser loads only the tiles in view, at the
+resolution of the current zoom:
+
+    python -m pixel_prediction.heat_tiles build --grid data/grid --zooms 8 14
+    python -m pixel_prediction.heat_tiles serve --port 8766
+    DEFORESTATION_HEAT_TILES=http://127.0.0.1:8766 streamlit run app_with_clicking.py
+
+The grid is colour-mapped like the heatmap and every tile is resampled from
+it with NumPy (nearest cell of every pixel centre); the PNG encoding is spread
+over a process pool. Tiles are kept in an MBTiles file and served by the same kind of
+endpoint as the base map tile cache. Without a grid the results cached for
+the API URL are rendered.
+"""
+import argparse
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+
+from .api import configured_api_url
+from .cache import ResultCache
+from .grid import Grid, load_grid
+from .heatmap import HEATMAP_OPACITY, colorize, heatmap_bounds
+from .tile_cache import DEFAULT_TILE_DIR, TileStore, aoi_tiles, make_handler
+
+LAYER = "deforestation"
+HEAT_TILES_ENV = "DEFORESTATION_HEAT_TILES"  # Base URL of a running endpoint, e.g. http://127.0.0.1:8766
+DEFAULT_PYRAMID_PATH = os.path.join(DEFAULT_TILE_DIR, f"{LAYER}.mbtiles")
+HEAT_ZOOMS = (8, 14)  # Zoom levels rendered by default, inclusive; a cell is ~115 px wide at 14
+TILE_SIZE = 256
+TILE_CACHE_SECONDS = 300  # Short, as the pyramid is rebuilt when the grid changes
+
+# Colorized grid shared by the tile rendering processes, set by _init_worker
+_worker_colors = None
+_worker_grid = None
+
+
+def heat_tiles_url(base=None):
+    # XYZ URL template of the deforestation tiles, or None when no endpoint is configured
+    base = base or os.environ.get(HEAT_TILES_ENV)
+    if not base:
+        return None
+    return f"{base.rstrip('/')}/{LAYER}/{{z}}/{{x}}/{{y}}.png"
+
+
+def heat_tile_layer(url, bounds, opacity=HEATMAP_OPACITY, zooms=HEAT_ZOOMS):
+    # Overlay loading the tiles in view; zoomed past the pyramid the deepest tiles are scaled up
+    import folium
+
+    return folium.TileLayer(
+        tiles=url,
+        attr="Deforestation model",
+        name="Deforestation heatmap",
+        overlay=True,
+        opacity=opacity,
+        min_zoom=zooms[0],
+        max_native_zoom=zooms[1],
+        bounds=bounds,
+    )
+
+
+def resample_tile(cells, grid, zoom, x, y, fill=np.nan):
+    """Cell array (values or colours per grid cell) resampled onto the pixels of the tile.
+
+    Web mercator pixel columns only depend on the longitude and rows only on
+    the latitude, so the cell of every pixel comes from two index vectors of
+    TILE_SIZE, gathered with one take() per axis. Pixels outside the grid are
+    set to fill, from an extra row and column padded onto the cells.
+    """
+    pixels = np.arange(TILE_SIZE) + 0.5
+    n = TILE_SIZE * 2 ** zoom
+    longitudes = (x * TILE_SIZE + pixels) / n * 360 - 180
+    latitudes = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y * TILE_SIZE + pixels) / n))))
+    rows = np.rint(latitudes / grid.step).astype(np.int64) - grid.lat_origin
+    cols = np.rint(longitudes / grid.step).astype(np.int64) - grid.lon_origin
+    rows[(rows < 0) | (rows >= grid.rows)] = grid.rows
+    cols[(cols < 0) | (cols >= grid.cols)] = grid.cols
+
+    padded = np.full((grid.rows + 1, grid.cols + 1) + cells.shape[2:], fill, dtype=cells.dtype)
+    padded[:-1, :-1] = cells
+    return padded.take(rows, axis=0).take(cols, axis=1)
+
+
+def render_tile(colors, grid, zoom, x, y):
+    # PNG bytes of the tile from the colorized grid, or None when it has no data
+    from branca.utilities import write_png
+
+    rgba = resample_tile(colors, grid, zoom, x, y, fill=0)
+    if not rgba[..., 3].any():
+        return None
+    return write_png(rgba)  # Row 0 of a tile is its northern edge
+
+
+def empty_tile():
+    # Transparent tile answered for positions without data
+    from branca.utilities import write_png
+
+    return write_png(np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8))
+
+
+def _init_worker(values, grid):
+    # Colour-map the grid once per process; tiles then only gather cell colours
+    global _worker_colors, _worker_grid
+    _worker_colors, _worker_grid = colorize(values), grid
+
+
+def _render_column(zoom, x, ys):
+    # Rendered (zoom, x, y, png) tiles of one tile column, skipping empty ones
+    rendered = []
+    for y in ys:
+        data = render_tile(_worker_colors, _worker_grid, zoom, x, y)
+        if data is not None:
+            rendered.append((zoom, x, y, data))
+    return rendered
+
+
+def build_pyramid(values, grid, path=DEFAULT_PYRAMID_PATH, zooms=range(HEAT_ZOOMS[0], HEAT_ZOOMS[1] + 1), workers=None):
+    """Render every tile of the grid at the zoom levels into the MBTiles file at path.
+
+    Tiles of a previous build are replaced. Returns the number of tiles stored.
+    """
+    zooms = list(zooms)
+    bounds = heatmap_bounds(grid)
+    columns = defaultdict(list)
+    for zoom, x, y in aoi_tiles(zooms, (bounds[0][0], bounds[1][0]), (bounds[0][1], bounds[1][1])):
+        columns[zoom, x].append(y)
+
+    store = TileStore(path, LAYER, layer_type="overlay")
+    store.clear()
+    stored = 0
+    values = np.asarray(values, dtype=np.float32)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(values, grid)) as pool:
+        futures = [pool.submit(_render_column, zoom, x, ys) for (zoom, x), ys in columns.items()]
+        for future in futures:
+            tiles = future.result()
+            store.put_many(tiles)
+            stored += len(tiles)
+    store.set_metadata(
+        bounds=f"{bounds[0][1]},{bounds[0][0]},{bounds[1][1]},{bounds[1][0]}",  # left, bottom, right, top
+        minzoom=min(zooms),
+        maxzoom=max(zooms),
+        built_at=int(time.time()),
+    )
+    return stored
+
+
+class PyramidTiles:
+    """The deforestation tiles of an MBTiles file, as served by make_handler()."""
+
+    def __init__(self, path=DEFAULT_PYRAMID_PATH):
+        self.stores = {LAYER: TileStore(path, LAYER, layer_type="overlay")}
+        self.empty = empty_tile()
+
+    def get(self, source, zoom, x, y):
+        # Tiles around the data are transparent rather than missing, so the browser doesn't retry them
+        return self.stores[source].get(zoom, x, y) or self.empty
+
+
+def serve(host="127.0.0.1", port=8766, path=DEFAULT_PYRAMID_PATH):
+    """Start the tile endpoint in a background thread and return it (call shutdown() to stop)."""
+    server = ThreadingHTTPServer((host, port), make_handler(PyramidTiles(path), cache_seconds=TILE_CACHE_SECONDS))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="heat-tiles", daemon=True).start()
+    return server
+
+
+def load_values(grid_path=None, api_url=None):
+    # (values, grid) of the precomputed grid, or of the results cached for the API URL
+    if grid_path:
+        values, grid, _ = load_grid(grid_path)
+        return values, grid
+    grid = Grid()
+    return ResultCache(namespace=api_url).to_array(grid), grid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and serve XYZ tiles of the deforestation grid.")
+    parser.add_argument("--output", default=DEFAULT_PYRAMID_PATH, help="MBTiles file of the tiles")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser("build", help="Render the tile pyramid")
+    build_parser.add_argument("--grid", default=os.environ.get("DEFORESTATION_GRID"), help="Grid file prefix, defaults to $DEFORESTATION_GRID")
+    build_parser.add_argument("--api-url", default=configured_api_url(), help="Render the cached results of this API without a grid")
+    build_parser.add_argument("--zooms", type=int, nargs=2, default=HEAT_ZOOMS, metavar=("MIN", "MAX"))
+    build_parser.add_argument("--workers", type=int, default=None, help="Rendering processes (default: one per CPU)")
+
+    serve_parser = commands.add_parser("serve", help="Serve the tiles on a local XYZ URL")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        values, grid = load_values(args.grid, args.api_url)
+        started = time.perf_counter()
+        stored = build_pyramid(values, grid, args.output, range(args.zooms[0], args.zooms[1] + 1), args.workers)
+        print(f"Stored {stored} tiles in {args.output} ({time.perf_counter() - started:.1f} s)")
+        return
+
+    server = serve(args.host, args.port, args.output)
+    url = f"http://{args.host}:{server.server_port}"
+    print(f"Deforestation tiles on {heat_tiles_url(url)}")
+    print(f"Point the apps at it with {HEAT_TILES_ENV}={url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Raster heatmap of the deforestation grid for the folium maps.
+
+The whole grid is colour-mapped with NumPy and encoded into one PNG, which is
+far cheaper to ship and render than a vector shape per cell.
+"""
+import base64
+
+import numpy as np
+
+# Diverging colour stops: deforestation (negative) in red, recovery (positive) in green
+COLOR_STOPS = np.array([-100.0, -50.0, 0.0, 50.0, 100.0])
+COLORS = np.array(
+    [
+        [165, 0, 38],
+        [244, 109, 67],
+        [255, 255, 191],
+        [102, 189, 99],
+        [0, 104, 55],
+    ],
+    dtype=np.float64,
+)
+HEATMAP_OPACITY = 0.6
+
+
+def colorize(values):
+    # RGBA uint8 image of the values, transparent where there is no data
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    clipped = np.clip(np.where(missing, 0.0, values), COLOR_STOPS[0], COLOR_STOPS[-1])
+    rgba = np.empty(values.shape + (4,), dtype=np.uint8)
+    for channel in range(3):
+        rgba[..., channel] = np.interp(clipped, COLOR_STOPS, COLORS[:, channel]).round()
+    rgba[..., 3] = np.where(missing, 0, 255)
+    return rgba
+
+
+def heatmap_png(values):
+    # Row 0 of the grid is the southern edge, hence origin="lower"
+    from branca.utilities import write_png
+
+    return write_png(colorize(values), origin="lower")
+
+
+def heatmap_data_url(values):
+    return "data:image/png;base64," + base64.b64encode(heatmap_png(values)).decode("ascii")
+
+
+def heatmap_bounds(grid):
+    # Image corners sit half a cell outside the outermost cell centres
+    half = grid.step / 2
+    return [
+        [grid.latitude_range[0] - half, grid.longitude_range[0] - half],
+        [grid.latitude_range[1] + half, grid.longitude_range[1] + half],
+    ]
+
+
+def heatmap_overlay(data_url, bounds, opacity=HEATMAP_OPACITY):
+    import folium
+
+    return folium.raster_layers.ImageOverlay(
+        image=data_url,
+        bounds=bounds,
+        opacity=opacity,
+        name="Deforestation heatmap",
+        interactive=False,
+        pixelated=True,
+    )
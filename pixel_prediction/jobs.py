@@ -0,0 +1,139 @@
+"""Background analysis jobs for the Streamlit apps.
+
+The /deforestation call runs in a thread pool shared by every session, so the
+script thread is never blocked on the network. A session keeps at most one job
+in st.session_state; while it runs, wait_for_analysis() polls it and reruns the
+page as soon as the result is ready.
+
+Prefetches of the cells around an analysed point run in a smaller pool of
+their own and wait while any analysis of the process is in flight, so they
+only use idle capacity and never delay a user's lookup.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from .grid import cell_key
+
+ANALYSIS_WORKERS = 16  # Concurrent analyses per server process
+PREFETCH_WORKERS = 2  # Concurrent prefetch lookups per server process
+PREFETCH_BATCH_WORKERS = 8  # The same when the lookups share batch requests, which need enough of them waiting
+POLL_SECONDS = 0.25
+
+# Analyses submitted and not yet done, process-wide; prefetches yield to them
+_analyses_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+@st.cache_resource
+def get_executor():
+    return ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="analysis")
+
+
+@st.cache_resource
+def get_prefetch_executor(workers=PREFETCH_WORKERS):
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+
+
+def submit_analysis(location, fn, *args, **kwargs):
+    # Start fn(*args, **kwargs) for the location, superseding the session's previous job
+    global _analyses_in_flight
+    cancel_analysis()
+    with _in_flight_lock:
+        _analyses_in_flight += 1
+    future = get_executor().submit(fn, *args, **kwargs)
+    future.add_done_callback(_analysis_done)
+    st.session_state["analysis_job"] = {"location": location, "future": future}
+
+
+def _analysis_done(future):
+    global _analyses_in_flight
+    with _in_flight_lock:
+        _analyses_in_flight -= 1
+
+
+def cancel_analysis():
+    # A job that already started still finishes (and fills the cache), but is ignored
+    job = st.session_state.get("analysis_job")
+    if job is not None:
+        job["future"].cancel()
+        st.session_state["analysis_job"] = None
+
+
+def cancel_stale_analysis(location):
+    # Drop the job if the user picked another point since it was submitted
+    job = st.session_state.get("analysis_job")
+    if job is not None and job["location"] != location:
+        cancel_analysis()
+
+
+def analysis_running():
+    job = st.session_state.get("analysis_job")
+    return job is not None and not job["future"].done()
+
+
+def pop_finished_analysis():
+    # The finished job's future, handed out once; None while nothing has finished
+    job = st.session_state.get("analysis_job")
+    if job is None or not job["future"].done():
+        return None
+    st.session_state["analysis_job"] = None
+    return job["future"]
+
+
+def submit_prefetch(location, cells, fn, *args, workers=PREFETCH_WORKERS, **kwargs):
+    """Look every cell up in the background with fn(*args, latitude, longitude, **kwargs).
+
+    Results only matter for the caches fn fills. Supersedes the session's
+    previous prefetch; the cells are taken nearest first, by the process-wide
+    pool of workers threads.
+    """
+    cancel_prefetch()
+    cancelled = threading.Event()
+    executor = get_prefetch_executor(workers)
+    futures = [
+        executor.submit(_prefetch, cancelled, fn, *args, latitude, longitude, **kwargs)
+        for latitude, longitude in cells
+    ]
+    st.session_state["prefetch_job"] = {
+        "cells": {cell_key(*location)} | {cell_key(*cell) for cell in cells},
+        "futures": futures,
+        "cancelled": cancelled,
+    }
+
+
+def _prefetch(cancelled, fn, *args, **kwargs):
+    # Waits for idle capacity, and gives up once the user has moved on
+    while _analyses_in_flight:
+        if cancelled.wait(POLL_SECONDS):
+            return
+    if cancelled.is_set():
+        return
+    try:
+        fn(*args, **kwargs)
+    except Exception:
+        pass  # A failed prefetch only means the cell isn't cached yet
+
+
+def cancel_prefetch():
+    job = st.session_state.get("prefetch_job")
+    if job is not None:
+        job["cancelled"].set()
+        for future in job["futures"]:
+            future.cancel()
+        st.session_state["prefetch_job"] = None
+
+
+def cancel_distant_prefetch(location):
+    # Drop the prefetch once the user picked a point outside the prefetched neighbourhood
+    job = st.session_state.get("prefetch_job")
+    if job is not None and cell_key(*location) not in job["cells"]:
+        cancel_prefetch()
+
+
+@st.fragment(run_every=POLL_SECONDS)
+def wait_for_analysis():
+    # Only called while a job runs, so idle sessions don't poll
+    if not analysis_running():
+        st.rerun()
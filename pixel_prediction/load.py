@@ -0,0 +1,237 @@
+"""Concurrent-session load generator for the Streamlit apps.
+
+Simulates N users of one app in a single server process: every user is a
+headless AppTest session running in its own thread, so they share the
+process-wide caches, HTTP pool and single-flight table exactly like browser
+sessions of one Streamlit server. Each user repeatedly thinks, picks a point
+in the area of interest, enters it and presses "Analyze Deforestation"; the
+round trip from the press to the rerun showing the result is timed.
+
+AppTest can't execute scripts of several sessions at the same time, so script
+runs take turns (as they largely do on one server under the GIL) while the
+analyses themselves run concurrently in the shared background pool. Time
+spent waiting for a turn is part of the round trip.
+
+    python -m pixel_prediction.load --users 20 --duration 60 --think exponential --mean-think 2
+    python -m pixel_prediction.load --app app_checker.py --clicks hotspots --profile realistic
+
+Unless --api-url is given, a local mock service is started with the chosen
+profile. The report gives throughput, round-trip percentiles, where the
+analyses' lookups were answered (cache hit rate), the prefetch and refresh
+lookups made in the background and the HTTP requests sent to the service.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+import numpy as np
+import requests
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from . import api
+from .bench import DEBOUNCE_WAIT, RESULT_TIMEOUT, ROOT
+from .grid import LATITUDE_RANGE, LONGITUDE_RANGE
+from .mock_server import PROFILES, serve
+from .resources import get_batcher, get_http_client
+
+# Widgets holding the coordinates, and whether the app debounces them
+INPUTS = {
+    "app.py": ("slider", "latitude_slider", "longitude_slider", True),
+    "app_checker.py": ("number_input", "lat_input_box", "lon_input_box", True),
+}
+DEFAULT_INPUTS = ("number_input", "lat_input_box", "lon_input_box", False)
+
+# Popular spots for the "hotspots" click distribution (latitude, longitude)
+HOTSPOTS = [(-3.85, -54.84), (-4.1, -55.0), (-3.6, -54.6), (-4.3, -54.55), (-3.4, -55.1)]
+HOTSPOT_SIGMA = 0.02  # Degrees of spread around a hotspot
+
+
+def think_time(model, mean):
+    # Seconds a user waits between two analyses
+    if model == "exponential":
+        return lambda rng: rng.expovariate(1 / mean) if mean else 0
+    if model == "uniform":
+        return lambda rng: rng.uniform(0, 2 * mean)
+    return lambda rng: mean
+
+
+def click_distribution(model, hotspot_share=0.8):
+    # Function returning a (latitude, longitude) on the 0.01° grid of the area of interest
+    def uniform(rng):
+        return rng.uniform(*LATITUDE_RANGE), rng.uniform(*LONGITUDE_RANGE)
+
+    def hotspots(rng):
+        if rng.random() >= hotspot_share:
+            return uniform(rng)
+        latitude, longitude = rng.choice(HOTSPOTS)
+        return rng.gauss(latitude, HOTSPOT_SIGMA), rng.gauss(longitude, HOTSPOT_SIGMA)
+
+    pick = hotspots if model == "hotspots" else uniform
+
+    def clipped(rng):
+        latitude, longitude = pick(rng)
+        return (
+            round(min(max(latitude, LATITUDE_RANGE[0]), LATITUDE_RANGE[1]), 2),
+            round(min(max(longitude, LONGITUDE_RANGE[0]), LONGITUDE_RANGE[1]), 2),
+        )
+    return clipped
+
+
+# AppTest keeps process-global runtime state during a script run
+_run_lock = threading.Lock()
+
+
+def _run(at):
+    with _run_lock:
+        at.run()
+
+
+class Recorder:
+    """Round-trip times and errors collected from the user threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.round_trips = []
+        self.errors = []
+
+    def add(self, seconds):
+        with self._lock:
+            self.round_trips.append(seconds)
+
+    def error(self, message):
+        with self._lock:
+            self.errors.append(message)
+
+
+def simulate_user(app, stop_at, seed, think, pick, recorder):
+    kind, lat_key, lon_key, debounced = INPUTS.get(app, DEFAULT_INPUTS)
+    rng = random.Random(seed)
+    at = AppTest.from_file(os.path.join(ROOT, app), default_timeout=RESULT_TIMEOUT)
+    _run(at)
+    while time.monotonic() < stop_at:
+        time.sleep(think(rng))
+        latitude, longitude = pick(rng)
+        try:
+            getattr(at, kind)(key=lat_key).set_value(latitude)
+            getattr(at, kind)(key=lon_key).set_value(longitude)
+            _run(at)
+            if debounced:
+                time.sleep(DEBOUNCE_WAIT)
+                _run(at)
+
+            started = time.perf_counter()
+            next(button for button in at.button if button.label == "Analyze Deforestation").click()
+            _run(at)
+            job = at.session_state["analysis_job"] if "analysis_job" in at.session_state else None
+            if job is not None:
+                job["future"].exception(timeout=RESULT_TIMEOUT)
+                _run(at)
+            recorder.add(time.perf_counter() - started)
+        except Exception as e:
+            recorder.error(f"{type(e).__name__}: {e}")
+        if at.exception:
+            recorder.error(at.exception[0].message)
+
+
+def percentile_ms(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 1) if values else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate concurrent users of a Streamlit app.")
+    parser.add_argument("--app", default="app_with_clicking.py", help="App script to load")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent simulated sessions")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    parser.add_argument("--ramp-up", type=float, default=2, help="Seconds over which users join")
+    parser.add_argument("--think", choices=("exponential", "uniform", "fixed"), default="exponential")
+    parser.add_argument("--mean-think", type=float, default=1.0, help="Mean think time in seconds")
+    parser.add_argument("--clicks", choices=("uniform", "hotspots"), default="hotspots", help="Click distribution")
+    parser.add_argument("--hotspot-share", type=float, default=0.8, help="Share of clicks near a hotspot")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="realistic", help="Mock service profile")
+    parser.add_argument("--api-url", help="Use this service instead of starting the mock")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.api_url:
+        os.environ["DEFORESTATION_API_URL"] = args.api_url
+    else:
+        server = serve(port=0, profile=PROFILES[args.profile], seed=args.seed)
+        os.environ["DEFORESTATION_API_URL"] = f"http://127.0.0.1:{server.server_port}/deforestation"
+    # Start cold, like a freshly deployed container
+    os.environ["DEFORESTATION_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="pixel-load-"), "cache.sqlite3")
+    st.cache_data.clear()
+    st.cache_resource.clear()
+
+    # Warm up imports and module caches outside the measurement
+    AppTest.from_file(os.path.join(ROOT, args.app), default_timeout=RESULT_TIMEOUT).run()
+    api_url = os.environ["DEFORESTATION_API_URL"]
+    client, batcher = get_http_client(api_url), get_batcher(api_url)
+    counts_before = dict(api.lookup_counts)
+    requests_before, batches_before, shared_before = client.requests, batcher.batches, api.flights.shared
+
+    recorder = Recorder()
+    think = think_time(args.think, args.mean_think)
+    pick = click_distribution(args.clicks, args.hotspot_share)
+    started = time.monotonic()
+    stop_at = started + args.ramp_up + args.duration
+    threads = []
+    for user in range(args.users):
+        thread = threading.Thread(
+            target=simulate_user,
+            args=(args.app, stop_at, args.seed * 10_000 + user, think, pick, recorder),
+            name=f"user-{user}",
+            daemon=True,
+        )
+        thread.start()
+        threads.append(thread)
+        time.sleep(args.ramp_up / max(args.users, 1))
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    counts = {name: api.lookup_counts[name] - counts_before.get(name, 0) for name in api.lookup_counts}
+    lookups = {name: counts.get(name, 0) for name in ("grid", "cache", "service")}
+    total_lookups = sum(lookups.values())
+    round_trips = recorder.round_trips
+    report = {
+        "app": args.app,
+        "users": args.users,
+        "seconds": round(elapsed, 1),
+        "analyses": len(round_trips),
+        "throughput_per_s": round(len(round_trips) / elapsed, 2),
+        "round_trip_p50_ms": percentile_ms(round_trips, 50),
+        "round_trip_p95_ms": percentile_ms(round_trips, 95),
+        "round_trip_p99_ms": percentile_ms(round_trips, 99),
+        "round_trip_max_ms": round(max(round_trips) * 1000, 1) if round_trips else None,
+        "lookups": lookups,
+        "cache_hit_rate": round((lookups["grid"] + lookups["cache"]) / total_lookups, 3) if total_lookups else None,
+        "background_lookups": {name: counts.get(name, 0) for name in ("prefetch", "refresh")},
+        # HTTP requests actually sent (retries included), of which batch requests carrying several cells
+        "upstream_requests": client.requests - requests_before,
+        "batch_requests": batcher.batches - batches_before,
+        "coalesced_calls": api.flights.shared - shared_before,
+        "errors": len(recorder.errors),
+    }
+    if server is not None:
+        report["mock_requests"] = requests.get(f"http://127.0.0.1:{server.server_port}/stats").json()
+        server.shutdown()
+
+    width = max(len(name) for name in report)
+    for name, value in report.items():
+        print(f"{name:<{width}}  {value}")
+    for message in sorted(set(recorder.errors))[:10]:
+        print(f"error: {message}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Timing spans and histograms for the hot path of the apps.
+
+Stages of a rerun and of the service call are timed with span() and kept in
+process-wide histograms with fixed buckets, so every session adds to the same
+numbers at constant memory. snapshot() summarizes them for display and
+to_prometheus() renders them in the Prometheus text exposition format, which
+serve_metrics() can expose on a local port.
+"""
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds, from a fast cache hit to a slow model call
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SPAN_METRIC = "pixel_prediction_span_seconds"
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-quantile (the max for the +Inf bucket)
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Registry:
+    """Named histograms shared by all threads of the process."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def snapshot(self):
+        # One row per span: count, mean, p50/p95 (bucket bounds) and max in milliseconds
+        with self._lock:
+            return [
+                {
+                    "span": name,
+                    "count": histogram.count,
+                    "mean_ms": round(histogram.sum / histogram.count * 1000, 2),
+                    "p50_ms": round(histogram.quantile(0.5) * 1000, 2),
+                    "p95_ms": round(histogram.quantile(0.95) * 1000, 2),
+                    "max_ms": round(histogram.max * 1000, 2),
+                }
+                for name, histogram in sorted(self._histograms.items())
+            ]
+
+    def to_prometheus(self, counters=None):
+        """Prometheus text format of the span histograms and optional counters.
+
+        counters maps a metric name to (help text, label name, {label value: count}).
+        """
+        lines = [
+            f"# HELP {SPAN_METRIC} Duration of instrumented stages of the apps.",
+            f"# TYPE {SPAN_METRIC} histogram",
+        ]
+        with self._lock:
+            for name, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{SPAN_METRIC}_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{SPAN_METRIC}_sum{{span="{name}"}} {histogram.sum:.6f}')
+                lines.append(f'{SPAN_METRIC}_count{{span="{name}"}} {histogram.count}')
+        for metric, (help_text, label, values) in (counters or {}).items():
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for value, count in sorted(values.items()):
+                lines.append(f'{metric}{{{label}="{value}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry used by the apps and the pixel_prediction modules
+registry = Registry()
+span = registry.span
+
+
+def timed(name):
+    # Decorator recording every call of the function as a span, e.g. for fragments
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def serve_metrics(port, render, host="127.0.0.1"):
+    """Serve render() as Prometheus text on http://host:port/metrics from a background thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            data = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
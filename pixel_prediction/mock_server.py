@@ -0,0 +1,264 @@
+"""Local stand-in for the /deforestation model service.
+
+Implements the same contract as the Cloud Run service, so the apps, the sweep
+and load tests can run without touching production:
+
+    POST /deforestation {"latitude": -3.85, "longitude": -54.84}
+    200 {"deforestation_percentage": {"deforestation_percentage": 12.34}}
+    404 when there is no data for the cell
+
+plus the batch contract of api.fetch_deforestation_batch, one round trip for
+many points (turned off with --no-batch, to test the single-point fallback):
+
+    POST /deforestation/batch {"points": [{"latitude": -3.85, "longitude": -54.84}, ...]}
+    200 {"results": [{"latitude": -3.85, "longitude": -54.84, "status": 200, ...}, ...]}
+
+Values are a deterministic function of the 0.01° grid cell. Latency, error
+rates and throughput caps come from a named profile, and every setting can be
+overridden on the command line:
+
+    python -m pixel_prediction.mock_server --profile realistic --port 8080
+    DEFORESTATION_API_URL=http://127.0.0.1:8080/deforestation streamlit run app.py
+
+GET /stats returns request counters, GET /health a liveness answer.
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .api import BATCH_PATH, MAX_BATCH_POINTS
+from .grid import GRID_STEP, cell_key
+from .sweep import RateLimiter
+
+TIMEOUT_SECONDS = 60  # Simulated hang, longer than the client's read timeout
+QUEUE_SECONDS = 10  # Time a request waits for a concurrency slot before a 429
+POINT_SECONDS = 0.002  # Model time per point of a batch, on top of the request latency
+
+# Latency: median_ms with a lognormal/uniform spread (sigma), or fixed
+PROFILES = {
+    "instant": {
+        "latency": "fixed", "median_ms": 0, "sigma": 0,
+        "error_rate": 0, "timeout_rate": 0, "no_data_rate": 0.05, "max_rps": 0, "max_concurrency": 0,
+    },
+    "realistic": {
+        "latency": "lognormal", "median_ms": 350, "sigma": 0.5,
+        "error_rate": 0.01, "timeout_rate": 0, "no_data_rate": 0.05, "max_rps": 0, "max_concurrency": 16,
+    },
+    "slow": {
+        "latency": "lognormal", "median_ms": 2000, "sigma": 0.6,
+        "error_rate": 0.01, "timeout_rate": 0.01, "no_data_rate": 0.05, "max_rps": 0, "max_concurrency": 8,
+    },
+    "flaky": {
+        "latency": "lognormal", "median_ms": 300, "sigma": 0.8,
+        "error_rate": 0.2, "timeout_rate": 0.05, "no_data_rate": 0.05, "max_rps": 0, "max_concurrency": 16,
+    },
+    "overloaded": {
+        "latency": "uniform", "median_ms": 500, "sigma": 0.5,
+        "error_rate": 0.02, "timeout_rate": 0, "no_data_rate": 0.05, "max_rps": 5, "max_concurrency": 4,
+    },
+    "down": {
+        "latency": "fixed", "median_ms": 50, "sigma": 0,
+        "error_rate": 1, "timeout_rate": 0, "no_data_rate": 0, "max_rps": 0, "max_concurrency": 0,
+    },
+}
+
+
+def mock_value(latitude, longitude, no_data_rate=0.05, step=GRID_STEP):
+    """Deterministic percentage for the cell of the coordinates, or None for "no data"."""
+    lat_cell, lon_cell = cell_key(latitude, longitude, step)
+    rng = random.Random(lat_cell * 1_000_003 + lon_cell)
+    if rng.random() < no_data_rate:
+        return None
+    # Smooth regional pattern plus per-cell noise, within (-100, 100)
+    trend = 45 * math.sin(lat_cell * step * 9) * math.cos(lon_cell * step * 7)
+    return round(max(-99.0, min(99.0, trend + rng.gauss(0, 8))), 2)
+
+
+class MockService:
+    """Behaviour of the mock server: latency, failures, throughput caps and counters."""
+
+    def __init__(self, profile, seed=None):
+        self.profile = profile
+        self.random = random.Random(seed)
+        self.limiter = RateLimiter(profile["max_rps"], burst=max(1, int(profile["max_rps"])))
+        self.slots = threading.BoundedSemaphore(profile["max_concurrency"]) if profile["max_concurrency"] else None
+        self.counts = Counter()
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def latency(self):
+        # Seconds to wait before answering
+        median = self.profile["median_ms"] / 1000
+        if self.profile["latency"] == "lognormal":
+            return self.random.lognormvariate(math.log(median), self.profile["sigma"]) if median else 0
+        if self.profile["latency"] == "uniform":
+            spread = median * self.profile["sigma"]
+            return self.random.uniform(median - spread, median + spread)
+        return median
+
+    def handle(self, payload):
+        # (status, body) for one /deforestation request
+        return self._serve(1, lambda: self._point(payload))
+
+    def handle_batch(self, points):
+        # (status, body) for one batch request: the points share one round trip, failure and timeout
+        def answer():
+            results = []
+            for point in points:
+                status, body = self._point(point)
+                results.append({**point, "status": status, **body})
+            return 200, {"results": results}
+
+        return self._serve(len(points), answer)
+
+    def _point(self, payload):
+        value = mock_value(payload["latitude"], payload["longitude"], self.profile["no_data_rate"])
+        if value is None:
+            return 404, {"detail": "No data available for the given coordinates"}
+        return 200, {"deforestation_percentage": {"deforestation_percentage": value}}
+
+    def _serve(self, points, answer):
+        if not self.limiter.try_acquire():
+            return 429, {"detail": "Rate limit exceeded"}
+        if self.slots is not None and not self.slots.acquire(timeout=QUEUE_SECONDS):
+            return 429, {"detail": "Too many concurrent requests"}
+        with self._lock:
+            self.in_flight += 1
+        try:
+            roll = self.random.random()
+            if roll < self.profile["timeout_rate"]:
+                time.sleep(TIMEOUT_SECONDS)
+                return 504, {"detail": "Upstream request timeout"}
+            time.sleep(self.latency() + (points - 1) * POINT_SECONDS)
+            if roll < self.profile["timeout_rate"] + self.profile["error_rate"]:
+                return self.random.choice((500, 503)), {"detail": "Simulated server error"}
+            return answer()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            if self.slots is not None:
+                self.slots.release()
+
+    def count(self, status):
+        with self._lock:
+            self.counts[status] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": sum(self.counts.values()),
+                "status_counts": {str(status): count for status, count in sorted(self.counts.items())},
+                "in_flight": self.in_flight,
+            }
+
+
+def make_handler(service, path="/deforestation", verbose=False, batch=True):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, like the real service
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if batch and self.path == path + BATCH_PATH:
+                self._batch(body)
+                return
+            if self.path != path:
+                self._send(404, {"detail": "Not Found"})
+                return
+            try:
+                payload = json.loads(body)
+                payload = {"latitude": float(payload["latitude"]), "longitude": float(payload["longitude"])}
+            except (ValueError, KeyError, TypeError):
+                self._send(422, {"detail": "Expected a JSON body with numeric latitude and longitude"})
+                return
+            status, response = service.handle(payload)
+            service.count(status)
+            self._send(status, response)
+
+        def _batch(self, body):
+            try:
+                points = [
+                    {"latitude": float(point["latitude"]), "longitude": float(point["longitude"])}
+                    for point in json.loads(body)["points"]
+                ]
+            except (ValueError, KeyError, TypeError):
+                self._send(422, {"detail": "Expected a JSON body with a list of points with numeric latitude and longitude"})
+                return
+            if not points or len(points) > MAX_BATCH_POINTS:
+                self._send(422, {"detail": f"Expected 1 to {MAX_BATCH_POINTS} points"})
+                return
+            status, response = service.handle_batch(points)
+            service.count(status)
+            self._send(status, response)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._send(200, service.stats())
+            elif self.path == "/health":
+                self._send(200, {"status": "ok"})
+            else:
+                self._send(404, {"detail": "Not Found"})
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            if verbose:
+                super().log_message(format, *args)
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8080, profile=PROFILES["instant"], seed=None, verbose=False, batch=True):
+    """Start the mock server in a background thread and return it (call shutdown() to stop)."""
+    server = ThreadingHTTPServer((host, port), make_handler(MockService(profile, seed), verbose=verbose, batch=batch))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-server", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local mock of the /deforestation model service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="realistic")
+    parser.add_argument("--latency", choices=("fixed", "uniform", "lognormal"), help="Latency distribution")
+    parser.add_argument("--median-ms", type=float, help="Median latency in milliseconds")
+    parser.add_argument("--sigma", type=float, help="Latency spread (lognormal sigma, or relative uniform half-width)")
+    parser.add_argument("--error-rate", type=float, help="Share of requests answered with 500/503")
+    parser.add_argument("--timeout-rate", type=float, help=f"Share of requests that hang for {TIMEOUT_SECONDS}s")
+    parser.add_argument("--no-data-rate", type=float, help="Share of cells answered with 404")
+    parser.add_argument("--max-rps", type=float, help="Requests per second before 429s (0 for unlimited)")
+    parser.add_argument("--max-concurrency", type=int, help="Requests served at once (0 for unlimited)")
+    parser.add_argument("--seed", type=int, help="Seed for latency and failures")
+    parser.add_argument("--no-batch", action="store_true", help="Answer the batch endpoint with 404, like the Cloud Run service")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args(argv)
+
+    profile = dict(PROFILES[args.profile])
+    for name in profile:
+        if getattr(args, name, None) is not None:
+            profile[name] = getattr(args, name)
+
+    server = serve(args.host, args.port, profile, seed=args.seed, verbose=args.verbose, batch=not args.no_batch)
+    url = f"http://{args.host}:{server.server_port}/deforestation"
+    print(f"Mock service ({args.profile}) on {url}")
+    print(f"Point the apps at it with DEFORESTATION_API_URL={url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
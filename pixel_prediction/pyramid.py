@@ -0,0 +1,86 @@
+"""Multi-resolution pyramid of the deforestation grid.
+
+Coarser levels aggregate blocks of 2x2, 4x4 and 8x8 cells (0.02°, 0.04° and
+0.08° on the 0.01° grid) with NumPy block reductions, keeping the mean, min,
+max and count of the known cells of every block. Overview zooms show a
+coarse level, which is a fraction of the size to encode and draw, and fine
+zooms the full resolution: level_factor() picks the finest level whose cells
+are still a few pixels wide at the map zoom.
+"""
+import numpy as np
+
+from .grid import GRID_STEP
+from .heatmap import heatmap_bounds
+
+LEVEL_FACTORS = (1, 2, 4, 8)  # Cells per block side, finest first
+MIN_CELL_PIXELS = 6  # Narrowest block drawn at a zoom level
+WORLD_PIXELS = 256  # Width of the world at zoom 0 on a web map
+
+
+def block_reduce(values, factor):
+    """(mean, min, max, count) of the known values in factor x factor blocks.
+
+    Blocks start at row 0 and column 0 (the south-west corner); the grid is
+    padded with NaN to whole blocks. Blocks without known values are NaN,
+    with a count of 0.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    rows, cols = -(-values.shape[0] // factor), -(-values.shape[1] // factor)
+    padded = np.full((rows * factor, cols * factor), np.nan)
+    padded[:values.shape[0], :values.shape[1]] = values
+    blocks = padded.reshape(rows, factor, cols, factor)
+
+    known = ~np.isnan(blocks)
+    count = known.sum(axis=(1, 3))
+    total = np.where(known, blocks, 0).sum(axis=(1, 3))
+    mean = np.divide(total, count, out=np.full(count.shape, np.nan), where=count > 0)
+    minimum = np.where(known, blocks, np.inf).min(axis=(1, 3))
+    maximum = np.where(known, blocks, -np.inf).max(axis=(1, 3))
+    minimum[count == 0] = np.nan
+    maximum[count == 0] = np.nan
+    return mean, minimum, maximum, count
+
+
+class Level:
+    """One level of the pyramid: block statistics of the base grid at factor times its step."""
+
+    def __init__(self, grid, factor, values):
+        self.grid = grid
+        self.factor = factor
+        self.mean, self.min, self.max, self.count = block_reduce(values, factor)
+
+    @property
+    def step(self):
+        return round(self.grid.step * self.factor, 6)
+
+    def bounds(self):
+        # Image corners: the base grid's south-west corner, extended to whole blocks
+        (south, west), _ = heatmap_bounds(self.grid)
+        rows, cols = self.mean.shape
+        return [[south, west], [south + rows * self.grid.step * self.factor, west + cols * self.grid.step * self.factor]]
+
+    def stats(self, latitude, longitude):
+        # Mean, min, max and count of the block containing the coordinates, or None outside the grid
+        index = self.grid.index(latitude, longitude)
+        if index is None:
+            return None
+        row, col = index[0] // self.factor, index[1] // self.factor
+        return {
+            "mean": None if np.isnan(self.mean[row, col]) else float(self.mean[row, col]),
+            "min": None if np.isnan(self.min[row, col]) else float(self.min[row, col]),
+            "max": None if np.isnan(self.max[row, col]) else float(self.max[row, col]),
+            "count": int(self.count[row, col]),
+        }
+
+
+def grid_pyramid(values, grid, factors=LEVEL_FACTORS):
+    # Levels of the grid values (NaN where unknown), finest first
+    return [Level(grid, factor, values) for factor in factors]
+
+
+def level_factor(zoom, step=GRID_STEP, factors=LEVEL_FACTORS, min_pixels=MIN_CELL_PIXELS):
+    # Block size of the finest level whose cells are at least min_pixels wide at the zoom; the coarsest otherwise
+    for factor in factors:
+        if step * factor / 360 * WORLD_PIXELS * 2 ** zoom >= min_pixels:
+            return factor
+    return factors[-1]
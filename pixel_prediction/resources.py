@@ -0,0 +1,222 @@
+"""Process-wide resources shared by every Streamlit session."""
+import os
+
+import numpy as np
+import streamlit as st
+
+from . import api
+from .aoi import AOI_CONFIG_ENV, default_registry, load_registry
+from .cache import ResultCache
+from .estimate import PLAUSIBLE_LIMIT, estimate_deforestation
+from .grid import GRID_STEP, LATITUDE_RANGE, LONGITUDE_RANGE, Grid, GridLookup, grid_paths
+from .heatmap import heatmap_bounds, heatmap_data_url
+from .metrics import registry, serve_metrics
+from .pyramid import grid_pyramid, level_factor
+
+# Prefix of a grid written by pixel_prediction.sweep, e.g. "data/grid"
+GRID_PATH = os.environ.get("DEFORESTATION_GRID")
+
+# Local port serving the timing histograms at /metrics, e.g. 9464 (off when unset)
+METRICS_PORT = os.environ.get("DEFORESTATION_METRICS_PORT")
+
+
+# (latitude range, longitude range, step) of the grid of the default area of interest
+DEFAULT_AREA = (LATITUDE_RANGE, LONGITUDE_RANGE, GRID_STEP)
+
+
+@st.cache_resource
+def get_result_cache(namespace, step=GRID_STEP):
+    return ResultCache(namespace=namespace, step=step)
+
+
+@st.cache_resource
+def get_http_client(api_url):
+    # One client and circuit breaker per endpoint, so a dead area endpoint doesn't fail the others fast
+    # Imported here: requests and urllib3 aren't needed until the first service call
+    from .breaker import CircuitBreaker
+    from .client import DeforestationClient
+
+    return DeforestationClient(breaker=CircuitBreaker())
+
+
+@st.cache_resource
+def get_batcher(api_url):
+    # Bulk lookups of the API (batch analysis, prefetching, area fetches) go out as batch requests
+    from .batcher import MicroBatcher
+
+    return MicroBatcher(api_url, client=get_http_client(api_url))
+
+
+def get_service_health(api_url):
+    # {endpoint: circuit breaker state and rolling error rate/latency} of the app's endpoint and those of the areas
+    endpoints = [api_url] + [aoi.api_url for aoi in get_aoi_registry() if aoi.api_url]
+    return {endpoint: get_http_client(endpoint).breaker.snapshot() for endpoint in dict.fromkeys(endpoints)}
+
+
+def prometheus_metrics():
+    # Timing histograms and lookup counters of this process in Prometheus text format
+    return registry.to_prometheus({
+        "pixel_prediction_lookups_total": (
+            "Deforestation lookups by where they were answered (prefetch and refresh: background lookups).",
+            "source",
+            dict(api.lookup_counts),
+        ),
+    })
+
+
+@st.cache_resource
+def start_metrics_endpoint():
+    # Serve /metrics once per process when DEFORESTATION_METRICS_PORT is set
+    if not METRICS_PORT:
+        return None
+    return serve_metrics(int(METRICS_PORT), prometheus_metrics)
+
+
+@st.cache_resource
+def _open_grid(path, version):
+    return GridLookup(path)
+
+
+def _grid_version(path):
+    # Modification time of the grid file, which keys the resources built from it; None without a readable grid
+    if not path:
+        return None
+    try:
+        return os.path.getmtime(grid_paths(path)[0])
+    except OSError:
+        return None  # Missing or renamed: answered by the service and the cache instead
+
+
+def get_grid_lookup(path=GRID_PATH):
+    # The precomputed grid at path (by default the one of local grid mode), or None without one
+    version = _grid_version(path)
+    if version is None:
+        return None
+    # Keyed by the version, so a regenerated grid is reopened
+    return _open_grid(path, version)
+
+
+@st.cache_resource
+def _aoi_registry(path, version):
+    return load_registry(path) if path else default_registry()
+
+
+def get_aoi_registry():
+    # Areas of $DEFORESTATION_AOI_CONFIG (reloaded when the file changes), or the default area of interest
+    path = os.environ.get(AOI_CONFIG_ENV)
+    return _aoi_registry(path, os.path.getmtime(path) if path else None)
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _render_grid_heatmap(path, version):
+    lookup = _open_grid(path, version)
+    return heatmap_data_url(lookup.values), heatmap_bounds(lookup.grid)
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _render_cache_heatmap(namespace, version):
+    grid = Grid()
+    values = get_result_cache(namespace).to_array(grid)
+    if not (values == values).any():
+        return None  # Nothing cached yet
+    return heatmap_data_url(values), heatmap_bounds(grid)
+
+
+def get_heatmap(namespace):
+    """(PNG data URL, bounds) of the deforestation heatmap, or None without data.
+
+    Built from the precomputed grid when one is configured, otherwise from the
+    cached results. The PNG is encoded once per grid version (file mtime, or
+    the cache's row count and latest write), so reruns reuse it.
+    """
+    grid_version = _grid_version(GRID_PATH)
+    if grid_version is not None:
+        return _render_grid_heatmap(GRID_PATH, grid_version)
+    return _render_cache_heatmap(namespace, get_result_cache(namespace).version())
+
+
+@st.cache_resource(max_entries=4)
+def _known_values(namespace, area, grid_path, grid_version, cache_version):
+    # (values, grid, no-data mask): precomputed values where the grid has them, cached results elsewhere
+    lookup = _open_grid(grid_path, grid_version) if grid_version is not None else None
+    grid = lookup.grid if lookup is not None else Grid(*area)
+    values, stored = get_result_cache(namespace, grid.step).to_arrays(grid)
+    if lookup is not None:
+        values = np.where(np.isnan(lookup.values), values, lookup.values)
+        stored |= ~lookup.unknown
+    no_data = stored & np.isnan(values)
+    values.flags.writeable = no_data.flags.writeable = False  # Shared by every session
+    return values, grid, no_data
+
+
+def _known_values_key(namespace, aoi):
+    # Arguments of _known_values for the area (the default one when None): its grid and the current versions
+    if aoi is None:
+        area, grid_path = DEFAULT_AREA, GRID_PATH
+    else:
+        area, grid_path = (aoi.latitude_range, aoi.longitude_range, aoi.step), aoi.grid_path
+    grid_version = _grid_version(grid_path)
+    step = _open_grid(grid_path, grid_version).grid.step if grid_version is not None else area[2]
+    return namespace, area, grid_path, grid_version, get_result_cache(namespace, step).version()
+
+
+def get_known_values(namespace, aoi=None):
+    """(values, grid) of every known result of the area, NaN where nothing is known.
+
+    The grid is the area's precomputed one, or else that of its bounds and
+    step (aoi.AOI; the default area of interest when None). Laid out once per
+    grid/cache version and shared read-only by all sessions.
+    """
+    return _known_values(*_known_values_key(namespace, aoi))[:2]
+
+
+def get_no_data(namespace, aoi=None):
+    # Boolean mask of the cells of get_known_values answered "no data" by the grid or the cache
+    return _known_values(*_known_values_key(namespace, aoi))[2]
+
+
+@st.cache_resource(max_entries=4)
+def _pyramid(*key):
+    values, grid, _ = _known_values(*key)
+    return {level.factor: level for level in grid_pyramid(values, grid)}
+
+
+def get_pyramid(namespace):
+    """{block factor: pyramid.Level} of the known values, finest first.
+
+    Reduced once per grid/cache version, like get_known_values.
+    """
+    return _pyramid(*_known_values_key(namespace, None))
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _render_level_heatmap(key, factor):
+    level = _pyramid(*key)[factor]
+    if not (level.count > 0).any():
+        return None  # Nothing known yet
+    return heatmap_data_url(level.mean), level.bounds()
+
+
+def get_level_heatmap(namespace, zoom):
+    """(factor, (PNG data URL, bounds) or None) of the heatmap level suited to the map zoom.
+
+    Block means of the pyramid level picked by pyramid.level_factor, encoded
+    once per level and grid/cache version.
+    """
+    key = _known_values_key(namespace, None)
+    factor = level_factor(zoom, _known_values(*key)[1].step)
+    return factor, _render_level_heatmap(key, factor)
+
+
+def get_estimate(namespace, latitude, longitude, exclude_cell=False, aoi=None):
+    # Interpolated (estimate, number of cells used) from the known results of the area, or None
+    values, grid = get_known_values(namespace, aoi)
+    return estimate_deforestation(values, grid, latitude, longitude, exclude_cell=exclude_cell)
+
+
+def get_plausible(namespace, latitude, longitude, value, aoi=None):
+    # (value, None) for a plausible percentage, else (estimate from the area's neighbours, cells used)
+    if abs(value) < PLAUSIBLE_LIMIT:
+        return value, None
+    estimate = get_estimate(namespace, latitude, longitude, exclude_cell=True, aoi=aoi)
+    return estimate if estimate is not None else (value, None)
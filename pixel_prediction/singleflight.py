@@ -0,0 +1,58 @@
+"""Coalescing of concurrent identical calls.
+
+When many sessions ask for the same grid cell at once, only the first caller
+(the leader) runs the upstream request; the others wait for it and share its
+result or exception. Once the call returns, the key is released, so later
+callers start a fresh call (normally answered by the result cache).
+"""
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """At most one in-flight call per key; concurrent callers share its outcome."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0  # Calls actually run
+        self.shared = 0  # Callers answered by another caller's call
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                call.waiters += 1
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
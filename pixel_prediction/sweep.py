@@ -0,0 +1,164 @@
+"""Precompute the deforestation grid for the whole area of interest.
+
+Every 0.01° cell is sent to the /deforestation endpoint through a bounded
+worker pool and a rate limiter. Finished cells are appended to a checkpoint
+file, so an interrupted sweep resumes where it stopped. The result is a
+float32 array (NaN where the service has no data) plus a JSON header listing
+the failed cells as unknown, see grid.save_grid.
+
+    python -m pixel_prediction.sweep --output data/grid --workers 8 --rate 10
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import requests
+
+from .api import APIError, NoDataError, configured_api_url, fetch_deforestation
+from .client import DeforestationClient
+from .grid import GRID_STEP, LATITUDE_RANGE, LONGITUDE_RANGE, Grid, grid_paths, save_grid
+
+
+class RateLimiter:
+    """Token bucket shared by the worker threads (rate in requests per second)."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def try_acquire(self):
+        # Take a token without waiting; False when the bucket is empty
+        if not self.rate:
+            return True
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+def read_checkpoint(path, grid):
+    # {(row, col): value} for cells already answered (value None means no data)
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Torn last line from an interrupted run
+            index = grid.index(record["latitude"], record["longitude"])
+            if index is not None:
+                done[index] = record["value"]
+    return done
+
+
+def sweep(grid, api_url, output, workers=8, rate=10.0, log=print):
+    array_path, _ = grid_paths(output)
+    checkpoint_path = array_path + ".checkpoint.jsonl"
+    if os.path.dirname(checkpoint_path):
+        os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+
+    done = read_checkpoint(checkpoint_path, grid)
+    pending = [cell for cell in grid.cells() if (cell[0], cell[1]) not in done]
+    log(f"{len(done)} of {grid.size} cells already in checkpoint, {len(pending)} to fetch")
+
+    client = DeforestationClient(pool_size=workers)
+    limiter = RateLimiter(rate, burst=workers)
+
+    def fetch(latitude, longitude):
+        limiter.acquire()
+        try:
+            return fetch_deforestation(api_url, latitude, longitude, client=client)
+        except NoDataError:
+            return None
+
+    failed = 0
+    started = time.monotonic()
+    with open(checkpoint_path, "a") as checkpoint, ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fetch, lat, lon): (row, col, lat, lon) for row, col, lat, lon in pending}
+        try:
+            for count, future in enumerate(as_completed(futures), 1):
+                row, col, latitude, longitude = futures[future]
+                try:
+                    value = future.result()
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    failed += 1
+                    reason = f"HTTP {e.status_code}" if isinstance(e, APIError) else e
+                    log(f"Cell {latitude}, {longitude} failed: {reason}")
+                    continue
+                done[(row, col)] = value
+                checkpoint.write(json.dumps({"latitude": latitude, "longitude": longitude, "value": value}) + "\n")
+                checkpoint.flush()
+                if count % 100 == 0:
+                    elapsed = time.monotonic() - started
+                    log(f"{count}/{len(pending)} cells in {elapsed:.0f}s ({count / elapsed:.1f}/s)")
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            log("Interrupted, progress is kept in the checkpoint")
+            raise
+    client.close()
+
+    values = np.full(grid.shape, np.nan, dtype=np.float32)
+    unknown = np.ones(grid.shape, dtype=bool)
+    for (row, col), value in done.items():
+        unknown[row, col] = False
+        if value is not None:
+            values[row, col] = value
+    save_grid(
+        output,
+        values,
+        grid,
+        unknown=unknown,
+        api_url=api_url,
+        created_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        failed_cells=failed,
+    )
+    log(f"Wrote {array_path} ({failed} cells failed and are stored as unknown; rerun to retry them)")
+    return values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute the deforestation grid for the area of interest.")
+    parser.add_argument("--output", default=os.path.join("data", "grid"), help="Grid file prefix (writes .npy and .json)")
+    parser.add_argument("--api-url", default=configured_api_url(), help="Defaults to $DEFORESTATION_API_URL")
+    parser.add_argument("--latitude-range", type=float, nargs=2, default=LATITUDE_RANGE, metavar=("MIN", "MAX"))
+    parser.add_argument("--longitude-range", type=float, nargs=2, default=LONGITUDE_RANGE, metavar=("MIN", "MAX"))
+    parser.add_argument("--step", type=float, default=GRID_STEP)
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent requests")
+    parser.add_argument("--rate", type=float, default=10.0, help="Requests per second (0 for unlimited)")
+    args = parser.parse_args(argv)
+
+    grid = Grid(args.latitude_range, args.longitude_range, args.step)
+    sweep(grid, args.api_url, args.output, workers=args.workers, rate=args.rate)
+
+
+if __name__ == "__main__":
+    main()
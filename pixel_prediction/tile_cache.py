@@ -0,0 +1,302 @@
+"""Local caching proxy for the base map tiles.
+
+Tiles of the public tile servers are kept in MBTiles files (SQLite, one per
+tile source) and served on a local XYZ URL, so browsers load the area of
+interest from the app's host instead of the public servers, and the maps
+keep working when those are slow or unreachable:
+
+    python -m pixel_prediction.tile_cache seed --source hot --zooms 9 15 --rate 2
+    python -m pixel_prediction.tile_cache serve --port 8765
+    DEFORESTATION_TILE_PROXY=http://127.0.0.1:8765 streamlit run app_satelite_01.py
+
+"seed" downloads every tile covering the area of interest at the given zoom
+levels, skipping tiles already stored, so it can be interrupted and resumed.
+"serve" answers from the store and, unless --offline, fetches missing tiles
+once, stores them and serves them from then on. The OpenStreetMap tile
+servers discourage bulk downloads; keep the seeding rate low.
+"""
+import argparse
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .grid import LATITUDE_RANGE, LONGITUDE_RANGE
+from .singleflight import SingleFlight
+
+DEFAULT_TILE_DIR = os.path.join(".cache", "tiles")
+TILE_PROXY_ENV = "DEFORESTATION_TILE_PROXY"  # Base URL of a running proxy, e.g. http://127.0.0.1:8765
+SEED_ZOOMS = (9, 15)  # Zoom levels seeded by default, inclusive
+FETCH_TIMEOUT = 10  # Seconds per upstream tile
+BROWSER_CACHE_SECONDS = 7 * 24 * 3600
+USER_AGENT = "pixel_prediction-tile-cache/1.0"
+
+# Upstream tile servers by source name; folium's "OpenStreetMap" is "osm"
+SOURCES = {
+    "osm": {
+        "url": "https://tile.openstreetmap.org/{z}/{x}/{y}.png",
+        "attribution": "&copy; OpenStreetMap contributors",
+    },
+    "hot": {
+        "url": "https://{s}.tile.openstreetmap.fr/hot/{z}/{x}/{y}.png",
+        "attribution": "&copy; OpenStreetMap contributors, tiles style by Humanitarian OpenStreetMap Team hosted by OpenStreetMap France",
+    },
+}
+SUBDOMAINS = "abc"
+TILE_PATH = re.compile(r"^/(\w+)/(\d+)/(\d+)/(\d+)\.png$")
+
+
+def tile_xy(latitude, longitude, zoom):
+    # (x, y) of the XYZ (slippy map) tile containing the point
+    n = 2 ** zoom
+    x = int((longitude + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def aoi_tiles(zooms, latitude_range=LATITUDE_RANGE, longitude_range=LONGITUDE_RANGE):
+    # Every (zoom, x, y) tile covering the area at the given zoom levels
+    for zoom in zooms:
+        x_min, y_min = tile_xy(latitude_range[1], longitude_range[0], zoom)  # North-west corner
+        x_max, y_max = tile_xy(latitude_range[0], longitude_range[1], zoom)  # South-east corner
+        for x in range(x_min, x_max + 1):
+            for y in range(y_min, y_max + 1):
+                yield zoom, x, y
+
+
+def proxied_tiles(tiles, attr=None, proxy=None):
+    """(tiles, attr) for folium.Map, pointing a known tile source at the local proxy.
+
+    Unchanged when no proxy is configured ($DEFORESTATION_TILE_PROXY) or the
+    tiles aren't from a source in SOURCES.
+    """
+    proxy = proxy or os.environ.get(TILE_PROXY_ENV)
+    known = {"OpenStreetMap": "osm", **{source["url"]: name for name, source in SOURCES.items()}}
+    if not proxy or tiles not in known:
+        return tiles, attr
+    source = known[tiles]
+    return f"{proxy.rstrip('/')}/{source}/{{z}}/{{x}}/{{y}}.png", SOURCES[source]["attribution"]
+
+
+class TileStore:
+    """PNG tiles of one source in an MBTiles file (rows in TMS order, as the format requires)."""
+
+    def __init__(self, path, name="", layer_type="baselayer"):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tiles (
+                zoom_level INTEGER NOT NULL,
+                tile_column INTEGER NOT NULL,
+                tile_row INTEGER NOT NULL,
+                tile_data BLOB NOT NULL,
+                PRIMARY KEY (zoom_level, tile_column, tile_row)
+            )
+            """
+        )
+        self._db.executemany(
+            "INSERT OR IGNORE INTO metadata (name, value) VALUES (?, ?)",
+            [("name", name), ("format", "png"), ("type", layer_type)],
+        )
+        self._db.commit()
+
+    def get(self, zoom, x, y):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (zoom, x, 2 ** zoom - 1 - y),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, zoom, x, y, data):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+                (zoom, x, 2 ** zoom - 1 - y, sqlite3.Binary(data)),
+            )
+            self._db.commit()
+
+    def put_many(self, tiles):
+        # Store (zoom, x, y, data) tiles in one transaction
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+                [(zoom, x, 2 ** zoom - 1 - y, sqlite3.Binary(data)) for zoom, x, y, data in tiles],
+            )
+            self._db.commit()
+
+    def set_metadata(self, **values):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+                [(name, str(value)) for name, value in values.items()],
+            )
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM tiles")
+            self._db.commit()
+
+    def stored(self, zoom):
+        # (x, y) of every stored tile at the zoom level
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT tile_column, tile_row FROM tiles WHERE zoom_level = ?", (zoom,)
+            ).fetchall()
+        return {(x, 2 ** zoom - 1 - row) for x, row in rows}
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+
+class TileCache:
+    """Tile stores of every source in a directory, filled from the upstream servers on request."""
+
+    def __init__(self, directory=DEFAULT_TILE_DIR, fill_on_miss=True):
+        import requests  # Imported here: the apps import this module for proxied_tiles only
+
+        self.directory = directory
+        self.fill_on_miss = fill_on_miss
+        self.stores = {name: TileStore(os.path.join(directory, f"{name}.mbtiles"), name) for name in SOURCES}
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        self.flights = SingleFlight()  # One upstream fetch per tile at a time
+
+    def get(self, source, zoom, x, y):
+        # PNG bytes of the tile, or None when it isn't stored and can't be fetched
+        data = self.stores[source].get(zoom, x, y)
+        if data is None and self.fill_on_miss:
+            data = self.flights.do((source, zoom, x, y), self.fetch, source, zoom, x, y)
+        return data
+
+    def fetch(self, source, zoom, x, y):
+        # Download the tile from the source and store it
+        url = SOURCES[source]["url"].format(s=SUBDOMAINS[(x + y) % len(SUBDOMAINS)], z=zoom, x=x, y=y)
+        response = self.session.get(url, timeout=FETCH_TIMEOUT)
+        response.raise_for_status()
+        self.stores[source].put(zoom, x, y, response.content)
+        return response.content
+
+
+def make_handler(cache, cache_seconds=BROWSER_CACHE_SECONDS):
+    # Request handler serving cache.get(source, z, x, y) for every source in cache.stores
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            import requests
+
+            match = TILE_PATH.match(self.path.split("?")[0])
+            if match is None or match.group(1) not in cache.stores:
+                self._send(404, b"Not Found", "text/plain")
+                return
+            source, zoom, x, y = match.group(1), *map(int, match.groups()[1:])
+            try:
+                data = cache.get(source, zoom, x, y)
+            except requests.exceptions.RequestException as e:
+                self._send(502, str(e).encode(), "text/plain")
+                return
+            if data is None:
+                self._send(404, b"Tile not cached", "text/plain")
+            else:
+                self._send(200, data, "image/png")
+
+        def _send(self, status, data, content_type):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Access-Control-Allow-Origin", "*")
+            if status == 200:
+                self.send_header("Cache-Control", f"public, max-age={cache_seconds}")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8765, directory=DEFAULT_TILE_DIR, fill_on_miss=True):
+    """Start the tile proxy in a background thread and return it (call shutdown() to stop)."""
+    server = ThreadingHTTPServer((host, port), make_handler(TileCache(directory, fill_on_miss)))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="tile-cache", daemon=True).start()
+    return server
+
+
+def seed(source, zooms, directory=DEFAULT_TILE_DIR, rate=2, workers=4):
+    # Download the missing tiles of the area of interest; returns (fetched, failed)
+    from .sweep import RateLimiter  # Imported here: the apps import this module for proxied_tiles
+
+    cache = TileCache(directory)
+    store = cache.stores[source]
+    stored = {zoom: store.stored(zoom) for zoom in zooms}
+    todo = [(zoom, x, y) for zoom, x, y in aoi_tiles(zooms) if (x, y) not in stored[zoom]]
+    print(f"{source}: {len(todo)} tiles to fetch, {sum(map(len, stored.values()))} already stored")
+
+    limiter = RateLimiter(rate)
+    fetched, failed = 0, 0
+
+    def fetch(tile):
+        limiter.acquire()
+        cache.fetch(source, *tile)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(fetch, tile) for tile in todo]
+        for future in as_completed(futures):
+            if future.exception() is None:
+                fetched += 1
+            else:
+                failed += 1
+            if (fetched + failed) % 100 == 0:
+                print(f"{fetched + failed}/{len(todo)} tiles ({failed} failed)")
+    return fetched, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed and serve a local cache of the base map tiles.")
+    parser.add_argument("--dir", default=DEFAULT_TILE_DIR, help="Directory of the MBTiles files")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="Download the tiles covering the area of interest")
+    seed_parser.add_argument("--source", choices=sorted(SOURCES), default="osm")
+    seed_parser.add_argument("--zooms", type=int, nargs=2, default=SEED_ZOOMS, metavar=("MIN", "MAX"))
+    seed_parser.add_argument("--rate", type=float, default=2, help="Tile requests per second")
+    seed_parser.add_argument("--workers", type=int, default=4)
+
+    serve_parser = commands.add_parser("serve", help="Serve the cached tiles on a local XYZ URL")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--offline", action="store_true", help="Never fetch missing tiles upstream")
+    args = parser.parse_args(argv)
+
+    if args.command == "seed":
+        fetched, failed = seed(args.source, range(args.zooms[0], args.zooms[1] + 1), args.dir, args.rate, args.workers)
+        print(f"Fetched {fetched} tiles, {failed} failed")
+        return
+
+    server = serve(args.host, args.port, args.dir, fill_on_miss=not args.offline)
+    url = f"http://{args.host}:{server.server_port}"
+    print(f"Tile cache on {url}/{{source}}/{{z}}/{{x}}/{{y}}.png ({', '.join(SOURCES)})")
+    print(f"Point the apps at it with {TILE_PROXY_ENV}={url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from pixel_prediction.aoi import AOI, AOIRegistry, default_registry, load_registry
+from pixel_prediction.grid import LATITUDE_RANGE, LONGITUDE_RANGE
+
+
+def write_config(tmp_path, config):
+    path = tmp_path / "areas.json"
+    path.write_text(json.dumps(config))
+    return str(path)
+
+
+def test_find_matches_the_containing_area():
+    registry = AOIRegistry([
+        AOI("north", (1.0, 2.0), (10.0, 11.0)),
+        AOI("south", (-2.0, -1.0), (10.0, 11.0)),
+    ])
+    assert registry.find(1.5, 10.5).name == "north"
+    assert registry.find(-1.5, 10.5).name == "south"
+    assert registry.find(0.0, 10.5) is None
+    assert registry.find(1.5, 12.0) is None
+
+
+def test_find_prefers_the_smallest_overlapping_area():
+    registry = AOIRegistry([AOI("large", (0.0, 3.0), (0.0, 3.0)), AOI("small", (1.0, 1.2), (1.0, 1.2))])
+    assert registry.find(1.1, 1.1).name == "small"
+    assert registry.find(2.5, 2.5).name == "large"
+
+
+def test_find_across_bucket_edges():
+    # An area spanning several buckets is found from each of them, edges included
+    registry = AOIRegistry([AOI("wide", (-0.5, 2.5), (-1.5, 0.5))], bucket_degrees=1.0)
+    for point in [(-0.5, -1.5), (2.5, 0.5), (0.0, 0.0), (1.99, -1.01)]:
+        assert registry.find(*point).name == "wide"
+    assert registry.find(2.51, 0.0) is None
+
+
+def test_registry_bounds_and_names():
+    registry = AOIRegistry([AOI("a", (0.0, 1.0), (5.0, 6.0)), AOI("b", (-3.0, -2.0), (7.0, 8.0))])
+    assert registry.bounds() == ((-3.0, 1.0), (5.0, 8.0))
+    assert registry.get("b").name == "b"
+    assert len(registry) == 2
+    with pytest.raises(ValueError, match="Duplicate"):
+        AOIRegistry([AOI("a", (0.0, 1.0), (0.0, 1.0)), AOI("a", (2.0, 3.0), (2.0, 3.0))])
+
+
+def test_default_registry_is_the_default_area(monkeypatch):
+    monkeypatch.setenv("DEFORESTATION_GRID", "data/grid")
+    aoi = default_registry().find(-4.0, -55.0)
+    assert (aoi.latitude_range, aoi.longitude_range) == (LATITUDE_RANGE, LONGITUDE_RANGE)
+    assert aoi.api_url is None
+    assert aoi.grid_path == "data/grid"
+
+
+def test_load_registry(tmp_path, monkeypatch):
+    monkeypatch.setenv("DEFORESTATION_GRID", "data/grid")
+    registry = load_registry(write_config(tmp_path, {"areas": [
+        {"name": "first", "latitude_range": [0, 1], "longitude_range": [0, 1]},
+        {"name": "second", "label": "Second", "latitude_range": [2, 3], "longitude_range": [2, 3],
+         "step": 0.05, "api_url": "http://localhost/deforestation", "grid": "other/grid"},
+        {"name": "third", "latitude_range": [4, 5], "longitude_range": [4, 5]},
+    ]}))
+    first, second, third = registry.get("first"), registry.get("second"), registry.get("third")
+    assert (first.label, first.step, first.grid_path) == ("first", 0.01, "data/grid")
+    assert (second.label, second.step, second.api_url, second.grid_path) == (
+        "Second", 0.05, "http://localhost/deforestation", "other/grid"
+    )
+    assert third.grid_path is None
+    assert second.grid().step == 0.05
+
+
+@pytest.mark.parametrize("config", [
+    [1, 2],
+    {"areas": {"name": "a"}},
+    {"areas": []},
+    {"areas": [1]},
+    {"areas": [{"name": "a"}]},
+    {"areas": [{"name": "a", "latitude_range": [1], "longitude_range": [0, 1]}]},
+    {"areas": [{"name": "a", "latitude_range": ["x", 1], "longitude_range": [0, 1]}]},
+    {"areas": [{"name": "a", "latitude_range": [1, 0], "longitude_range": [0, 1]}]},
+])
+def test_load_registry_rejects_invalid_configs(tmp_path, config):
+    with pytest.raises(ValueError):
+        load_registry(write_config(tmp_path, config))
@@ -0,0 +1,87 @@
+import pytest
+
+from pixel_prediction import api
+from pixel_prediction.api import (
+    APIError,
+    NoDataError,
+    get_deforestation,
+    lookup_deforestation,
+    parse_deforestation,
+)
+from pixel_prediction.cache import ResultCache
+from pixel_prediction.grid import MISS
+
+
+class Response:
+    def __init__(self, status_code, data=None, text=""):
+        self.status_code = status_code
+        self.data = data
+        self.text = text
+
+    def json(self):
+        if self.data is None:
+            raise ValueError("not JSON")
+        return self.data
+
+
+class Grid:
+    # Stands in for a GridLookup holding one cell
+    def __init__(self, cell, value):
+        self.cell, self.value = cell, value
+
+    def get(self, latitude, longitude):
+        return self.value if (latitude, longitude) == self.cell else MISS
+
+
+@pytest.fixture
+def requests_sent(monkeypatch):
+    sent = []
+
+    def fetch(api_url, latitude, longitude, client=None):
+        sent.append((latitude, longitude))
+        if latitude == 0:
+            raise NoDataError()
+        return -2.5
+
+    monkeypatch.setattr(api, "fetch_deforestation", fetch)
+    return sent
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(str(tmp_path / "results.sqlite3"), namespace="api")
+
+
+def test_parse_deforestation():
+    assert parse_deforestation(Response(200, {"deforestation_percentage": {"deforestation_percentage": 4.5}})) == 4.5
+    with pytest.raises(NoDataError):
+        parse_deforestation(Response(404))
+    with pytest.raises(APIError):
+        parse_deforestation(Response(500, text="oops"))
+    with pytest.raises(ValueError):
+        parse_deforestation(Response(200, {"unexpected": 1}))
+
+
+def test_lookup_sources(requests_sent, cache):
+    grid = Grid((-4.0, -55.0), 7.0)
+    assert lookup_deforestation("api", -4.001, -55.002, cache=cache, grid=grid) == (7.0, "grid")
+    assert lookup_deforestation("api", -3.9, -55.0, cache=cache, grid=grid) == (-2.5, "service")
+    assert lookup_deforestation("api", -3.9, -55.0, cache=cache, grid=grid) == (-2.5, "cache")
+    assert requests_sent == [(-3.9, -55.0)]
+
+
+def test_no_data_is_cached_with_its_source(requests_sent, cache):
+    with pytest.raises(NoDataError) as error:
+        get_deforestation("api", 0.001, -55.0, cache=cache)
+    assert error.value.source == "service"
+    with pytest.raises(NoDataError) as error:
+        get_deforestation("api", 0.0, -55.0, cache=cache)
+    assert error.value.source == "cache"
+    assert requests_sent == [(0.0, -55.0)]
+
+
+def test_lookup_snaps_to_the_step(requests_sent, tmp_path):
+    cache = ResultCache(str(tmp_path / "results.sqlite3"), namespace="api", step=0.05)
+    assert get_deforestation("api", -4.02, -55.01, cache=cache, step=0.05) == -2.5
+    assert get_deforestation("api", -3.99, -54.99, cache=cache, step=0.05) == -2.5  # Same 0.05° cell
+    assert requests_sent == [(-4.0, -55.0)]
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from pixel_prediction.area import aggregate, geometry_mask, missing_cells
+from pixel_prediction.grid import Grid
+
+GRID = Grid((0.0, 0.09), (10.0, 10.09))  # 10 x 10 cells
+
+
+def rectangle(south, west, north, east):
+    return [[west, south], [east, south], [east, north], [west, north], [west, south]]
+
+
+def test_rectangle_mask_uses_cell_centers():
+    mask = geometry_mask(GRID, {"type": "Polygon", "coordinates": [rectangle(0.015, 10.015, 0.045, 10.035)]})
+    rows, cols = np.nonzero(mask)
+    assert sorted(set(rows)) == [2, 3, 4]
+    assert sorted(set(cols)) == [2, 3]
+
+
+def test_holes_and_multipolygons():
+    outer, hole = rectangle(-0.005, 9.995, 0.095, 10.095), rectangle(0.035, 10.035, 0.055, 10.055)
+    mask = geometry_mask(GRID, {"type": "Polygon", "coordinates": [outer, hole]})
+    assert mask.sum() == 100 - 4
+    assert not mask[4, 4]
+    parts = geometry_mask(GRID, {"type": "MultiPolygon", "coordinates": [
+        [rectangle(-0.005, 9.995, 0.005, 10.005)], [rectangle(0.085, 10.085, 0.095, 10.095)],
+    ]})
+    assert np.argwhere(parts).tolist() == [[0, 0], [9, 9]]
+
+
+def test_unsupported_geometry():
+    with pytest.raises(ValueError):
+        geometry_mask(GRID, {"type": "Point", "coordinates": [10.0, 0.0]})
+
+
+def test_aggregate_known_cells_under_the_mask():
+    values = np.full(GRID.shape, np.nan, dtype=np.float32)
+    values[0, 0], values[0, 1], values[5, 5] = -10.0, 30.0, 99.0
+    mask = np.zeros(GRID.shape, dtype=bool)
+    mask[0, :3] = True
+    stats = aggregate(values, GRID, mask)
+    assert (stats["cells"], stats["known_cells"]) == (3, 2)
+    assert stats["mean"] == pytest.approx(10.0)  # Same latitude, so equal weights
+    assert (stats["min"], stats["max"]) == (-10.0, 30.0)
+    assert stats["histogram"]["cells"].sum() == 2
+    assert stats["no_data_cells"] == 0
+
+
+def test_aggregate_counts_no_data_cells_under_the_mask():
+    values = np.full(GRID.shape, np.nan, dtype=np.float32)
+    values[0, 0] = 5.0
+    no_data = np.zeros(GRID.shape, dtype=bool)
+    no_data[0, 1] = no_data[5, 5] = True
+    mask = np.zeros(GRID.shape, dtype=bool)
+    mask[0, :3] = True
+    stats = aggregate(values, GRID, mask, no_data=no_data)
+    assert (stats["cells"], stats["known_cells"], stats["no_data_cells"]) == (3, 1, 1)
+
+
+def test_aggregate_weights_cells_by_latitude():
+    grid = Grid((0.0, 60.0), (0.0, 0.0), step=60.0)
+    values = np.array([[0.0], [100.0]], dtype=np.float32)
+    stats = aggregate(values, grid, np.ones(grid.shape, dtype=bool))
+    assert stats["mean"] == pytest.approx(100.0 * 0.5 / 1.5)  # cos(60°) = 0.5
+
+
+def test_aggregate_without_known_cells():
+    stats = aggregate(np.full(GRID.shape, np.nan), GRID, np.ones(GRID.shape, dtype=bool))
+    assert (stats["mean"], stats["min"], stats["max"], stats["known_cells"]) == (None, None, None, 0)
+
+
+def test_missing_cells_rows():
+    mask = np.zeros(GRID.shape, dtype=bool)
+    mask[1, 2] = True
+    cells = missing_cells(GRID, mask)
+    assert cells.to_dict("records") == [
+        {"lat_cell": 1, "lon_cell": 1002, "cell_latitude": 0.01, "cell_longitude": 10.02}
+    ]
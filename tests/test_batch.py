@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from pixel_prediction.batch import INVALID, OUTSIDE, VALID, read_points, unique_cells, validate_points
+
+
+def geojson(document):
+    return json.dumps(document).encode()
+
+
+def test_read_csv_finds_coordinate_columns():
+    points = read_points("points.csv", b"id,Lat, lng\n1,-4.0,-55.0\n2,-3.5,-54.6\n")
+    assert list(points["latitude"]) == [-4.0, -3.5]
+    assert list(points["longitude"]) == [-55.0, -54.6]
+
+
+def test_read_csv_without_coordinates():
+    with pytest.raises(ValueError, match="latitude and a longitude"):
+        read_points("points.csv", b"a,b\n1,2\n")
+
+
+def test_read_geojson_points_and_multipoints():
+    points = read_points("points.geojson", geojson({
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "properties": {"id": 1}, "geometry": {"type": "Point", "coordinates": [-55.0, -4.0]}},
+            {"type": "Feature", "geometry": {"type": "MultiPoint", "coordinates": [[-54.9, -3.9], [-54.8, -3.8]]}},
+            {"type": "Feature", "geometry": {"type": "LineString", "coordinates": [[0, 0], [1, 1]]}},
+        ],
+    }))
+    assert list(points["latitude"]) == [-4.0, -3.9, -3.8]
+    assert list(points["longitude"]) == [-55.0, -54.9, -54.8]
+    assert points["id"].iloc[0] == 1
+
+
+@pytest.mark.parametrize("data", [
+    b"[1, 2]",
+    b'"points"',
+    geojson({"type": "FeatureCollection", "features": {"type": "Feature"}}),
+    geojson({"type": "FeatureCollection", "features": [1, 2]}),
+    geojson({"type": "FeatureCollection", "features": [{"type": "Feature", "geometry": [-55.0, -4.0]}]}),
+    geojson({"type": "Feature", "properties": ["id"], "geometry": {"type": "Point", "coordinates": [-55.0, -4.0]}}),
+    geojson({"type": "MultiPoint", "coordinates": 5}),
+    b"{not json",
+])
+def test_read_malformed_geojson(data):
+    with pytest.raises(ValueError):
+        read_points("points.geojson", data)
+
+
+def test_read_geojson_without_points():
+    with pytest.raises(ValueError, match="no Point"):
+        read_points("points.json", geojson({"type": "LineString", "coordinates": [[0, 0], [1, 1]]}))
+
+
+def test_validate_points_and_unique_cells():
+    points = read_points("points.csv", b"latitude,longitude\n-4.001,-55.0\n-3.999,-55.001\n10,10\nx,-55\n")
+    points = validate_points(points)
+    assert list(points["status"]) == [VALID, VALID, OUTSIDE, INVALID]
+    cells = unique_cells(points)
+    assert len(cells) == 1
+    assert (cells["cell_latitude"].iloc[0], cells["cell_longitude"].iloc[0]) == (-4.0, -55.0)
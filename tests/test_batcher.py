@@ -0,0 +1,117 @@
+import threading
+
+import pytest
+
+from pixel_prediction import batcher as batcher_module
+from pixel_prediction.api import APIError, BatchUnsupportedError, NoDataError, parse_deforestation_batch
+from pixel_prediction.batcher import MicroBatcher
+
+
+class FakeService:
+    """Stands in for the service calls of the batcher, answering latitude + longitude."""
+
+    def __init__(self, batch=True):
+        self.batch = batch
+        self.batches = []
+        self.singles = []
+        self.lock = threading.Lock()
+
+    def fetch_batch(self, api_url, points, client=None):
+        if not self.batch:
+            raise BatchUnsupportedError(404)
+        with self.lock:
+            self.batches.append(list(points))
+        return [NoDataError() if latitude == 0 else latitude + longitude for latitude, longitude in points]
+
+    def fetch(self, api_url, latitude, longitude, client=None):
+        with self.lock:
+            self.singles.append((latitude, longitude))
+        if latitude == 0:
+            raise NoDataError()
+        return latitude + longitude
+
+
+class Response:
+    def __init__(self, status_code, data=None, text=""):
+        self.status_code = status_code
+        self.data = data
+        self.text = text
+
+    def json(self):
+        if self.data is None:
+            raise ValueError("not JSON")
+        return self.data
+
+
+@pytest.fixture
+def service(monkeypatch):
+    service = FakeService()
+    monkeypatch.setattr(batcher_module, "fetch_deforestation_batch", service.fetch_batch)
+    monkeypatch.setattr(batcher_module, "fetch_deforestation", service.fetch)
+    return service
+
+
+def submit_all(batcher, points):
+    return [batcher.submit(latitude, longitude) for latitude, longitude in points]
+
+
+def test_lookups_within_the_window_share_a_batch(service):
+    batcher = MicroBatcher("http://api", window=0.2, max_batch=10)
+    futures = submit_all(batcher, [(1, 2), (3, 4), (0, 5)])
+    assert [f.result(5) for f in futures[:2]] == [3, 7]
+    with pytest.raises(NoDataError):
+        futures[2].result(5)  # Per-point errors go to their own lookup
+    assert service.batches == [[(1, 2), (3, 4), (0, 5)]]
+    assert (batcher.supported, batcher.batches, batcher.points) == (True, 1, 3)
+
+
+def test_batches_are_capped(service):
+    batcher = MicroBatcher("http://api", window=0.2, max_batch=2)
+    futures = submit_all(batcher, [(i, 0.5) for i in range(1, 6)])
+    assert [f.result(5) for f in futures] == [i + 0.5 for i in range(1, 6)]
+    assert max(len(batch) for batch in service.batches) == 2
+    assert sum(len(batch) for batch in service.batches) == 5
+
+
+def test_falls_back_to_single_requests(service):
+    service.batch = False
+    batcher = MicroBatcher("http://api", window=0.05)
+    assert [f.result(5) for f in submit_all(batcher, [(1, 1), (2, 2)])] == [2, 4]
+    assert batcher.supported is False
+    assert batcher.fetch(3, 3) == 6  # Later lookups skip the batch endpoint
+    assert sorted(service.singles) == [(1, 1), (2, 2), (3, 3)]
+
+
+def test_failed_batch_fails_every_lookup(service, monkeypatch):
+    def unavailable(api_url, points, client=None):
+        raise ConnectionError("down")
+
+    monkeypatch.setattr(batcher_module, "fetch_deforestation_batch", unavailable)
+    batcher = MicroBatcher("http://api", window=0.05)
+    for future in submit_all(batcher, [(1, 1), (2, 2)]):
+        with pytest.raises(ConnectionError):
+            future.result(5)
+    assert batcher.supported is None
+
+
+def test_cancelled_lookups_are_not_sent(service):
+    batcher = MicroBatcher("http://api", window=0.2)
+    kept, cancelled = submit_all(batcher, [(1, 1), (2, 2)])
+    assert cancelled.cancel()
+    assert kept.result(5) == 2
+    assert service.batches == [[(1, 1)]]
+
+
+def test_parse_deforestation_batch():
+    results = parse_deforestation_batch(Response(200, {"results": [
+        {"status": 200, "deforestation_percentage": {"deforestation_percentage": 1.5}},
+        {"status": 404},
+        {"status": 429, "detail": "slow down"},
+    ]}), 3)
+    assert results[0] == 1.5
+    assert isinstance(results[1], NoDataError)
+    assert isinstance(results[2], APIError) and results[2].status_code == 429
+    with pytest.raises(BatchUnsupportedError):
+        parse_deforestation_batch(Response(404), 1)
+    with pytest.raises(ValueError):
+        parse_deforestation_batch(Response(200, {"results": []}), 1)
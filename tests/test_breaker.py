@@ -0,0 +1,87 @@
+import pytest
+
+from pixel_prediction import breaker as breaker_module
+from pixel_prediction.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(breaker_module.time, "monotonic", clock)
+    return clock
+
+
+def fail(breaker, times=1):
+    for _ in range(times):
+        breaker.record(breaker.before_call(), False, 0.1, "HTTP 503")
+
+
+def test_opens_on_the_error_rate(clock):
+    breaker = CircuitBreaker(min_calls=4, failure_rate=0.5, open_seconds=30)
+    breaker.record(breaker.before_call(), True, 0.1)
+    breaker.record(breaker.before_call(), True, 0.1)
+    fail(breaker)
+    assert breaker.state == CLOSED  # Below min_calls
+    fail(breaker)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_call()
+    assert error.value.retry_in == pytest.approx(30)
+    assert breaker.snapshot()["rejected"] == 1
+
+
+def test_half_open_admits_one_probe(clock):
+    breaker = CircuitBreaker(min_calls=1, open_seconds=30, half_open_probes=1)
+    fail(breaker)
+    clock.now += 31
+    probe = breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record(probe, True, 0.1)
+    assert breaker.state == CLOSED
+    breaker.record(breaker.before_call(), True, 0.1)
+
+
+def test_failed_probe_opens_again(clock):
+    breaker = CircuitBreaker(min_calls=1, open_seconds=30)
+    fail(breaker)
+    clock.now += 31
+    breaker.record(breaker.before_call(), False, 0.1, "timeout")
+    assert breaker.state == OPEN
+    assert breaker.times_opened == 2
+    assert breaker.snapshot()["last_error"] == "timeout"
+
+
+def test_results_of_earlier_states_are_ignored(clock):
+    breaker = CircuitBreaker(min_calls=1, open_seconds=30, half_open_probes=1)
+    slow = breaker.before_call()  # Sent while closed, answers after the breaker opened
+    fail(breaker)
+    clock.now += 31
+    probe = breaker.before_call()
+    breaker.record(slow, True, 40.0)
+    assert breaker.state == HALF_OPEN  # Not closed by a request that wasn't the probe
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # And the probe slot is still taken
+    breaker.record(probe, True, 0.1)
+    assert breaker.state == CLOSED
+
+
+def test_window_forgets_old_calls(clock):
+    breaker = CircuitBreaker(min_calls=3, failure_rate=0.5, window_seconds=60)
+    fail(breaker, 2)
+    clock.now += 61
+    breaker.record(breaker.before_call(), True, 0.1)
+    fail(breaker)
+    assert breaker.state == CLOSED  # Only 2 calls in the window, the old failures are gone
+    snapshot = breaker.snapshot()
+    assert snapshot["window_calls"] == 2
+    assert snapshot["error_rate"] == 0.5
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from pixel_prediction import cache as cache_module
+from pixel_prediction.cache import ResultCache
+from pixel_prediction.grid import MISS, Grid
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "results.sqlite3")
+
+
+def test_get_set_by_snapped_cell(path, clock):
+    cache = ResultCache(path, namespace="api")
+    assert cache.get(-4.0, -55.0) is MISS
+    cache.set(-4.001, -55.004, 12.5)
+    assert cache.get(-3.996, -54.995) == 12.5
+    cache.set(-3.9, -55.0, None)  # No data is stored too
+    assert cache.get(-3.9, -55.0) is None
+
+
+def test_namespaces_and_persistence(path, clock):
+    ResultCache(path, namespace="a").set(-4.0, -55.0, 1.0)
+    assert ResultCache(path, namespace="a").get(-4.0, -55.0) == 1.0  # From SQLite, across instances
+    assert ResultCache(path, namespace="b").get(-4.0, -55.0) is MISS
+
+
+def test_ttl_expiry_and_peek(path, clock):
+    cache = ResultCache(path, namespace="api", ttl=100, stale_after=10)
+    cache.set(-4.0, -55.0, 5.0)
+    clock.now += 5
+    assert not cache.needs_refresh(-4.0, -55.0)
+    clock.now += 10
+    assert cache.needs_refresh(-4.0, -55.0)
+    assert cache.get(-4.0, -55.0) == 5.0  # Stale but still valid
+    clock.now += 100
+    assert cache.get(-4.0, -55.0) is MISS
+    value, fetched_at = cache.peek(-4.0, -55.0)  # Expired results stay visible to peek
+    assert value == 5.0 and fetched_at == clock.now - 115
+
+
+def test_memory_lru_falls_back_to_sqlite(path, clock):
+    cache = ResultCache(path, namespace="api", memory_entries=2)
+    for i in range(3):
+        cache.set(-4.0 + i * 0.01, -55.0, float(i))
+    assert len(cache._memory) == 2
+    assert cache.get(-4.0, -55.0) == 0.0  # Evicted from memory, read back from SQLite
+    assert list(cache._memory)[-1] == (-400, -5500)
+
+
+def test_size_cap_keeps_the_newest(path, clock, monkeypatch):
+    monkeypatch.setattr(cache_module, "TRIM_EVERY", 1)
+    cache = ResultCache(path, namespace="api", max_entries=2, memory_entries=1)
+    for i in range(4):
+        clock.now += 1
+        cache.set(-4.0 + i * 0.01, -55.0, float(i))
+    fresh = ResultCache(path, namespace="api")
+    assert [fresh.get(-4.0 + i * 0.01, -55.0) for i in range(4)] == [MISS, MISS, 2.0, 3.0]
+
+
+def test_to_array_and_version(path, clock):
+    grid = Grid((-4.02, -4.0), (-55.01, -55.0))
+    cache = ResultCache(path, namespace="api")
+    empty_version = cache.version()
+    cache.set(-4.0, -55.0, 7.0)
+    cache.set(-4.02, -55.01, None)
+    cache.set(-3.0, -55.0, 9.0)  # Outside the grid
+    assert cache.version() != empty_version
+    values = cache.to_array(grid)
+    assert values.shape == grid.shape
+    assert values[grid.index(-4.0, -55.0)] == 7.0
+    assert np.isnan(values).sum() == values.size - 1
+
+    # The "no data" result is stored, so it is known without a value
+    values, stored = cache.to_arrays(grid)
+    assert values[grid.index(-4.0, -55.0)] == 7.0
+    assert stored[grid.index(-4.0, -55.0)] and stored[grid.index(-4.02, -55.01)]
+    assert stored.sum() == 2 and np.isnan(values[grid.index(-4.02, -55.01)])
+
+
+def test_step_keys_and_namespace(path, clock):
+    coarse = ResultCache(path, namespace="api", step=0.05)
+    coarse.set(-4.02, -55.01, 3.0)
+    assert coarse.get(-3.98, -54.99) == 3.0  # Same 0.05° cell
+    assert ResultCache(path, namespace="api").get(-4.0, -55.0) is MISS
@@ -0,0 +1,47 @@
+import numpy as np
+
+from pixel_prediction.grid import Grid
+from pixel_prediction.pyramid import Level, block_reduce, grid_pyramid, level_factor
+
+
+def test_block_reduce_ignores_unknown_cells():
+    values = np.array([
+        [1.0, 3.0, np.nan],
+        [np.nan, 5.0, 7.0],
+        [np.nan, np.nan, np.nan],
+    ])
+    mean, minimum, maximum, count = block_reduce(values, 2)
+    assert mean.shape == (2, 2)  # Padded to whole blocks
+    assert mean[0, 0] == 3.0 and minimum[0, 0] == 1.0 and maximum[0, 0] == 5.0 and count[0, 0] == 3
+    assert mean[0, 1] == 7.0 and count[0, 1] == 1
+    assert np.isnan(mean[1, 0]) and np.isnan(minimum[1, 0]) and np.isnan(maximum[1, 0]) and count[1, 0] == 0
+
+
+def test_factor_one_is_the_grid():
+    values = np.array([[1.0, np.nan], [2.0, 3.0]])
+    mean, _, _, count = block_reduce(values, 1)
+    np.testing.assert_array_equal(mean, values)
+    np.testing.assert_array_equal(count, [[1, 0], [1, 1]])
+
+
+def test_level_stats_and_bounds():
+    grid = Grid((0.0, 0.04), (0.0, 0.04))  # 5 x 5 cells
+    values = np.arange(25, dtype=np.float64).reshape(5, 5)
+    level = Level(grid, 2, values)
+    assert level.step == 0.02
+    assert level.stats(0.01, 0.01) == {"mean": 3.0, "min": 0.0, "max": 6.0, "count": 4}
+    assert level.stats(0.04, 0.04)["count"] == 1  # Partial block at the edge
+    assert level.stats(1.0, 1.0) is None
+    (south, west), (north, east) = level.bounds()
+    assert north - south == 3 * 0.02 and east - west == 3 * 0.02
+
+
+def test_grid_pyramid_levels():
+    grid = Grid((0.0, 0.15), (0.0, 0.15))
+    levels = grid_pyramid(np.ones(grid.shape), grid)
+    assert [level.factor for level in levels] == [1, 2, 4, 8]
+    assert [level.mean.shape for level in levels] == [(16, 16), (8, 8), (4, 4), (2, 2)]
+
+
+def test_level_factor_follows_the_zoom():
+    assert [level_factor(zoom) for zoom in (5, 7, 8, 9, 10, 14)] == [8, 8, 4, 2, 1, 1]
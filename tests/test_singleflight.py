@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+from pixel_prediction.singleflight import SingleFlight
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 42
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do("cell", fetch)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flights.do("cell", fetch))) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    wait_until(lambda: flights.shared == 4)  # Every follower is waiting on the leader's call
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert results == [42] * 5
+    assert len(calls) == 1
+    assert (flights.calls, flights.shared, flights.in_flight()) == (1, 4, 0)
+
+
+def test_error_is_shared_and_the_key_released():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    errors = []
+
+    def call():
+        try:
+            flights.do("cell", fail)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    wait_until(lambda: flights.shared == 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert len(errors) == 2 and errors[0] is errors[1]
+    assert flights.do("cell", lambda: "fresh") == "fresh"  # A new call once the failed one is done
+
+
+def test_different_keys_run_separately():
+    flights = SingleFlight()
+    assert flights.do("a", lambda: 1) == 1
+    assert flights.do("b", lambda: 2) == 2
+    assert flights.calls == 2
+    with pytest.raises(KeyError):
+        flights.do("c", lambda: {}["missing"])
+    assert flights.in_flight() == 0
@@ -0,0 +1,116 @@
+import json
+
+import numpy as np
+import pytest
+
+from pixel_prediction import sweep as sweep_module
+from pixel_prediction.grid import MISS, Grid, GridLookup, grid_paths, load_grid
+from pixel_prediction.mock_server import PROFILES, mock_value, serve
+from pixel_prediction.sweep import RateLimiter, read_checkpoint, sweep
+
+GRID = Grid((-4.0, -3.9), (-55.0, -54.9))
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+        self.slept = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sweep_module.time, "monotonic", clock)
+    monkeypatch.setattr(sweep_module.time, "sleep", clock.sleep)
+    return clock
+
+
+@pytest.fixture
+def mock_api():
+    servers = []
+
+    def start(**profile):
+        server = serve(port=0, profile=dict(PROFILES["instant"], **profile))
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}/deforestation"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def test_rate_limiter_allows_the_burst_then_waits(clock):
+    limiter = RateLimiter(rate=4, burst=2)
+    assert limiter.try_acquire()
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    limiter.acquire()
+    assert clock.slept == pytest.approx(0.25)
+    clock.now += 0.5
+    assert limiter.try_acquire()
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()  # The bucket never holds more than the burst
+
+
+def test_rate_limiter_without_rate_never_waits(clock):
+    limiter = RateLimiter(rate=0)
+    for _ in range(100):
+        limiter.acquire()
+        assert limiter.try_acquire()
+    assert clock.slept == 0
+
+
+def test_read_checkpoint_skips_a_torn_last_line(tmp_path):
+    path = tmp_path / "grid.npy.checkpoint.jsonl"
+    path.write_text(
+        json.dumps({"latitude": -4.0, "longitude": -55.0, "value": 12.5}) + "\n"
+        + json.dumps({"latitude": -3.99, "longitude": -55.0, "value": None}) + "\n"
+        + json.dumps({"latitude": 10.0, "longitude": 10.0, "value": 1.0}) + "\n"  # Outside the grid
+        + '{"latitude": -3.98, "longi'
+    )
+    assert read_checkpoint(str(path), GRID) == {(0, 0): 12.5, (1, 0): None}
+    assert read_checkpoint(str(tmp_path / "missing.jsonl"), GRID) == {}
+
+
+def test_sweep_resumes_and_retries_failed_cells(tmp_path, mock_api):
+    output = str(tmp_path / "grid")
+    first = []
+    sweep(GRID, mock_api(error_rate=0.2), output, workers=8, rate=0, log=first.append)
+    _, _, header = load_grid(output, mmap=False)
+    failed = header["failed_cells"]
+    assert failed > 0
+    assert first[0] == f"0 of {GRID.size} cells already in checkpoint, {GRID.size} to fetch"
+    assert sum(line.startswith("Cell ") for line in first) == failed
+
+    # Failed cells are unknown to the grid, cells without data are answered as such
+    lookup = GridLookup(output)
+    assert len(header["unknown_cells"]) == failed
+    for row, col, latitude, longitude in GRID.cells():
+        if [row, col] in header["unknown_cells"]:
+            assert lookup.get(latitude, longitude) is MISS
+        elif mock_value(latitude, longitude) is None:
+            assert lookup.get(latitude, longitude) is None
+        else:
+            assert lookup.get(latitude, longitude) == pytest.approx(mock_value(latitude, longitude), abs=1e-4)
+
+    second = []
+    values = sweep(GRID, mock_api(), output, workers=8, rate=0, log=second.append)
+    # Only the failed cells are fetched again
+    assert second[0] == f"{GRID.size - failed} of {GRID.size} cells already in checkpoint, {failed} to fetch"
+    _, _, header = load_grid(output, mmap=False)
+    assert (header["failed_cells"], header["unknown_cells"]) == (0, [])
+
+    expected = np.full(GRID.shape, np.nan, dtype=np.float32)
+    for row, col, latitude, longitude in GRID.cells():
+        value = mock_value(latitude, longitude)
+        if value is not None:
+            expected[row, col] = value
+    np.testing.assert_array_equal(values, expected)
+    assert len(read_checkpoint(grid_paths(output)[0] + ".checkpoint.jsonl", GRID)) == GRID.size